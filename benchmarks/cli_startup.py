@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+import argparse
+import subprocess
+import sys
+import time
+
+"""
+cli_startup
+~~~~~~~~~~~~~~~
+:Description: Startup time of the genotype_variants console script
+"""
+"""
+Description: Runs genotype_variants with options that only start it, such as --help and
+    --version, in new Python processes and reports the fastest of a few runs of each. Exits
+    with status 1 when --help takes longer than the threshold, so it can be run in CI.
+
+    python benchmarks/cli_startup.py --threshold 0.5
+"""
+# command lines timed, the first one is checked against the threshold
+COMMANDS = [
+    ["--help"],
+    ["--version"],
+    ["small_variants", "--help"],
+    ["small_variants", "merge", "--help"],
+]
+
+
+def startup_seconds(args, repeat=5):
+    """Fastest wall clock time of running genotype_variants with args"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "genotype_variants.cli"] + args,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Startup time of the genotype_variants console script"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of runs of each command"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.5,
+        help="Seconds --help may take before the benchmark fails",
+    )
+    args = parser.parse_args()
+    print("%-45s %8s" % ("command", "seconds"))
+    results = []
+    for command in COMMANDS:
+        seconds = startup_seconds(command, args.repeat)
+        results.append(seconds)
+        print("%-45s %8.3f" % (" ".join(["genotype_variants"] + command), seconds))
+    if results[0] > args.threshold:
+        print(
+            "genotype_variants --help took %.3f seconds, more than the %.3f second threshold"
+            % (results[0], args.threshold)
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
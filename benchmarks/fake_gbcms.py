@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+from genotype_variants.maf_schema import MAF_COLUMNS
+
+"""
+fake_gbcms
+~~~~~~~~~~~~~~~
+:Description: Deterministic stand-in for GetBaseCountMultiSample
+"""
+"""
+Description: Accepts the command line genotype_variants builds for GetBaseCountMultiSample
+    and writes a MAF file with a record for each variant of the input MAF and each BAM file,
+    with pseudo-random counts that only depend on the BAM label and the variant. The BAM and
+    FASTA files are not read, they only need to exist. The cost of counting is simulated
+    from environment variables, so the scaling of genotype_variants can be measured without
+    BAM files or GetBaseCountMultiSample:
+
+    FAKE_GBCMS_STARTUP  seconds slept once, like loading the reference and BAM indexes
+    FAKE_GBCMS_SLEEP    seconds slept per variant and BAM file
+    FAKE_GBCMS_CPU      CPU seconds burnt per variant and BAM file
+    FAKE_GBCMS_MEMORY   bytes held per variant and BAM file until the output is written
+    FAKE_GBCMS_DEPTH    mean total count of a variant, default 500
+    FAKE_GBCMS_LOG      JSON lines file each run appends its start and end times to
+
+    FAKE_GBCMS_SLEEP=0.0001 genotype_variants small_variants all -g benchmarks/fake_gbcms.py ...
+"""
+# Variants counted between two checks of the simulated cost
+COST_BATCH = 1000
+
+
+def parse_args(argv):
+    """Parse the GetBaseCountMultiSample options genotype_variants uses"""
+    parser = argparse.ArgumentParser(
+        prog="GetBaseCountsMultiSample",
+        description="Deterministic stand-in for GetBaseCountMultiSample",
+    )
+    parser.add_argument("--bam", action="append", required=True)
+    parser.add_argument("--filter_duplicate", type=int, default=1)
+    parser.add_argument("--fragment_count", type=int, default=0)
+    parser.add_argument("--maf", required=True)
+    parser.add_argument("--maq", type=int, default=20)
+    parser.add_argument("--omaf", action="store_true")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--fasta", required=True)
+    parser.add_argument("--thread", type=int, default=1)
+    parser.add_argument("--generic_counting", action="store_true")
+    args = parser.parse_args(argv)
+    args.bam = [bam.split(":", 1) for bam in args.bam]
+    for path in [args.maf, args.fasta] + [bam for _, bam in args.bam]:
+        if not os.path.exists(path):
+            parser.error("%s does not exist" % path)
+    return args
+
+
+def cost_settings():
+    """Simulated cost of counting from the environment"""
+    return {
+        "startup": float(os.environ.get("FAKE_GBCMS_STARTUP", 0)),
+        "sleep": float(os.environ.get("FAKE_GBCMS_SLEEP", 0)),
+        "cpu": float(os.environ.get("FAKE_GBCMS_CPU", 0)),
+        "memory": int(float(os.environ.get("FAKE_GBCMS_MEMORY", 0))),
+        "depth": int(os.environ.get("FAKE_GBCMS_DEPTH", 500)),
+    }
+
+
+def spend(cost, variants):
+    """Sleep and burn CPU for a number of variants and BAM files"""
+    if cost["sleep"]:
+        time.sleep(cost["sleep"] * variants)
+    if cost["cpu"]:
+        end = time.process_time() + cost["cpu"] * variants
+        while time.process_time() < end:
+            pass
+
+
+def read_variants(input_maf):
+    """Records of a MAF file as dicts, comment lines skipped"""
+    with open(input_maf, newline="") as f:
+        lines = (line for line in f if not line.startswith("#"))
+        return list(csv.DictReader(lines, delimiter="\t"))
+
+
+def variant_counts(label, variant, depth):
+    """Pseudo-random counts of a variant in a BAM file, the same for the same
+    label and variant"""
+    key = "\t".join(
+        [label]
+        + [
+            variant.get(column, "")
+            for column in (
+                "Chromosome",
+                "Start_Position",
+                "End_Position",
+                "Reference_Allele",
+                "Tumor_Seq_Allele2",
+            )
+        ]
+    )
+    rng = random.Random(zlib.crc32(key.encode()))
+    total = max(1, int(rng.gauss(depth, depth / 5)))
+    alt = int(total * rng.random() ** 4 * 0.2)
+    ref = total - alt - int(total * rng.random() * 0.02)
+    forward = int(total * rng.uniform(0.4, 0.6))
+    fragment = int(total * rng.uniform(0.5, 0.8))
+    alt_fragment = min(int(alt * rng.uniform(0.5, 0.8)), fragment)
+    return {
+        "t_ref_count": ref,
+        "t_alt_count": alt,
+        "t_total_count": total,
+        "t_variant_frequency": "%.10g" % (alt / total),
+        "t_total_count_forward": forward,
+        "t_ref_count_forward": min(int(ref * forward / total), forward),
+        "t_alt_count_forward": int(alt * forward / total),
+        "t_total_count_fragment": fragment,
+        "t_ref_count_fragment": min(
+            int(ref * fragment / total), fragment - alt_fragment
+        ),
+        "t_alt_count_fragment": alt_fragment,
+    }
+
+
+def main(argv=None):
+    start = time.time()
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    cost = cost_settings()
+    time.sleep(cost["startup"])
+    variants = read_variants(args.maf)
+    held = bytearray(cost["memory"] * len(variants) * len(args.bam))
+    # touch every page so the memory is resident
+    held[::4096] = b"\x01" * len(held[::4096])
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(
+            f, MAF_COLUMNS, delimiter="\t", extrasaction="ignore", lineterminator="\n"
+        )
+        writer.writeheader()
+        for label, _ in args.bam:
+            for i, variant in enumerate(variants):
+                if i % COST_BATCH == 0:
+                    spend(cost, min(COST_BATCH, len(variants) - i))
+                record = dict(variant)
+                record["Tumor_Sample_Barcode"] = label
+                for column in ("n_ref_count", "n_alt_count", "Caller"):
+                    record[column] = ""
+                record.update(variant_counts(label, variant, cost["depth"]))
+                writer.writerow(record)
+    del held
+
+    log = os.environ.get("FAKE_GBCMS_LOG")
+    if log:
+        with open(log, "a") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "start": start,
+                        "end": time.time(),
+                        "pid": os.getpid(),
+                        "bams": len(args.bam),
+                        "variants": len(variants),
+                        "output": args.output,
+                    }
+                )
+                + "\n"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+import argparse
+import gc
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from genotype_variants import __version__
+from genotype_variants.commands.small_variants import write_csv
+from genotype_variants.create_all_maf_dataframe import create_all_maf_dataframe
+from genotype_variants.create_duplex_simplex_dataframe import (
+    create_duplex_simplex_dataframe,
+)
+from genotype_variants.generate_summary_field import (
+    generate_summary_field,
+    summary_fields,
+)
+from synthetic_maf import read_merge_inputs, write_synthetic_mafs
+
+"""
+merge_bench
+~~~~~~~~~~~~~~~
+:Description: Time and peak memory of the merge hot paths on synthetic MAF files
+"""
+"""
+Description: Writes seeded synthetic MAF files of each size, runs each benchmark on them and
+    reports the fastest of a few runs and the peak memory traced during one more run. The
+    results are written as JSON, and compared with a baseline to flag regressions.
+
+    python benchmarks/merge_bench.py run --sizes 1000 10000 100000 --output results.json
+    python benchmarks/merge_bench.py compare benchmarks/baseline.json results.json
+"""
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Ratios of the baseline a result may reach before it is a regression, and
+# differences that are too small to be one whatever their ratio
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+MIN_SECONDS = 0.01
+MIN_PEAK_MB = 1.0
+
+
+def summary_input(s_maf):
+    """Fragment counts and allele frequency of the simplex data frame, as
+    generate_summary_field expects them"""
+    df = s_maf[["t_ref_count_fragment", "t_alt_count_fragment"]].copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["t_vaf_fragment"] = df["t_alt_count_fragment"] / (
+            df["t_alt_count_fragment"] + df["t_ref_count_fragment"]
+        )
+    return df
+
+
+# Benchmarks, each returns the function timed for the merge inputs, none of
+# them change the inputs
+BENCHMARKS = {
+    "create_duplex_simplex_dataframe": lambda inputs, tmp: (
+        lambda: create_duplex_simplex_dataframe(inputs["SIMPLEX"], inputs["DUPLEX"])
+    ),
+    "create_duplex_simplex_dataframe[low_memory]": lambda inputs, tmp: (
+        lambda: create_duplex_simplex_dataframe(
+            inputs["SIMPLEX"], inputs["DUPLEX"], low_memory=True
+        )
+    ),
+    "create_all_maf_dataframe": lambda inputs, tmp: (
+        lambda: create_all_maf_dataframe(
+            inputs["ORIGINAL"], inputs["STANDARD"], inputs["SIMPLEX-DUPLEX"]
+        )
+    ),
+    "create_all_maf_dataframe[low_memory]": lambda inputs, tmp: (
+        lambda: create_all_maf_dataframe(
+            inputs["ORIGINAL"],
+            inputs["STANDARD"],
+            inputs["SIMPLEX-DUPLEX"],
+            low_memory=True,
+        )
+    ),
+    "generate_summary_field": lambda inputs, tmp: (
+        lambda: generate_summary_field(inputs["SUMMARY"])
+    ),
+    "summary_fields": lambda inputs, tmp: (lambda: summary_fields(inputs["MERGED"])),
+    "write_csv": lambda inputs, tmp: (
+        lambda: write_csv(pathlib.Path(tmp) / "merged.maf", inputs["MERGED"])
+    ),
+}
+
+
+def prepare_inputs(tmp, size, seed):
+    """Write and read the synthetic MAF files of one size, with the data
+    frames the later merge steps start from"""
+    paths = write_synthetic_mafs(pathlib.Path(tmp) / str(size), size, seed=seed)
+    inputs = dict(
+        zip(("ORIGINAL", "STANDARD", "DUPLEX", "SIMPLEX"), read_merge_inputs(paths))
+    )
+    inputs["SIMPLEX-DUPLEX"] = create_duplex_simplex_dataframe(
+        inputs["SIMPLEX"], inputs["DUPLEX"]
+    )
+    inputs["MERGED"] = create_all_maf_dataframe(
+        inputs["ORIGINAL"], inputs["STANDARD"], inputs["SIMPLEX-DUPLEX"]
+    )
+    inputs["SUMMARY"] = summary_input(inputs["SIMPLEX"])
+    return inputs
+
+
+def measure(function, repeat):
+    """Fastest of repeat runs in seconds, and peak memory in MB traced
+    during one more run"""
+    seconds = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 1e6
+
+
+def run_benchmarks(sizes, names, repeat, seed):
+    """Run the named benchmarks at each size, return the result records"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            inputs = prepare_inputs(tmp, size, seed)
+            for name in names:
+                seconds, peak_mb = measure(BENCHMARKS[name](inputs, tmp), repeat)
+                result = {
+                    "benchmark": name,
+                    "rows": size,
+                    "seconds": round(seconds, 6),
+                    "peak_mb": round(peak_mb, 3),
+                }
+                print(
+                    "%-45s %10d %10.4f %10.1f"
+                    % (name, size, result["seconds"], result["peak_mb"]),
+                    flush=True,
+                )
+                results.append(result)
+            del inputs
+    return results
+
+
+def environment(seed, repeat):
+    """Versions and machine the results were measured with"""
+    return {
+        "genotype_variants": __version__,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "seed": seed,
+        "repeat": repeat,
+    }
+
+
+def compare_results(
+    baseline,
+    current,
+    time_tolerance=TIME_TOLERANCE,
+    memory_tolerance=MEMORY_TOLERANCE,
+):
+    """Compare result records with baseline records of the same benchmark
+    and size.
+
+    Returns:
+        list: (benchmark, rows, baseline record or None, current record or
+            None, status) tuples, status is ok, slower, more memory, slower
+            and more memory, new or missing
+    """
+    baseline = {(result["benchmark"], result["rows"]): result for result in baseline}
+    current = {(result["benchmark"], result["rows"]): result for result in current}
+    rows = []
+    for name, size in sorted(set(baseline) | set(current)):
+        base, cur = baseline.get((name, size)), current.get((name, size))
+        if base is None or cur is None:
+            rows.append((name, size, base, cur, "new" if base is None else "missing"))
+            continue
+        regressions = []
+        if (
+            cur["seconds"] > base["seconds"] * (1 + time_tolerance)
+            and cur["seconds"] - base["seconds"] > MIN_SECONDS
+        ):
+            regressions.append("slower")
+        if (
+            cur["peak_mb"] > base["peak_mb"] * (1 + memory_tolerance)
+            and cur["peak_mb"] - base["peak_mb"] > MIN_PEAK_MB
+        ):
+            regressions.append("more memory")
+        rows.append((name, size, base, cur, " and ".join(regressions) or "ok"))
+    return rows
+
+
+def read_results(file_name):
+    with open(file_name) as f:
+        return json.load(f)["results"]
+
+
+def run_command(args):
+    names = args.benchmark or list(BENCHMARKS)
+    print("%-45s %10s %10s %10s" % ("benchmark", "rows", "seconds", "peak MB"))
+    results = run_benchmarks(args.sizes, names, args.repeat, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "environment": environment(args.seed, args.repeat),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+
+
+def compare_command(args):
+    rows = compare_results(
+        read_results(args.baseline),
+        read_results(args.current),
+        args.time_tolerance,
+        args.memory_tolerance,
+    )
+    print(
+        "%-45s %10s %10s %10s %10s %10s  %s"
+        % ("benchmark", "rows", "base s", "seconds", "base MB", "peak MB", "status")
+    )
+    for name, size, base, cur, status in rows:
+        values = [
+            "%.4f" % base["seconds"] if base else "-",
+            "%.4f" % cur["seconds"] if cur else "-",
+            "%.1f" % base["peak_mb"] if base else "-",
+            "%.1f" % cur["peak_mb"] if cur else "-",
+        ]
+        print(
+            "%-45s %10d %10s %10s %10s %10s  %s"
+            % tuple([name, size] + values + [status])
+        )
+    regressions = [row for row in rows if row[4] not in ("ok", "new", "missing")]
+    if regressions:
+        print("%d of %d benchmarks regressed" % (len(regressions), len(rows)))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time and peak memory of the merge hot paths"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser(
+        "run", help="Run the benchmarks on synthetic MAF files"
+    )
+    run_parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Numbers of original variants to run the benchmarks at",
+    )
+    run_parser.add_argument(
+        "--benchmark",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        help="Benchmarks to run, default all",
+    )
+    run_parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of timed runs of each benchmark"
+    )
+    run_parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    run_parser.add_argument("--output", help="JSON file to write the results to")
+    run_parser.set_defaults(func=run_command)
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare results with a baseline, exit 1 on regressions"
+    )
+    compare_parser.add_argument("baseline", help="JSON file of the baseline results")
+    compare_parser.add_argument("current", help="JSON file of the results to check")
+    compare_parser.add_argument(
+        "--time-tolerance",
+        type=float,
+        default=TIME_TOLERANCE,
+        help="Fraction slower than the baseline that is not a regression",
+    )
+    compare_parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=MEMORY_TOLERANCE,
+        help="Fraction more peak memory than the baseline that is not a regression",
+    )
+    compare_parser.set_defaults(func=compare_command)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+import argparse
+import gc
+import tempfile
+import time
+import tracemalloc
+
+from genotype_variants.create_all_maf_dataframe import create_all_maf_dataframe
+from genotype_variants.create_duplex_simplex_dataframe import (
+    create_duplex_simplex_dataframe,
+)
+from synthetic_maf import read_merge_inputs, write_synthetic_mafs
+
+"""
+merge_memory
+~~~~~~~~~~~~~~~
+:Description: Peak memory of merging genotyped MAF data frames with and without the low memory mode
+"""
+"""
+Description: Writes synthetic original, standard, duplex and simplex MAF files, reads them
+    as small_variants merge does and reports the peak memory traced while they are merged
+    into the ORG-STD-SIMPLEX-DUPLEX MAF, relative to the memory of the inputs.
+
+    python benchmarks/merge_memory.py --variants 200000
+"""
+# merge modes compared, with the options of the two merge functions
+MODES = {
+    "copies": dict(low_memory=False, copy=True),
+    "low memory": dict(low_memory=True, copy=True),
+    "low memory, no copy": dict(low_memory=True, copy=False),
+}
+
+
+def measure(paths, options):
+    """Memory of the inputs, peak memory while merging and seconds taken"""
+    gc.collect()
+    tracemalloc.start()
+    o_maf, i_maf, d_maf, s_maf = read_merge_inputs(paths)
+    gc.collect()
+    inputs, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    ds_maf = create_duplex_simplex_dataframe(s_maf, d_maf, **options)
+    merged = create_all_maf_dataframe(o_maf, i_maf, ds_maf, **options)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del o_maf, i_maf, d_maf, s_maf, ds_maf, merged
+    return inputs, peak, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Peak memory of merging genotyped MAF data frames"
+    )
+    parser.add_argument(
+        "--variants", type=int, default=200000, help="Number of variants to merge"
+    )
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_synthetic_mafs(tmp, args.variants)
+        print(
+            "%-20s %10s %10s %8s %8s"
+            % ("mode", "input MB", "peak MB", "peak x", "seconds")
+        )
+        for mode, options in MODES.items():
+            inputs, peak, seconds = measure(paths, options)
+            print(
+                "%-20s %10.1f %10.1f %8.2f %8.2f"
+                % (mode, inputs / 1e6, peak / 1e6, peak / inputs, seconds)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+import argparse
+import csv
+import json
+import os
+import pathlib
+import resource
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from synthetic_maf import write_synthetic_mafs
+
+"""
+scaling_bench
+~~~~~~~~~~~~~~~
+:Description: Throughput of full genotype_variants runs against a fake GetBaseCountMultiSample
+"""
+"""
+Description: Writes a cohort of seeded synthetic MAF files with empty BAM and FASTA files,
+    genotypes it with genotype_variants in new processes, using fake_gbcms.py in place of
+    GetBaseCountMultiSample, for each number of samples, variants and jobs, and reports the
+    samples per hour, variants per second and the orchestration overhead, the wall time
+    during which no GetBaseCountMultiSample process was running.
+
+    The multiple-samples and cohort modes run one command for the cohort with --jobs, the
+    all and generate modes run one command per sample, --jobs of them at a time, like a
+    job array would.
+
+    python benchmarks/scaling_bench.py --samples 8 --variants 1000 10000 --jobs 1 2 4
+"""
+FAKE_GBCMS = pathlib.Path(__file__).resolve().parent / "fake_gbcms.py"
+MODES = ["multiple-samples", "cohort", "all", "generate"]
+BAM_TYPES = {
+    "standard_bam": "STANDARD",
+    "duplex_bam": "DUPLEX",
+    "simplex_bam": "SIMPLEX",
+}
+
+
+def write_cohort(cohort_dir, samples, variants, seed):
+    """Write the synthetic MAF file of each sample, shared empty BAM and
+    FASTA files and the metadata file of the cohort.
+
+    Returns:
+        dict: metadata file, reference FASTA and the metadata rows
+    """
+    cohort_dir = pathlib.Path(cohort_dir)
+    cohort_dir.mkdir(parents=True, exist_ok=True)
+    reference = cohort_dir / "reference.fa"
+    reference.touch()
+    bams = {}
+    for column, bam_type in BAM_TYPES.items():
+        bams[column] = cohort_dir / (bam_type.lower() + ".bam")
+        bams[column].touch()
+    rows = []
+    for i in range(samples):
+        sample_id = "S%05d" % i
+        paths = write_synthetic_mafs(
+            cohort_dir / sample_id,
+            variants,
+            seed=seed + i,
+            sample=sample_id,
+            bam_types=(),
+        )
+        rows.append(dict(sample_id=sample_id, maf=paths["ORIGINAL"], **bams))
+    metadata = cohort_dir / "metadata.tsv"
+    with open(metadata, "w", newline="") as f:
+        writer = csv.DictWriter(
+            f, ["sample_id", "maf"] + list(BAM_TYPES), delimiter="\t"
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+    return {"metadata": metadata, "reference": reference, "rows": rows}
+
+
+def write_gbcms_wrapper(path):
+    """Executable running fake_gbcms.py with this Python interpreter"""
+    path = pathlib.Path(path)
+    path.write_text('#!/bin/sh\nexec "%s" "%s" "$@"\n' % (sys.executable, FAKE_GBCMS))
+    path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def cli_command(*args):
+    return [sys.executable, "-m", "genotype_variants.cli", "small_variants"] + [
+        str(arg) for arg in args
+    ]
+
+
+def mode_commands(mode, cohort, gbcms, jobs):
+    """Command lines that genotype the cohort, and the jobs to run them with"""
+    if mode in ("multiple-samples", "cohort"):
+        command = cli_command(
+            mode, "-i", cohort["metadata"], "-r", cohort["reference"], "-g", gbcms
+        )
+        return [command + ["-j", str(jobs)]], 1
+    commands = [
+        cli_command(
+            mode,
+            "-i",
+            row["maf"],
+            "-r",
+            cohort["reference"],
+            "-p",
+            row["sample_id"],
+            "-si",
+            row["sample_id"],
+            "-b",
+            row["standard_bam"],
+            "-d",
+            row["duplex_bam"],
+            "-s",
+            row["simplex_bam"],
+            "-g",
+            gbcms,
+            "-c",
+        )
+        for row in cohort["rows"]
+    ]
+    return commands, jobs
+
+
+def busy_seconds(intervals):
+    """Length of the union of (start, end) intervals"""
+    total, last_end = 0.0, None
+    for start, end in sorted(intervals):
+        if last_end is None or start > last_end:
+            total += end - start
+            last_end = end
+        elif end > last_end:
+            total += end - last_end
+            last_end = end
+    return total
+
+
+def read_gbcms_log(log_file):
+    if not os.path.exists(log_file):
+        return []
+    with open(log_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_mode(mode, cohort, gbcms, jobs, work_dir, env):
+    """Run one mode at one number of jobs, return its measurements"""
+    work_dir = pathlib.Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    log_file = work_dir / "fake_gbcms.jsonl"
+    log_file.unlink(missing_ok=True)
+    env = dict(env, FAKE_GBCMS_LOG=str(log_file))
+    commands, workers = mode_commands(mode, cohort, gbcms, jobs)
+
+    def run(command):
+        return subprocess.run(
+            command,
+            cwd=work_dir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ).returncode
+
+    usage_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        returncodes = list(executor.map(run, commands))
+    end = time.time()
+    usage_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    runs = read_gbcms_log(log_file)
+    intervals = [(max(run["start"], start), min(run["end"], end)) for run in runs]
+    wall = end - start
+    busy = busy_seconds(intervals)
+    samples = len(cohort["rows"])
+    variants = samples * cohort["variants"]
+    pattern = "*_genotyped.maf" if mode == "generate" else "*-ORG-*_genotyped.maf"
+    return {
+        "mode": mode,
+        "samples": samples,
+        "variants": cohort["variants"],
+        "jobs": jobs,
+        "failed_commands": sum(1 for code in returncodes if code != 0),
+        "outputs": len(list(work_dir.glob(pattern))),
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(
+            usage_end.ru_utime
+            - usage_start.ru_utime
+            + usage_end.ru_stime
+            - usage_start.ru_stime,
+            3,
+        ),
+        "samples_per_hour": round(samples / wall * 3600, 1),
+        "variants_per_second": round(variants / wall, 1),
+        "gbcms_runs": len(runs),
+        "gbcms_seconds": round(sum(end - start for start, end in intervals), 3),
+        "gbcms_busy_seconds": round(busy, 3),
+        "overhead_seconds": round(wall - busy, 3),
+        "overhead_fraction": round((wall - busy) / wall, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Throughput of genotype_variants against a fake GetBaseCountMultiSample"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=MODES,
+        nargs="+",
+        default=["multiple-samples"],
+        help="small_variants commands to genotype the cohort with",
+    )
+    parser.add_argument(
+        "--samples", type=int, nargs="+", default=[4], help="Numbers of samples"
+    )
+    parser.add_argument(
+        "--variants",
+        type=int,
+        nargs="+",
+        default=[1000],
+        help="Numbers of variants of each sample",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="Numbers of samples genotyped at the same time",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--startup",
+        type=float,
+        default=0.5,
+        help="Seconds each GetBaseCountMultiSample run takes to start",
+    )
+    parser.add_argument(
+        "--sleep",
+        type=float,
+        default=0.0,
+        help="Seconds GetBaseCountMultiSample sleeps per variant and BAM file",
+    )
+    parser.add_argument(
+        "--cpu",
+        type=float,
+        default=0.0,
+        help="CPU seconds GetBaseCountMultiSample burns per variant and BAM file",
+    )
+    parser.add_argument(
+        "--memory",
+        type=float,
+        default=0,
+        help="Bytes GetBaseCountMultiSample holds per variant and BAM file",
+    )
+    parser.add_argument(
+        "--work-dir", help="Directory to keep the inputs and outputs in"
+    )
+    parser.add_argument("--output", help="JSON lines file to append the results to")
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        FAKE_GBCMS_STARTUP=str(args.startup),
+        FAKE_GBCMS_SLEEP=str(args.sleep),
+        FAKE_GBCMS_CPU=str(args.cpu),
+        FAKE_GBCMS_MEMORY=str(args.memory),
+    )
+    columns = [
+        "mode",
+        "samples",
+        "variants",
+        "jobs",
+        "wall_seconds",
+        "samples_per_hour",
+        "variants_per_second",
+        "gbcms_busy_seconds",
+        "overhead_seconds",
+        "overhead_fraction",
+        "failed_commands",
+    ]
+    widths = [max(len(column), 8) for column in columns]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = pathlib.Path(args.work_dir or tmp)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        gbcms = write_gbcms_wrapper(work_dir / "GetBaseCountsMultiSample")
+        for samples in args.samples:
+            for variants in args.variants:
+                cohort_dir = work_dir / ("cohort_%d_%d" % (samples, variants))
+                cohort = write_cohort(cohort_dir, samples, variants, args.seed)
+                cohort["variants"] = variants
+                for mode in args.mode:
+                    for jobs in args.jobs:
+                        result = run_mode(
+                            mode,
+                            cohort,
+                            gbcms,
+                            jobs,
+                            cohort_dir / ("%s_j%d" % (mode, jobs)),
+                            env,
+                        )
+                        print(
+                            "  ".join(
+                                str(result[column]).rjust(width)
+                                for column, width in zip(columns, widths)
+                            ),
+                            flush=True,
+                        )
+                        if args.output:
+                            with open(args.output, "a") as f:
+                                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
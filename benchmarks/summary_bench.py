@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from genotype_variants.generate_summary_field import VAF_PRECISION, format_summary
+
+"""
+summary_bench
+~~~~~~~~~~~~~~~
+:Description: Time of formatting the summary fields of many variants
+"""
+"""
+Description: Formats DP=..;RD=..;AD=..;VF=.. summary strings for seeded random fragment
+    counts and reports the fastest of a few runs. Exits with status 1 when it takes longer
+    than the threshold, so it can be run in CI.
+
+    python benchmarks/summary_bench.py --rows 5000000 --threshold 1.0
+"""
+
+
+def random_counts(rows, seed=0, mean_depth=1000):
+    """Reference and alternate fragment counts around a mean depth"""
+    rng = np.random.default_rng(seed)
+    depth = rng.poisson(mean_depth, rows)
+    alt = rng.binomial(depth, rng.beta(0.5, 20, rows))
+    return depth - alt, alt
+
+
+def summary_seconds(ref, alt, precision=VAF_PRECISION, repeat=3):
+    """Fastest wall clock time of formatting the summaries of the counts"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        format_summary(ref, alt, precision)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time of formatting the summary fields of many variants"
+    )
+    parser.add_argument(
+        "--rows", type=int, default=5000000, help="Number of variants to format"
+    )
+    parser.add_argument(
+        "--precision", type=int, default=VAF_PRECISION, help="Decimals of VF"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.0,
+        help="Seconds formatting the summaries may take before the benchmark fails",
+    )
+    args = parser.parse_args()
+    ref, alt = random_counts(args.rows, args.seed)
+    seconds = summary_seconds(ref, alt, args.precision, args.repeat)
+    print("%-20s %12s %10s %14s" % ("benchmark", "rows", "seconds", "rows/second"))
+    print(
+        "%-20s %12d %10.3f %14.0f"
+        % ("format_summary", args.rows, seconds, args.rows / seconds)
+    )
+    if seconds > args.threshold:
+        print(
+            "Formatting %d summaries took %.3f seconds, more than the %.3f second threshold"
+            % (args.rows, seconds, args.threshold)
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+import argparse
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from genotype_variants.maf_schema import (
+    COUNT_COLUMNS,
+    GENOTYPED_COLUMNS,
+    MAF_COLUMNS,
+    read_maf,
+)
+
+"""
+synthetic_maf
+~~~~~~~~~~~~~~~
+:Description: Seeded synthetic original, standard, duplex and simplex MAF files
+"""
+"""
+Description: Writes a seeded synthetic original MAF file with a mix of SNV, DNV, insertion
+    and deletion records, and the GetBaseCountMultiSample output of the standard, duplex and
+    simplex BAM files for it, each missing a fraction of the records. The same arguments
+    always give the same files. Used by the benchmarks, and to write inputs for merge runs.
+
+    python benchmarks/synthetic_maf.py --variants 1000000 --output-dir synthetic
+"""
+CHROMOSOMES = [str(c) for c in range(1, 23)] + ["X", "Y"]
+BASES = np.array(list("ACGT"))
+BAM_TYPES = ["STANDARD", "DUPLEX", "SIMPLEX"]
+# Fraction of SNV and DNV records, the rest are indels
+DNV_RATE = 0.01
+# Fraction of the indels that are insertions
+INSERTION_RATE = 0.4
+VARIANT_CLASSIFICATIONS = {
+    "SNP": ["Missense_Mutation", "Silent", "Nonsense_Mutation", "Intron", "3'UTR"],
+    "DNP": ["Missense_Mutation", "Silent", "Intron"],
+    "INS": ["Frame_Shift_Ins", "In_Frame_Ins", "Intron"],
+    "DEL": ["Frame_Shift_Del", "In_Frame_Del", "Intron"],
+}
+# Mean read depth of each BAM type, fragments are about half of the reads
+MEAN_DEPTH = {"ORIGINAL": 600, "STANDARD": 1000, "DUPLEX": 300, "SIMPLEX": 500}
+# Records generated at a time, so files larger than memory can be written
+CHUNK_SIZE = 250000
+
+
+def random_alleles(rng, lengths):
+    """Random bases with the given lengths, as a list of strings"""
+    bases = "".join(BASES[rng.integers(0, 4, int(lengths.sum()))])
+    ends = np.cumsum(lengths)
+    return [bases[end - length : end] for end, length in zip(ends, lengths)]
+
+
+def synthetic_variants(rng, first, count, variants, indel_rate):
+    """Columns of the original MAF without counts for records first to
+    first + count of a file of the given number of variants.
+
+    Records are sorted by chromosome and position, and no two have the same
+    mutation key.
+
+    Returns:
+        dict: MAF column to array of values
+    """
+    rows = np.arange(first, first + count)
+    types = rng.choice(
+        ["SNP", "DNP", "INS", "DEL"],
+        count,
+        p=[
+            1 - indel_rate - DNV_RATE,
+            DNV_RATE,
+            indel_rate * INSERTION_RATE,
+            indel_rate * (1 - INSERTION_RATE),
+        ],
+    )
+    # variants are spread evenly over the chromosomes, at least 100 bases
+    # apart so alleles never overlap, within the int32 positions of read_maf
+    per_chromosome = -(-variants // len(CHROMOSOMES))
+    spacing = int(min(1000, max(100, 2e8 // per_chromosome)))
+    start = 1 + (rows % per_chromosome) * spacing + rng.integers(0, spacing - 60, count)
+    ref_index = rng.integers(0, 4, count)
+    ref = BASES[ref_index].astype(object)
+    alt = BASES[(ref_index + rng.integers(1, 4, count)) % 4].astype(object)
+    end = start.copy()
+
+    dnp = types == "DNP"
+    ref[dnp] = ref[dnp] + BASES[rng.integers(0, 4, dnp.sum())].astype(object)
+    alt[dnp] = alt[dnp] + BASES[rng.integers(0, 4, dnp.sum())].astype(object)
+    end[dnp] += 1
+    ins = types == "INS"
+    ref[ins] = "-"
+    alt[ins] = random_alleles(rng, rng.geometric(0.4, ins.sum()))
+    end[ins] += 1
+    deletion = types == "DEL"
+    lengths = np.minimum(rng.geometric(0.3, deletion.sum()), 50)
+    ref[deletion] = random_alleles(rng, lengths)
+    alt[deletion] = "-"
+    end[deletion] += lengths - 1
+
+    classification = np.empty(count, dtype=object)
+    for variant_type, classifications in VARIANT_CLASSIFICATIONS.items():
+        selected = types == variant_type
+        classification[selected] = rng.choice(classifications, selected.sum())
+    return {
+        "Hugo_Symbol": np.char.add("GENE", (rows * 20000 // variants).astype(str)),
+        "Center": np.full(count, "mskcc.org"),
+        "NCBI_Build": np.full(count, "GRCh37"),
+        "Chromosome": np.array(CHROMOSOMES)[rows // per_chromosome],
+        "Start_Position": start,
+        "End_Position": end,
+        "Strand": np.full(count, "+"),
+        "Variant_Classification": classification,
+        "Variant_Type": types,
+        "Reference_Allele": ref,
+        "Tumor_Seq_Allele1": ref,
+        "Tumor_Seq_Allele2": alt,
+        "Matched_Norm_Sample_Barcode": np.full(count, "Normal"),
+        "Mutation_Status": np.full(count, "UNPAIRED"),
+    }
+
+
+def count_columns(rng, count, mean_depth):
+    """GetBaseCountMultiSample like read and fragment counts with a low
+    variant allele frequency for count records
+
+    Returns:
+        dict: count column to array of values
+    """
+    total = rng.poisson(mean_depth, count)
+    alt = rng.binomial(total, rng.beta(0.5, 20, count))
+    forward = rng.binomial(total, 0.5)
+    alt_forward = np.minimum(rng.binomial(alt, 0.5), forward)
+    fragment = rng.binomial(total, 0.5)
+    alt_fragment = np.minimum(rng.binomial(alt, 0.5), fragment)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frequency = np.nan_to_num(alt / total).round(4)
+    return {
+        "t_ref_count": total - alt,
+        "t_alt_count": alt,
+        "t_total_count": total,
+        "t_variant_frequency": frequency,
+        "t_total_count_forward": forward,
+        "t_ref_count_forward": forward - alt_forward,
+        "t_alt_count_forward": alt_forward,
+        "t_total_count_fragment": fragment,
+        "t_ref_count_fragment": fragment - alt_fragment,
+        "t_alt_count_fragment": alt_fragment,
+    }
+
+
+def synthetic_maf_chunks(
+    variants,
+    seed=0,
+    indel_rate=0.15,
+    missing_rate=0.05,
+    sample="C-000001",
+    chunk_size=CHUNK_SIZE,
+    bam_types=BAM_TYPES,
+):
+    """Synthetic original MAF data frame and GetBaseCountMultiSample data
+    frames of each BAM type, chunk_size records at a time.
+
+    Columns without values are missing values, written as empty fields.
+
+    Args:
+        variants: number of records of the original MAF
+        seed: seed of the random numbers
+        indel_rate: fraction of insertion and deletion records
+        missing_rate: fraction of the records missing from each
+            GetBaseCountMultiSample data frame, independently of the others
+        sample: sample identifier, the barcode of each BAM type is
+            <sample>-<BAM type>
+        chunk_size: number of original MAF records of each chunk
+        bam_types: BAM types to generate GetBaseCountMultiSample data frames
+            for, none for only the original MAF
+
+    Yields:
+        dict: ORIGINAL and BAM type to data frame of the next chunk
+    """
+    rng = np.random.default_rng(seed)
+    for first in range(0, variants, chunk_size):
+        count = min(chunk_size, variants - first)
+        columns = synthetic_variants(rng, first, count, variants, indel_rate)
+        # the caller counts are the only counts of the original MAF
+        caller_counts = count_columns(rng, count, MEAN_DEPTH["ORIGINAL"])
+        original = dict(
+            columns,
+            Tumor_Sample_Barcode=np.full(count, sample),
+            Caller=np.full(count, "synthetic"),
+            **{column: caller_counts[column] for column in COUNT_COLUMNS[:2]},
+        )
+        chunk = {"ORIGINAL": pd.DataFrame(original, columns=MAF_COLUMNS)}
+        for bam_type in bam_types:
+            kept = rng.random(count) >= missing_rate
+            genotyped = {column: values[kept] for column, values in columns.items()}
+            genotyped["Tumor_Sample_Barcode"] = np.full(
+                kept.sum(), sample + "-" + bam_type
+            )
+            genotyped.update(count_columns(rng, kept.sum(), MEAN_DEPTH[bam_type]))
+            chunk[bam_type] = pd.DataFrame(genotyped, columns=MAF_COLUMNS)
+        yield chunk
+
+
+def synthetic_mafs(variants, **options):
+    """Synthetic original MAF data frame and GetBaseCountMultiSample data
+    frames of each BAM type, options as for ``synthetic_maf_chunks``"""
+    chunks = list(synthetic_maf_chunks(variants, **options))
+    return {
+        name: pd.concat([chunk[name] for chunk in chunks], ignore_index=True)
+        for name in chunks[0]
+    }
+
+
+def write_synthetic_mafs(output_dir, variants, **options):
+    """Write the synthetic original MAF file and GetBaseCountMultiSample
+    MAF files of each BAM type, options as for ``synthetic_maf_chunks``.
+
+    Returns:
+        dict: ORIGINAL and BAM type to path of the MAF file
+    """
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = {
+        name: output_dir / (name + ".maf")
+        for name in ["ORIGINAL"] + list(options.get("bam_types", BAM_TYPES))
+    }
+    for i, chunk in enumerate(synthetic_maf_chunks(variants, **options)):
+        for name, maf in chunk.items():
+            maf.to_csv(
+                paths[name], sep="\t", index=False, mode="a" if i else "w", header=not i
+            )
+    return paths
+
+
+def read_merge_inputs(paths):
+    """Read the synthetic MAF files as ``small_variants merge`` does
+
+    Returns:
+        tuple: original, standard, duplex and simplex data frames
+    """
+    return (
+        read_maf(paths["ORIGINAL"]),
+        read_maf(paths["STANDARD"], GENOTYPED_COLUMNS, genotyped=True),
+        read_maf(paths["DUPLEX"], GENOTYPED_COLUMNS, genotyped=True),
+        read_maf(paths["SIMPLEX"], genotyped=True),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write seeded synthetic original and genotyped MAF files"
+    )
+    parser.add_argument(
+        "--variants", type=int, default=100000, help="Number of original variants"
+    )
+    parser.add_argument("--output-dir", required=True, help="Output directory")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--indel-rate", type=float, default=0.15, help="Fraction of indel records"
+    )
+    parser.add_argument(
+        "--missing-rate",
+        type=float,
+        default=0.05,
+        help="Fraction of records missing from each genotyped MAF file",
+    )
+    args = parser.parse_args()
+    paths = write_synthetic_mafs(
+        args.output_dir,
+        args.variants,
+        seed=args.seed,
+        indel_rate=args.indel_rate,
+        missing_rate=args.missing_rate,
+    )
+    for name, path in paths.items():
+        print("%-10s %s" % (name, path))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
+import importlib
 import os
+import signal
 import sys
-import pathlib
 import logging
 
+from genotype_variants import __version__ as version
+
 try:
     import click
 except ImportError as e:
@@ -30,14 +33,6 @@ Description: console script for running genotyping
 @author: Ronak H Shah
 """
 
-version = None
-scriptpath = os.path.realpath(__file__)
-p_scriptpath = pathlib.Path(scriptpath)
-with open(os.path.join(p_scriptpath.parent, "__init__.py"), "r") as f:
-    for line in f.readlines():
-        line = line.strip()
-        if line.startswith("__version__"):
-            version = line.split("=")[-1].strip()
 __all__ = []
 __version__ = version
 __date__ = "2020-01-29"
@@ -46,6 +41,12 @@ __updated__ = "2022-04-28"
 plugin_folder = os.path.join(os.path.dirname(__file__), "commands")
 
 
+def _exit_on_sigterm(signum, frame):
+    """Exit on SIGTERM, so the commands started in their own session are
+    stopped as on Ctrl-C"""
+    sys.exit(128 + signum)
+
+
 class MyCLI(click.MultiCommand):
 
     def list_commands(self, ctx):
@@ -58,22 +59,52 @@ class MyCLI(click.MultiCommand):
         return rv
 
     def get_command(self, ctx, name):
-        """Dynamically get the command."""
-        ns = {}
-        fn = os.path.join(plugin_folder, name + ".py")
-        with open(fn) as f:
-            code = compile(f.read(), fn, "exec")
-            eval(code, ns, ns)
-        return ns["cli"]
+        """Dynamically get the command, imported as a module so its
+        bytecode is cached"""
+        if name not in self.list_commands(ctx):
+            return None
+        module = importlib.import_module("genotype_variants.commands." + name)
+        return module.cli
 
 
 @click.command(cls=MyCLI)
 @click.version_option(
-    None, "-v", "--version", message="%(version)s", prog_name="genotype_variants"
+    version, "-v", "--version", message="%(version)s", prog_name="genotype_variants"
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Profile the CPU time and memory of the sub-command, written to "
+    "genotype_variants_<pid>.prof and genotype_variants_<pid>_profile.txt "
+    "next to the log file",
 )
-def main(args=None):
+@click.option(
+    "--metrics-file",
+    required=False,
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write counters of the samples processed, variants genotyped and "
+    "GetBaseCountMultiSample failures, histograms of the GetBaseCountMultiSample "
+    "and merge wall times and the peak RSS to this file in the Prometheus text "
+    "format read by the node_exporter textfile collector, it is updated as the "
+    "samples and GetBaseCountMultiSample runs finish",
+)
+@click.pass_context
+def main(ctx, profile, metrics_file=None, args=None):
     """Console script for genotype_variants."""
-    pass
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    if metrics_file:
+        from genotype_variants.metrics import start_metrics, stop_metrics
+
+        start_metrics(metrics_file)
+        ctx.call_on_close(stop_metrics)
+    if profile:
+        from genotype_variants.profiling import start_profile, stop_profile
+
+        start_profile(
+            os.path.join(os.getcwd(), "genotype_variants_" + str(os.getpid()))
+        )
+        ctx.call_on_close(stop_profile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+import collections
+import json
+import logging
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from genotype_variants.maf_schema import MUTATION_KEY, read_maf
+
+"""
+cohort_tensor
+~~~~~~~~~~~~~~~
+:Description: Code to store the fragment counts of a cohort as a memory-mapped array
+"""
+"""
+Description: Code to write the fragment counts of the merged MAF files of many samples into
+    one variants x samples x assays x counts integer array in NumPy .npy format, with the
+    variants and samples along its axes in TSV files, and to open it memory-mapped
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+# Assays and fragment counts along the last two axes of the tensor, with the
+# columns of the merged MAF they are read from
+TENSOR_ASSAYS = ["STANDARD", "SIMPLEX", "DUPLEX", "SIMPLEX-DUPLEX"]
+TENSOR_COUNTS = ["ref", "alt", "total"]
+TENSOR_COLUMNS = {
+    assay: [
+        "t_%s_count_fragment_%s" % (count, suffix) for count in ("ref", "alt", "total")
+    ]
+    for assay, suffix in zip(
+        TENSOR_ASSAYS, ("standard", "simplex", "duplex", "simplex_duplex")
+    )
+}
+# Count of a variant that is not in the merged MAF of a sample, or of an
+# assay the sample does not have
+MISSING_COUNT = -1
+
+COUNTS_FILE = "counts.npy"
+VARIANTS_FILE = "variants.tsv"
+SAMPLES_FILE = "samples.tsv"
+AXES_FILE = "axes.json"
+
+# Memory of the samples whose counts are gathered before being written, so
+# the array is written in runs of contiguous samples
+BLOCK_BYTES = 64 * 1024**2
+
+CohortTensor = collections.namedtuple(
+    "CohortTensor", ["counts", "variants", "samples", "assays", "count_names"]
+)
+
+
+def read_variant_index(input_maf):
+    """Mutation keys of the variants of a MAF file, each once, as text"""
+    keys = read_maf(input_maf, MUTATION_KEY, text=True)
+    return pd.MultiIndex.from_frame(keys[MUTATION_KEY]).unique()
+
+
+def union_variant_index(input_mafs):
+    """Mutation keys of the variants of MAF files, each once, in the order
+    they are first seen"""
+    union = None
+    for input_maf in input_mafs:
+        index = read_variant_index(input_maf)
+        if union is None:
+            union = index
+        else:
+            missing = index[union.get_indexer(index) < 0]
+            if len(missing):
+                union = union.append(missing)
+    return union
+
+
+def fill_sample_counts(counts, input_maf, variants):
+    """Fill the counts of one sample from its merged MAF file.
+
+    Args:
+        counts: variants x assays x counts integer array to fill
+        input_maf: Path to the merged MAF file of the sample
+        variants: MultiIndex of the mutation keys along the first axis
+
+    Returns:
+        int: number of records of the MAF file not in variants
+    """
+    columns = [column for assay in TENSOR_ASSAYS for column in TENSOR_COLUMNS[assay]]
+    maf = read_maf(input_maf, MUTATION_KEY + columns, text=True)
+    positions = variants.get_indexer(pd.MultiIndex.from_frame(maf[MUTATION_KEY]))
+    found = positions >= 0
+    for a, assay in enumerate(TENSOR_ASSAYS):
+        for c, column in enumerate(TENSOR_COLUMNS[assay]):
+            if column not in maf.columns:
+                continue
+            values = pd.to_numeric(maf[column], errors="coerce").to_numpy(
+                dtype=float, na_value=np.nan
+            )
+            values = np.where(np.isnan(values), MISSING_COUNT, values)
+            counts[positions[found], a, c] = values[found]
+    return int((~found).sum())
+
+
+def write_cohort_tensor(sample_mafs, output_dir, variants_maf=None):
+    """Write the fragment counts of the merged MAF files of many samples as
+    a memory-mapped cohort genotype tensor.
+
+    The output directory holds counts.npy, an int32 array of shape
+    (variants, samples, assays, counts) with MISSING_COUNT where a sample
+    does not have a variant or an assay, variants.tsv with the mutation key
+    of each variant, samples.tsv with the sample_id of each sample and
+    axes.json naming the assays and counts.
+
+    Args:
+        sample_mafs: list of (sample_id, path to merged MAF file) tuples
+        output_dir: Path to the output directory, created if missing
+        variants_maf: Path to a MAF file with the variants of the tensor,
+            such as the union MAF of the cohort command, default the union
+            of the variants of the merged MAF files
+
+    Returns:
+        tuple: shape of the counts array
+    """
+    if not sample_mafs:
+        raise ValueError("no merged MAF files to write a cohort tensor from")
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if variants_maf:
+        variants = read_variant_index(variants_maf)
+    else:
+        variants = union_variant_index(maf for _, maf in sample_mafs)
+    shape = (len(variants), len(sample_mafs), len(TENSOR_ASSAYS), len(TENSOR_COUNTS))
+    counts = np.lib.format.open_memmap(
+        output_dir / COUNTS_FILE, mode="w+", dtype=np.int32, shape=shape
+    )
+    sample_bytes = max(1, shape[0] * shape[2] * shape[3] * counts.itemsize)
+    block = max(1, BLOCK_BYTES // sample_bytes)
+    for start in range(0, shape[1], block):
+        block_mafs = sample_mafs[start : start + block]
+        block_counts = np.full(
+            (shape[0], len(block_mafs)) + shape[2:], MISSING_COUNT, dtype=np.int32
+        )
+        for offset, (sample_id, input_maf) in enumerate(block_mafs):
+            skipped = fill_sample_counts(block_counts[:, offset], input_maf, variants)
+            if skipped:
+                logger.warning(
+                    "genotype_variants:small_variants:cohort_tensor:: %s records of %s are not in the variants of the cohort tensor",
+                    skipped,
+                    input_maf,
+                )
+        counts[:, start : start + len(block_mafs)] = block_counts
+    counts.flush()
+    del counts
+
+    variants.to_frame(index=False).to_csv(
+        output_dir / VARIANTS_FILE, sep="\t", index=False
+    )
+    pd.DataFrame(
+        {"sample_id": [str(sample_id) for sample_id, _ in sample_mafs]}
+    ).to_csv(output_dir / SAMPLES_FILE, sep="\t", index=False)
+    with open(output_dir / AXES_FILE, "w") as f:
+        json.dump(
+            {
+                "axes": ["variants", "samples", "assays", "counts"],
+                "assays": TENSOR_ASSAYS,
+                "counts": TENSOR_COUNTS,
+                "missing": MISSING_COUNT,
+            },
+            f,
+            indent=2,
+        )
+    logger.info(
+        "genotype_variants:small_variants:cohort_tensor:: fragment counts of %s variants in %s samples have been written to %s",
+        shape[0],
+        shape[1],
+        output_dir,
+    )
+    return shape
+
+
+def load_cohort_tensor(tensor_dir, mode="r"):
+    """Open a cohort genotype tensor written by write_cohort_tensor.
+
+    The counts are memory-mapped, so opening does not read them and slices
+    only read the pages they cover.
+
+    Args:
+        tensor_dir: Path to the cohort tensor directory
+        mode: numpy.load mmap_mode, "r" for read only
+
+    Returns:
+        CohortTensor: counts array, MultiIndex of the variant mutation keys
+            as text, Index of the sample ids, names of the assays and of
+            the counts along the last two axes
+    """
+    tensor_dir = pathlib.Path(tensor_dir)
+    with open(tensor_dir / AXES_FILE) as f:
+        axes = json.load(f)
+    counts = np.load(tensor_dir / COUNTS_FILE, mmap_mode=mode)
+    variants = pd.read_csv(
+        tensor_dir / VARIANTS_FILE, sep="\t", dtype=str, keep_default_na=False
+    )
+    samples = pd.read_csv(
+        tensor_dir / SAMPLES_FILE, sep="\t", dtype=str, keep_default_na=False
+    )
+    return CohortTensor(
+        counts,
+        pd.MultiIndex.from_frame(variants),
+        pd.Index(samples["sample_id"]),
+        axes["assays"],
+        axes["counts"],
+    )
@@ -1,16 +1,58 @@
+import atexit
+import importlib.util
 import os
 import sys
 import logging
 import time
 import pathlib
+import shutil
 import subprocess
-import numpy as np
+import tempfile
 import re
-from genotype_variants.run_cmd import run_cmd
-from genotype_variants.create_duplex_simplex_dataframe import (
-    create_duplex_simplex_dataframe as cdsd,
+from genotype_variants.compressed_io import decompress_maf, is_gzip
+from genotype_variants.counting_backend import (
+    COUNTING_BACKENDS,
+    counting_backend_cmd,
+    counting_backend_program,
 )
-from genotype_variants.create_all_maf_dataframe import create_all_maf_dataframe as camd
+from genotype_variants.gbcms_cache import (
+    fetch_cached_jobs,
+    gbcms_cache_key,
+    store_cached_jobs,
+)
+from genotype_variants.pipeline import run_pipelined_jobs
+from genotype_variants.run_gbcms import failed_jobs, run_gbcms_jobs, split_threads
+from genotype_variants.run_report import (
+    count_maf_variants,
+    create_run_record,
+    write_run_report,
+)
+from genotype_variants.run_samples import (
+    log_status_table,
+    run_samples,
+    write_status_table,
+)
+from genotype_variants.maf_schema import (
+    GENOTYPED_COLUMNS,
+    MAF_COLUMNS,
+    OUTPUT_FORMATS,
+    OUTPUT_SUFFIXES,
+    TEXT_FORMATS,
+    read_maf,
+    require_pyarrow,
+    write_maf,
+)
+from genotype_variants.incremental_maf import create_delta_maf, splice_genotyped_maf
+from genotype_variants.metrics import (
+    count_sample,
+    inc_counter,
+    is_recording,
+    observe,
+    record_gbcms_runs,
+    write_metrics,
+)
+from genotype_variants.profiling import stage
+from genotype_variants.shard_maf import SHARD_BY, concat_shard_mafs, shard_maf
 
 try:
     import click
@@ -26,9 +68,9 @@ except ImportError as e:
         "small_variants: click-log is not installed, please install click_log as it is one of the requirements."
     )
     exit(1)
-try:
-    import pandas as pd
-except ImportError as e:
+# pandas is imported by the commands that use it, so listing the commands
+# and their options does not pay for importing it
+if importlib.util.find_spec("pandas") is None:
     print(
         "small_variants: pandas is not installed, please install pandas as it is one of the requirements."
     )
@@ -57,6 +99,39 @@ def cli():
     pass
 
 
+def add_log_file_handler(logger_output=None):
+    """Add a file handler to the genotype_variants logger.
+
+    By default the log is written to the log file the logger already has,
+    such as the log of the sample run_samples is running, or else to
+    genotype_variants_<pid>.log in the current working directory, so
+    commands calling each other share the same handler instead of adding one
+    per call.
+
+    Args:
+        logger_output: Path to the log file
+
+    Returns:
+        logging.FileHandler: the handler writing to logger_output
+    """
+    for handler in logger.handlers:
+        if isinstance(handler, logging.FileHandler) and (
+            logger_output is None or handler.baseFilename == str(logger_output)
+        ):
+            return handler
+    if logger_output is None:
+        logger_file = "genotype_variants_" + str(os.getpid()) + ".log"
+        logger_output = pathlib.Path.cwd().joinpath(logger_file)
+    fh = logging.FileHandler(logger_output)
+    formatter = logging.Formatter(
+        fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%m/%d/%Y %I:%M:%S %p",
+    )
+    fh.setFormatter(formatter)
+    logger.addHandler(fh)
+    return fh
+
+
 # Generate
 @cli.command()
 @click.option(
@@ -104,9 +179,9 @@ def cli():
 @click.option(
     "-g",
     "--gbcms-path",
-    required=True,
+    required=False,
     type=click.Path(exists=True),
-    help="Full path to GetBaseCountMultiSample executable with fragment support",
+    help="Full path to GetBaseCountMultiSample executable with fragment support, required by the gbcms counting backend",
 )
 @click.option(
     "-fd",
@@ -147,7 +222,79 @@ def cli():
     type=click.STRING,
     help="Override default sample name",
 )
+@click.option(
+    "-c",
+    "--concurrent",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Run GetBaseCountMultiSample for the standard, duplex and simplex BAM files at the same time, splitting --threads between them",
+)
+@click.option(
+    "-mb",
+    "--multi-bam",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Genotype the duplex and simplex BAM files in a single GetBaseCountMultiSample process, the standard BAM file is run separately as it does not use generic counting",
+)
+@click.option(
+    "--timeout",
+    required=False,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Wall clock time in minutes after which a GetBaseCountMultiSample process is stopped and reported as failed",
+)
+@click.option(
+    "--shard-by",
+    required=False,
+    type=click.Choice(SHARD_BY),
+    help="Split the input MAF by chromosome or into --shards chunks of variants and genotype the shards in parallel, the genotyped shards are put back together in the order of the input MAF",
+)
+@click.option(
+    "--shards",
+    required=False,
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of chunks the input MAF is split into with --shard-by chunks",
+)
+@click.option(
+    "--run-report",
+    required=False,
+    type=click.Path(dir_okay=False, writable=True),
+    help="Append a JSON record with the wall time, CPU time, peak memory and I/O of every GetBaseCountMultiSample run to this file",
+)
+@click.option(
+    "-cb",
+    "--counting-backend",
+    required=False,
+    type=click.Choice(COUNTING_BACKENDS),
+    default="gbcms",
+    show_default=True,
+    help="Program counting the bases supporting each variant, either the GetBaseCountMultiSample executable given with --gbcms-path or the built in pysam engine with the same output",
+)
+@click.option(
+    "--incremental-from",
+    required=False,
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory with the genotyped MAF files of a previous run on the same BAM files, only the variants of the input MAF missing from them are genotyped and the rest of the genotypes are reused",
+)
+@click.option(
+    "--cache-dir",
+    required=False,
+    type=click.Path(file_okay=False, writable=True),
+    help="Directory to cache GetBaseCountMultiSample outputs in, a run with the same MAF, BAM, reference, GetBaseCountMultiSample and counting parameters as a cached one is skipped. The directory can be shared between concurrent jobs",
+)
+@click.option(
+    "--cache-max-size",
+    required=False,
+    type=click.FloatRange(min=0, min_open=True),
+    default=50,
+    show_default=True,
+    help="Maximum size of --cache-dir in GB, the least recently used outputs are removed beyond it",
+)
 @click_log.simple_verbosity_option(logger)
+@count_sample
 def generate(
     input_maf,
     reference_fasta,
@@ -161,20 +308,27 @@ def generate(
     mapping_quality,
     threads,
     sample_id,
+    concurrent=False,
+    multi_bam=False,
+    timeout=None,
+    run_report=None,
+    shard_by=None,
+    shards=4,
+    cache_dir=None,
+    cache_max_size=50,
+    incremental_from=None,
+    counting_backend="gbcms",
+    pipeline=None,
+    keep_intermediates=False,
 ):
     """Command that helps to generate genotyped MAF,
     the output file will be labelled with
-    patient identifier as prefix"""
-    pid = os.getpid()
-    logger_file = "genotype_variants_" + str(pid) + ".log"
-    logger_output = pathlib.Path.cwd().joinpath(logger_file)
-    fh = logging.FileHandler(logger_output)
-    formatter = logging.Formatter(
-        fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%m/%d/%Y %I:%M:%S %p",
-    )
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
+    patient identifier as prefix.
+
+    pipeline, when given, is called with the BAM type -> path of the
+    genotyped MAF files while GetBaseCountMultiSample writes them to named
+    pipes, they are only written to disk with keep_intermediates."""
+    add_log_file_handler()
     logger.info(
         "=========================================================================="
     )
@@ -211,7 +365,16 @@ def generate(
         logger.info("small_variants: Duplex BAM: %s", duplex_bam)
     if simplex_bam:
         logger.info("small_variants: Simplex BAM: %s", simplex_bam)
-    logger.info("small_variants: GetBaseCountMultiSample -> Path: %s", gbcms_path)
+    try:
+        gbcms_cmd = counting_backend_cmd(counting_backend, gbcms_path)
+    except ValueError as e:
+        logger.error("genotype_variants:small_variants:generate:: %s", e)
+        exit(1)
+    logger.info(
+        "small_variants: GetBaseCountMultiSample -> Counting backend: %s",
+        counting_backend,
+    )
+    logger.info("small_variants: GetBaseCountMultiSample -> Path: %s", gbcms_cmd)
     logger.info(
         "small_variants: GetBaseCountMultiSample -> Filter Duplicate: %s",
         str(filter_duplicate),
@@ -225,76 +388,339 @@ def generate(
         str(mapping_quality),
     )
     logger.info("small_variants: GetBaseCountMultiSample -> Threads: %s", str(threads))
-
-    # Run GetBaseMultisampleCount for each available bam file
-    std_output_maf = None
-    duplex_output_maf = None
-    simplex_output_maf = None
-    p1, p2, p3 = None, None, None
-    if standard_bam:
-        btype = "STANDARD"
-        (cmd, std_output_maf) = generate_gbcms_cmd(
-            input_maf,
-            btype,
-            reference_fasta,
-            gbcms_path,
-            patient_id,
-            standard_bam,
-            filter_duplicate,
-            fragment_count,
-            mapping_quality,
-            threads,
-            sample_id,
+    if timeout:
+        logger.info(
+            "small_variants: GetBaseCountMultiSample -> Timeout: %s [min]", str(timeout)
         )
-        p1 = run_cmd(cmd)
+    if incremental_from:
         logger.info(
-            "small_variants: Done running gbcms on %s and data has been written to %s",
-            standard_bam,
-            std_output_maf,
+            "small_variants: GetBaseCountMultiSample -> Incremental from: %s",
+            incremental_from,
+        )
+    if shard_by:
+        logger.info(
+            "small_variants: GetBaseCountMultiSample -> Shard by: %s%s",
+            shard_by,
+            " (%s shards)" % shards if shard_by == "chunks" else "",
         )
 
-    if duplex_bam:
-        btype = "DUPLEX"
-        (cmd, duplex_output_maf) = generate_gbcms_cmd(
-            input_maf,
-            btype,
-            reference_fasta,
-            gbcms_path,
-            patient_id,
-            duplex_bam,
-            filter_duplicate,
-            fragment_count,
-            mapping_quality,
-            threads,
-            sample_id,
+    # GetBaseCountMultiSample reads plain text, a compressed input MAF is
+    # decompressed once on local scratch for all of the jobs
+    scratch_dir = None
+    if is_gzip(input_maf):
+        try:
+            input_maf = decompress_maf(input_maf)
+        except (OSError, EOFError) as e:
+            logger.error(
+                "genotype_variants:small_variants:generate:: Could not decompress %s due to error, %s",
+                input_maf,
+                e,
+            )
+            exit(1)
+        scratch_dir = input_maf.parent
+        atexit.register(shutil.rmtree, scratch_dir, ignore_errors=True)
+    # The genotyped MAF files are named pipes on local scratch, network file
+    # systems often do not support them, read by the pipeline while all of
+    # the jobs run
+    pipe_dir = None
+    if pipeline:
+        concurrent = True
+        pipe_dir = pathlib.Path(
+            tempfile.mkdtemp(prefix=f"{sample_id or patient_id}_pipeline_")
+        )
+        atexit.register(shutil.rmtree, pipe_dir, ignore_errors=True)
+
+    # Run GetBaseMultisampleCount for each available bam file
+    bams = [
+        (btype, bam)
+        for btype, bam in (
+            ("STANDARD", standard_bam),
+            ("DUPLEX", duplex_bam),
+            ("SIMPLEX", simplex_bam),
+        )
+        if bam
+    ]
+    # BAM files that share the counting mode can be genotyped by one process
+    if multi_bam:
+        generic_bams = [(btype, bam) for btype, bam in bams if btype != "STANDARD"]
+        groups = [[(btype, bam)] for btype, bam in bams if btype == "STANDARD"]
+        if generic_bams:
+            groups.append(generic_bams)
+    else:
+        groups = [[(btype, bam)] for btype, bam in bams]
+    # Only genotype the variants missing from the previous genotyped MAF files
+    gbcms_input_maf = input_maf
+    genotyped_dir = None
+    if incremental_from:
+        genotyped_dir = pathlib.Path(
+            tempfile.mkdtemp(
+                prefix=f"{sample_id or patient_id}_incremental_",
+                dir=pathlib.Path.cwd(),
+            )
+        )
+        previous_mafs = {
+            btype: pathlib.Path(incremental_from)
+            / f"{sample_id or patient_id}-{btype}_genotyped.maf"
+            for btype, _ in bams
+        }
+        for btype, previous_maf in previous_mafs.items():
+            compressed_maf = previous_maf.with_name(previous_maf.name + ".gz")
+            if not previous_maf.is_file() and compressed_maf.is_file():
+                previous_mafs[btype] = compressed_maf
+        for btype, previous_maf in previous_mafs.items():
+            if not previous_maf.is_file():
+                logger.warning(
+                    "genotype_variants:small_variants:generate:: %s is not present, all the variants are genotyped for %s",
+                    previous_maf,
+                    btype,
+                )
+        gbcms_input_maf = genotyped_dir / f"{sample_id or patient_id}_delta.maf"
+        try:
+            delta_count = create_delta_maf(
+                input_maf, previous_mafs.values(), gbcms_input_maf
+            )
+        except (OSError, ValueError) as e:
+            logger.error(
+                "genotype_variants:small_variants:generate:: Could not compare %s to the previous genotyped MAF files due to error, %s",
+                input_maf,
+                e,
+            )
+            exit(1)
+        if not delta_count:
+            groups = []
+    # Split the input MAF so that each shard is genotyped by its own process
+    if shard_by:
+        shard_dir = pathlib.Path(
+            tempfile.mkdtemp(
+                prefix=f"{sample_id or patient_id}_shards_", dir=pathlib.Path.cwd()
+            )
         )
-        p2 = run_cmd(cmd)
+        try:
+            maf_shards = shard_maf(gbcms_input_maf, shard_dir, shard_by, shards)
+        except (OSError, ValueError) as e:
+            logger.error(
+                "genotype_variants:small_variants:generate:: Could not split %s into shards due to error, %s",
+                input_maf,
+                e,
+            )
+            exit(1)
+    else:
+        shard_dir = None
+        maf_shards = [(None, gbcms_input_maf, None)]
+    number_of_jobs = len(groups) * len(maf_shards)
+    max_workers = None
+    if concurrent:
+        job_threads = split_threads(threads, number_of_jobs)
+    elif shard_by:
+        # the shards of a BAM type run together, one BAM type after the other
+        job_threads = split_threads(threads, len(maf_shards)) * len(groups)
+        max_workers = len(maf_shards)
+    else:
+        job_threads = [threads] * number_of_jobs
+    if concurrent or shard_by:
         logger.info(
-            "small_variants: Done running gbcms on %s and data has been written to %s",
-            duplex_bam,
-            duplex_output_maf,
+            "small_variants: GetBaseCountMultiSample -> Running %s jobs %s at a time with threads: %s",
+            number_of_jobs,
+            max_workers or number_of_jobs,
+            ", ".join(str(t) for t in job_threads),
         )
+    jobs = []
+    job_bams = {}
+    job_bam_types = {}
+    job_mafs = {}
+    job_outputs = {}
+    job_keys = {}
+    shard_outputs = {btype: [] for btype, _ in bams}
+    combined_mafs = []
+    job_threads = iter(job_threads)
+    for group in groups:
+        for shard_label, shard_input_maf, row_indices in maf_shards:
+            output_dir = pipe_dir or genotyped_dir
+            if shard_label:
+                output_dir = shard_dir / shard_label
+                output_dir.mkdir(exist_ok=True)
+            if len(group) == 1:
+                btype, bam = group[0]
+                (cmd, output_maf) = generate_gbcms_cmd(
+                    shard_input_maf,
+                    btype,
+                    reference_fasta,
+                    gbcms_cmd,
+                    patient_id,
+                    bam,
+                    filter_duplicate,
+                    fragment_count,
+                    mapping_quality,
+                    next(job_threads),
+                    sample_id,
+                    output_dir,
+                )
+                group_mafs = {btype: output_maf}
+                labelled_bams = [(sample_id or patient_id, bam)]
+                job_output = output_maf
+            else:
+                btype = "-".join(group_btype for group_btype, _ in group)
+                (cmd, combined_maf, split_mafs) = generate_multi_bam_gbcms_cmd(
+                    shard_input_maf,
+                    group,
+                    reference_fasta,
+                    gbcms_cmd,
+                    patient_id,
+                    filter_duplicate,
+                    fragment_count,
+                    mapping_quality,
+                    next(job_threads),
+                    sample_id,
+                    output_dir,
+                )
+                combined_mafs.append((combined_maf, split_mafs))
+                group_mafs = dict(
+                    zip((group_btype for group_btype, _ in group), split_mafs.values())
+                )
+                labelled_bams = list(zip(split_mafs, (bam for _, bam in group)))
+                job_output = combined_maf
+            label = f"{btype}-{shard_label}" if shard_label else btype
+            jobs.append((label, cmd))
+            job_bams[label] = [bam for _, bam in group]
+            job_bam_types[label] = [group_btype for group_btype, _ in group]
+            job_mafs[label] = (shard_input_maf, row_indices)
+            job_outputs[label] = job_output
+            if cache_dir:
+                job_keys[label] = gbcms_cache_key(
+                    shard_input_maf,
+                    labelled_bams,
+                    btype != "STANDARD",
+                    reference_fasta,
+                    counting_backend_program(counting_backend, gbcms_path),
+                    filter_duplicate,
+                    fragment_count,
+                    mapping_quality,
+                )
+            for group_btype, output_maf in group_mafs.items():
+                shard_outputs[group_btype].append((output_maf, row_indices))
 
-    if simplex_bam:
-        btype = "SIMPLEX"
-        (cmd, simplex_output_maf) = generate_gbcms_cmd(
-            input_maf,
-            btype,
-            reference_fasta,
-            gbcms_path,
-            patient_id,
-            simplex_bam,
-            filter_duplicate,
-            fragment_count,
-            mapping_quality,
-            threads,
-            sample_id,
+    if cache_dir:
+        jobs = fetch_cached_jobs(cache_dir, jobs, job_keys, job_outputs)
+    if pipeline:
+        keep_mafs = {}
+        if keep_intermediates:
+            keep_mafs = {
+                label: pathlib.Path.cwd() / output_maf.name
+                for label, output_maf in job_outputs.items()
+            }
+        results, _ = run_pipelined_jobs(
+            jobs,
+            job_outputs,
+            pipeline,
+            keep_mafs,
+            timeout=timeout * 60 if timeout else None,
+        )
+    else:
+        results = run_gbcms_jobs(
+            jobs,
+            concurrent or bool(shard_by),
+            max_workers,
+            timeout=timeout * 60 if timeout else None,
+        )
+    if cache_dir:
+        store_cached_jobs(
+            cache_dir, results, job_keys, job_outputs, cache_max_size * 1024**3
+        )
+    if run_report:
+        variant_count = None if shard_by else count_maf_variants(gbcms_input_maf)
+        records = []
+        for label, result in results.items():
+            job_maf, row_indices = job_mafs[label]
+            records.append(
+                create_run_record(
+                    label,
+                    result,
+                    job_maf,
+                    job_bams[label],
+                    len(row_indices) if shard_by else variant_count,
+                )
+            )
+        write_run_report(run_report, records)
+    if is_recording():
+        variant_count = None if shard_by else count_maf_variants(gbcms_input_maf)
+        record_gbcms_runs(
+            results,
+            job_bam_types,
+            {
+                label: len(job_mafs[label][1]) if shard_by else variant_count
+                for label in results
+            },
+        )
+    failed = failed_jobs(results)
+    if failed:
+        logger.error(
+            "genotype_variants:small_variants:generate:: GetBaseCountMultiSample failed for BAM type(s): %s",
+            ", ".join(failed),
         )
-        p3 = run_cmd(cmd)
+        if shard_dir:
+            logger.error(
+                "genotype_variants:small_variants:generate:: shards are kept in %s",
+                shard_dir,
+            )
+        if pipeline:
+            logger.error(
+                "genotype_variants:small_variants:generate:: the genotyped MAF files read by the pipeline are incomplete",
+            )
+        exit(1)
+    for combined_maf, split_mafs in combined_mafs:
+        split_multi_bam_maf(combined_maf, split_mafs)
+        os.remove(combined_maf)
+    # Put the genotyped shards back together in the order of the input MAF
+    output_mafs = {}
+    for btype, outputs in shard_outputs.items():
+        if not outputs:
+            output_maf = None
+        elif shard_by:
+            output_maf = (genotyped_dir or pathlib.Path.cwd()) / outputs[0][0].name
+            try:
+                concat_shard_mafs(outputs, output_maf)
+            except (OSError, ValueError) as e:
+                logger.error(
+                    "genotype_variants:small_variants:generate:: Could not put the %s shards back together due to error, %s",
+                    btype,
+                    e,
+                )
+                exit(1)
+        elif pipeline:
+            output_maf = keep_mafs.get(btype)
+        else:
+            output_maf = outputs[0][0]
+        output_mafs[btype] = output_maf
+    if pipe_dir:
+        shutil.rmtree(pipe_dir)
+    if shard_dir:
+        shutil.rmtree(shard_dir)
+    # Splice the genotyped delta into the previous genotyped MAF files
+    if incremental_from:
+        for btype, _ in bams:
+            output_maf = (
+                pathlib.Path.cwd() / f"{sample_id or patient_id}-{btype}_genotyped.maf"
+            )
+            try:
+                splice_genotyped_maf(
+                    input_maf, previous_mafs[btype], output_mafs[btype], output_maf
+                )
+            except (OSError, ValueError) as e:
+                logger.error(
+                    "genotype_variants:small_variants:generate:: Could not splice the genotyped variants for %s due to error, %s",
+                    btype,
+                    e,
+                )
+                exit(1)
+            output_mafs[btype] = output_maf
+        shutil.rmtree(genotyped_dir)
+    if scratch_dir:
+        shutil.rmtree(scratch_dir)
+    for btype, bam in bams:
         logger.info(
             "small_variants: Done running gbcms on %s and data has been written to %s",
-            simplex_bam,
-            simplex_output_maf,
+            bam,
+            output_mafs[btype] or "the pipeline",
         )
 
     logger.info("small_variants: Completed processing based on the given instructions")
@@ -305,7 +731,11 @@ def generate(
     logger.info("Elapsed time: %.1f [min]" % ((t1_stop - t1_start) / 60))
     logger.info("CPU process time: %.1f [min]" % ((t2_stop - t2_start) / 60))
     logger.info("--------------------------------------------------")
-    return (std_output_maf, simplex_output_maf, duplex_output_maf)
+    return (
+        output_mafs.get("STANDARD"),
+        output_mafs.get("SIMPLEX"),
+        output_mafs.get("DUPLEX"),
+    )
 
 
 @click_log.simple_verbosity_option(logger)
@@ -321,6 +751,7 @@ def generate_gbcms_cmd(
     mapping_quality: int,
     threads: int,
     sample_id: str = None,
+    output_dir: pathlib.Path = None,
 ) -> tuple[str, pathlib.Path]:
     """Generate command for GetBaseCountMultiSample.
 
@@ -336,11 +767,15 @@ def generate_gbcms_cmd(
         mapping_quality: Minimum mapping quality
         threads: Number of threads to use
         sample_id: Sample ID (defaults to patient_id if not provided)
+        output_dir: Path to output directory (defaults to the current working directory)
 
     Returns:
         tuple: (command_string, output_maf_path)
     """
-    if not all([input_maf, btype, reference_fasta, gbcms_path, patient_id, bam]):
+    # the ``all`` command below shadows the builtin, so check each value explicitly
+    if not (
+        input_maf and btype and reference_fasta and gbcms_path and patient_id and bam
+    ):
         raise ValueError("Missing required arguments")
 
     # Use provided sample_id or fall back to patient_id
@@ -353,7 +788,8 @@ def generate_gbcms_cmd(
         )
 
     # Prepare output filename
-    output_maf = pathlib.Path.cwd() / f"{sample_id}-{btype}_genotyped.maf"
+    output_dir = pathlib.Path(output_dir) if output_dir else pathlib.Path.cwd()
+    output_maf = output_dir / f"{sample_id}-{btype}_genotyped.maf"
 
     # Build command components
     cmd_parts = [
@@ -380,136 +816,348 @@ def generate_gbcms_cmd(
     return cmd, output_maf
 
 
-# Merge
-@cli.command()
-@click.option(
-    "-i",
-    "--input-maf",
-    required=False,
-    type=click.Path(exists=True),
-    help="Full path to small variants input file in MAF format used for input to GBCMS for generating genotypes",
-)
-@click.option(
-    "-std",
-    "--input-standard-maf",
-    required=False,
-    type=click.Path(exists=True),
-    help="Full path to small variants input file in MAF format generated by GBCMS for standard_bam",
-)
-@click.option(
-    "-d",
-    "--input-duplex-maf",
-    required=False,
-    type=click.Path(exists=True),
-    help="Full path to small variants input file in MAF format generated by GBCMS for duplex_bam",
-)
-@click.option(
-    "-s",
-    "--input-simplex-maf",
-    required=False,
-    type=click.Path(exists=True),
-    help="Full path to small variants input file in MAF format generated by GBCMS for simplex_bam",
-)
-@click.option(
-    "-p",
-    "--patient-id",
-    required=False,
-    type=click.STRING,
-    help="Alphanumeric string indicating patient identifier",
-)
-@click_log.simple_verbosity_option(logger)
-def merge(
-    patient_id,
-    input_maf,
-    input_standard_maf,
-    input_duplex_maf,
-    input_simplex_maf,
-    sample_id,
-    tumor_name_override,
-):
-    """
-    Given original input MAF used as an input for GBCMS along with
-    GBCMS generated output MAF for standard_bam, duplex_bam or simplex bam,
-    Merge them into a single output MAF format.
-    If both duplex_bam and simplex_bam based MAF are provided
-    the program will generate merged genotypes as well.
-    The output file will be based on the give alphanumeric patient identifier as prefix, or sample identifier.
-    Sample identifier is prioritized over patient identifier.
-    """
-    pid = os.getpid()
-    logger_file = "genotype_variants_" + str(pid) + ".log"
-    logger_output = pathlib.Path.cwd().joinpath(logger_file)
-    fh = logging.FileHandler(logger_output)
-    formatter = logging.Formatter(
-        fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%m/%d/%Y %I:%M:%S %p",
-    )
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
-    logger.info(
-        "========================================================================"
-    )
-    logger.info(
-        ">>> Running genotype_variants for small variants to merge MAF output <<<"
-    )
-    logger.info(
-        "========================================================================"
-    )
-    t1_start = time.perf_counter()
-    t2_start = time.process_time()
+def generate_multi_bam_gbcms_cmd(
+    input_maf: str,
+    bams: list,
+    reference_fasta: str,
+    gbcms_path: str,
+    patient_id: str,
+    filter_duplicate: bool,
+    fragment_count: int,
+    mapping_quality: int,
+    threads: int,
+    sample_id: str = None,
+    output_dir: pathlib.Path = None,
+) -> tuple[str, pathlib.Path, dict]:
+    """Generate one GetBaseCountMultiSample command for several BAM files.
 
-    number_of_variables = 0
-    for status in (input_maf, input_standard_maf, input_duplex_maf, input_simplex_maf):
-        if status:
-            number_of_variables += 1
-    if number_of_variables >= 2:
-        pass
+    The reference FASTA and the input MAF are loaded once for all the BAM
+    files. Each BAM file is labelled as ``<sample_id>-<btype>`` so that the
+    combined output can be split back into the per BAM type MAF files that
+    ``merge`` expects, see ``split_multi_bam_maf``. All the BAM files must
+    share the same counting mode, ``--generic_counting`` is added when none
+    of them is a STANDARD BAM.
+
+    Args:
+        input_maf: Path to input MAF file
+        bams: list of (btype, bam) tuples
+        reference_fasta: Path to reference FASTA file
+        gbcms_path: Path to GetBaseCountMultiSample executable
+        patient_id: Patient ID
+        filter_duplicate: Whether to filter duplicates
+        fragment_count: Fragment count threshold
+        mapping_quality: Minimum mapping quality
+        threads: Number of threads to use
+        sample_id: Sample ID (defaults to patient_id if not provided)
+        output_dir: Path to output directory (defaults to the current working directory)
+
+    Returns:
+        tuple: (command_string, combined_output_maf_path, {label: output_maf_path})
+    """
+    if not (input_maf and bams and reference_fasta and gbcms_path and patient_id):
+        raise ValueError("Missing required arguments")
+    generic_counting = {btype != "STANDARD" for btype, _ in bams}
+    if len(generic_counting) != 1:
+        raise ValueError(
+            "STANDARD and generic counting BAM files cannot be genotyped together"
+        )
+
+    # Use provided sample_id or fall back to patient_id
+    sample_id = sample_id or patient_id
+    if sample_id == patient_id:
+        logger.warning(
+            "genotype_variants:small_variants:generate_gbcms: "
+            "No Sample ID provided, using Patient ID: %s",
+            patient_id,
+        )
+
+    # Prepare output filenames
+    output_dir = pathlib.Path(output_dir) if output_dir else pathlib.Path.cwd()
+    btypes = "-".join(btype for btype, _ in bams)
+    combined_maf = output_dir / f"{sample_id}-{btypes}_combined_genotyped.maf"
+    output_mafs = {}
+    for btype, _ in bams:
+        label = f"{sample_id}-{btype}"
+        output_mafs[label] = output_dir / f"{label}_genotyped.maf"
+
+    cmd = generate_batch_gbcms_cmd(
+        input_maf,
+        [(label, bam) for (_, bam), label in zip(bams, output_mafs)],
+        generic_counting.pop(),
+        reference_fasta,
+        gbcms_path,
+        filter_duplicate,
+        fragment_count,
+        mapping_quality,
+        threads,
+        combined_maf,
+    )
+    return cmd, combined_maf, output_mafs
+
+
+def generate_batch_gbcms_cmd(
+    input_maf: str,
+    labelled_bams: list,
+    generic_counting: bool,
+    reference_fasta: str,
+    gbcms_path: str,
+    filter_duplicate: bool,
+    fragment_count: int,
+    mapping_quality: int,
+    threads: int,
+    output_maf: pathlib.Path,
+) -> str:
+    """Generate a GetBaseCountMultiSample command for a batch of BAM files.
+
+    Args:
+        input_maf: Path to input MAF file
+        labelled_bams: list of (label, bam) tuples, the label is used as the
+            sample name of the BAM file in the output
+        generic_counting: Whether to use generic counting
+        reference_fasta: Path to reference FASTA file
+        gbcms_path: Path to GetBaseCountMultiSample executable
+        filter_duplicate: Whether to filter duplicates
+        fragment_count: Fragment count threshold
+        mapping_quality: Minimum mapping quality
+        threads: Number of threads to use
+        output_maf: Path to the combined output MAF file
+
+    Returns:
+        str: command_string
+    """
+    # Build command components
+    cmd_parts = [str(gbcms_path)]
+    for label, bam in labelled_bams:
+        cmd_parts.append(f"--bam {label}:{bam}")
+    cmd_parts += [
+        f"--filter_duplicate {int(filter_duplicate)}",
+        f"--fragment_count {fragment_count}",
+        f"--maf {input_maf}",
+        f"--maq {mapping_quality}",
+        "--omaf",
+        f"--output {output_maf}",
+        f"--fasta {reference_fasta}",
+        f"--thread {threads}",
+    ]
+    if generic_counting:
+        cmd_parts.append("--generic_counting")
+
+    cmd = " ".join(cmd_parts)
+
+    logger.debug("Generated multi BAM GBCMS command: %s", cmd)
+    return cmd
+
+
+def split_multi_bam_maf(combined_maf, output_mafs):
+    """Split the output of a multi BAM GetBaseCountMultiSample run.
+
+    Rows are assigned to the BAM they were counted on by the
+    Tumor_Sample_Barcode label given in the ``--bam`` argument and values
+    are passed through as text. The split files have the columns and counts
+    of a single BAM run, but Tumor_Sample_Barcode is the label of the BAM,
+    such as ``<sample>-DUPLEX``, in place of the sample id.
+
+    Args:
+        combined_maf: Path to MAF written by the multi BAM run
+        output_mafs: dict of label -> output MAF path
+    """
+    combined = read_maf(combined_maf, text=True)
+    for label, output_maf in output_mafs.items():
+        combined[combined["Tumor_Sample_Barcode"] == label].to_csv(
+            output_maf, sep="\t", index=False
+        )
+        logger.debug(
+            "genotype_variants:small_variants:split_multi_bam_maf:: genotyped data for %s has been written to %s",
+            label,
+            output_maf,
+        )
+
+
+# Merge
+@cli.command()
+@click.option(
+    "-i",
+    "--input-maf",
+    required=False,
+    type=click.Path(exists=True, allow_dash=True),
+    help="Full path to small variants input file in MAF, Parquet or Feather format used for input to GBCMS for generating genotypes, - to read MAF from standard input",
+)
+@click.option(
+    "-std",
+    "--input-standard-maf",
+    required=False,
+    type=click.Path(exists=True),
+    help="Full path to small variants input file in MAF, Parquet or Feather format generated by GBCMS for standard_bam",
+)
+@click.option(
+    "-d",
+    "--input-duplex-maf",
+    required=False,
+    type=click.Path(exists=True),
+    help="Full path to small variants input file in MAF, Parquet or Feather format generated by GBCMS for duplex_bam",
+)
+@click.option(
+    "-s",
+    "--input-simplex-maf",
+    required=False,
+    type=click.Path(exists=True),
+    help="Full path to small variants input file in MAF, Parquet or Feather format generated by GBCMS for simplex_bam",
+)
+@click.option(
+    "-p",
+    "--patient-id",
+    required=False,
+    type=click.STRING,
+    help="Alphanumeric string indicating patient identifier",
+)
+@click.option(
+    "-si",
+    "--sample-id",
+    required=False,
+    type=click.STRING,
+    help="Override default sample name",
+)
+@click.option(
+    "-to",
+    "--tumor_name_override",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Override the MAF Tumor_Sample_Barcode name with the BAM Tumor Sample Barcode",
+)
+@click.option(
+    "-o",
+    "--output-maf",
+    required=False,
+    type=click.Path(dir_okay=False, allow_dash=True),
+    help="Full path to write the merged MAF to instead of the default file name, - to write it to standard output",
+)
+@click.option(
+    "--streaming",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Merge the MAF files in batches of --batch-size records so the memory used does not grow with the number of variants, the genotyped MAF files need to have the variants in the order of the input MAF as written by GBCMS",
+)
+@click.option(
+    "--batch-size",
+    required=False,
+    type=click.IntRange(min=1),
+    default=100000,
+    show_default=True,
+    help="Number of records merged at a time with --streaming",
+)
+@click.option(
+    "--output-format",
+    required=False,
+    type=click.Choice(OUTPUT_FORMATS),
+    default="maf",
+    show_default=True,
+    help="Format of the merged output files, bgzip is MAF text compressed as BGZF, parquet and feather keep the column types and need pyarrow",
+)
+@click.option(
+    "--compression-threads",
+    required=False,
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of threads compressing the merged output files with --output-format bgzip",
+)
+@click.option(
+    "--low-memory",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Merge by adding the new count columns to the MAF data frames in place instead of merging copies of them, to lower the memory used",
+)
+@click.option(
+    "--summary-fields",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Add a summary_fragment_<assay> column, DP=..;RD=..;AD=..;VF=.., for each of the standard, simplex, duplex and simplex duplex fragment counts in the merged output files",
+)
+@click_log.simple_verbosity_option(logger)
+@count_sample
+def merge(
+    patient_id,
+    input_maf,
+    input_standard_maf,
+    input_duplex_maf,
+    input_simplex_maf,
+    sample_id,
+    tumor_name_override,
+    output_maf=None,
+    streaming=False,
+    batch_size=100000,
+    output_format="maf",
+    compression_threads=4,
+    low_memory=False,
+    summary_fields=False,
+):
+    """
+    Given original input MAF used as an input for GBCMS along with
+    GBCMS generated output MAF for standard_bam, duplex_bam or simplex bam,
+    Merge them into a single output MAF format.
+    If both duplex_bam and simplex_bam based MAF are provided
+    the program will generate merged genotypes as well.
+    The output file will be based on the give alphanumeric patient identifier as prefix, or sample identifier.
+    Sample identifier is prioritized over patient identifier.
+    """
+    from genotype_variants.generate_summary_field import add_summary_fields
+    from genotype_variants.stream_merge import (
+        merge_label,
+        merge_maf_dataframes,
+        stream_merge,
+    )
+
+    add_log_file_handler()
+    logger.info(
+        "========================================================================"
+    )
+    logger.info(
+        ">>> Running genotype_variants for small variants to merge MAF output <<<"
+    )
+    logger.info(
+        "========================================================================"
+    )
+    t1_start = time.perf_counter()
+    t2_start = time.process_time()
+
+    number_of_variables = 0
+    for status in (input_maf, input_standard_maf, input_duplex_maf, input_simplex_maf):
+        if status:
+            number_of_variables += 1
+    if number_of_variables >= 2:
+        pass
     else:
         logger.error(
             "genotype_variants:small_variants:merge:: At least two MAF input need to be provided for us to merge."
         )
         exit(1)
-    o_maf, i_maf, d_maf, s_maf = None, None, None, None
     if input_maf:
         logger.info(
             "genotype_variants:small_variants:merge:: Original MAF -> %s", input_maf
         )
-        o_maf = pd.read_csv(input_maf, sep="\t", header="infer", index_col=False)
     if input_standard_maf:
         logger.info(
             "genotype_variants:small_variants:merge:: STANDARD BAM MAF -> %s",
             input_standard_maf,
         )
-
         create_empty_maf_if_missing(input_standard_maf)
-
-        i_maf = pd.read_csv(
-            input_standard_maf, sep="\t", header="infer", index_col=False
-        )
     if input_duplex_maf:
-
         create_empty_maf_if_missing(input_duplex_maf)
-
-        d_maf = pd.read_csv(input_duplex_maf, sep="\t", header="infer", index_col=False)
         logger.info(
             "genotype_variants:small_variants:merge:: DUPLEX BAM MAF -> %s",
             input_duplex_maf,
         )
     if input_simplex_maf:
-
         create_empty_maf_if_missing(input_simplex_maf)
-
-        s_maf = pd.read_csv(
-            input_simplex_maf, sep="\t", header="infer", index_col=False
-        )
         logger.info(
             "genotype_variants:small_variants:merge:: SIMPLEX BAM MAF -> %s",
             input_simplex_maf,
         )
 
-    # generate duplex simplex data frame
-    ds_maf = None
-
     # base outfile path either provided sample name or patient id
     if not (patient_id or sample_id):
         logger.error(
@@ -522,150 +1170,548 @@ def merge(
         bam_id = sample_id
     logger.info("small_variants: ID: %s", bam_id)
     outfile = bam_id
-    if d_maf is not None and s_maf is not None:
-        ds_maf = cdsd(s_maf, d_maf)
-        if tumor_name_override:
-            ds_maf["Tumor_Sample_Barcode"] = bam_id
-        file_name = pathlib.Path.cwd().joinpath(
-            outfile + "-SIMPLEX-DUPLEX" + "_genotyped.maf"
+    try:
+        require_pyarrow(output_format)
+        if streaming and output_format not in TEXT_FORMATS:
+            raise ValueError(
+                "--streaming writes MAF files only, bgzip compressed or not"
+            )
+    except ValueError as e:
+        logger.error("genotype_variants:small_variants:merge:: %s", e)
+        exit(1)
+    suffix = "_genotyped" + OUTPUT_SUFFIXES[output_format]
+
+    # the merged MAF goes to --output-maf, the simplex duplex MAF as well
+    # when it is the only output
+    label = merge_label(
+        input_maf, input_standard_maf, input_duplex_maf, input_simplex_maf
+    )
+    ds_file_name, file_name = None, None
+    if input_duplex_maf and input_simplex_maf:
+        ds_file_name = pathlib.Path.cwd().joinpath(outfile + "-SIMPLEX-DUPLEX" + suffix)
+        if output_maf and not label:
+            ds_file_name = output_maf
+    if label:
+        file_name = output_maf or pathlib.Path.cwd().joinpath(
+            outfile + "-" + label + suffix
         )
-        write_csv(file_name, ds_maf)
-
-    # generate data frame based on satisfying conditions
-    file_name = None
-    (df_o_s_ds, df_o_s, df_s_ds, df_s_ds) = None, None, None, None
-    if o_maf is not None and i_maf is not None and ds_maf is not None:
-        df_o_s_ds = camd(o_maf, i_maf, ds_maf)
-        if tumor_name_override:
-            df_o_s_ds["Tumor_Sample_Barcode"] = bam_id
-        file_name = pathlib.Path.cwd().joinpath(
-            outfile + "-ORG-STD-SIMPLEX-DUPLEX" + "_genotyped.maf"
+
+    if streaming:
+        try:
+            records = stream_merge(
+                input_maf,
+                input_standard_maf,
+                input_duplex_maf,
+                input_simplex_maf,
+                simplex_duplex_maf=ds_file_name,
+                merged_maf=file_name,
+                tumor_sample_barcode=bam_id if tumor_name_override else None,
+                batch_size=batch_size,
+                output_format=output_format,
+                threads=compression_threads,
+                summary_fields=summary_fields,
+            )
+        except ValueError as e:
+            logger.error(
+                "genotype_variants:small_variants:merge:: could not merge in batches, due to error: %s",
+                e,
+            )
+            exit(1)
+        for output in (ds_file_name, file_name):
+            if output:
+                logger.info(
+                    "genotype_variants:small_variants:merge:: merged %s genotyped records in batches of %s into %s",
+                    records,
+                    batch_size,
+                    output,
+                )
+    else:
+        o_maf, i_maf, d_maf, s_maf = None, None, None, None
+        with stage("read"):
+            if input_maf:
+                o_maf = read_maf(input_maf)
+            if input_standard_maf:
+                # only the counts are merged into the original MAF
+                i_maf = read_maf(
+                    input_standard_maf,
+                    GENOTYPED_COLUMNS if input_maf else None,
+                    genotyped=True,
+                )
+            if input_duplex_maf:
+                d_maf = read_maf(input_duplex_maf, GENOTYPED_COLUMNS, genotyped=True)
+            if input_simplex_maf:
+                s_maf = read_maf(input_simplex_maf, genotyped=True)
+
+        # generate duplex simplex data frame and the data frame based on satisfying conditions
+        ds_maf, merged_maf, _ = merge_maf_dataframes(
+            o_maf, i_maf, d_maf, s_maf, low_memory=low_memory
         )
-        write_csv(file_name, df_o_s_ds)
-    elif o_maf is not None and i_maf is not None:
-        df_o_s = camd(o_maf, i_maf, None)
-        if tumor_name_override:
-            df_o_s["Tumor_Sample_Barcode"] = bam_id
-        file_name = pathlib.Path.cwd().joinpath(outfile + "-ORG-STD" + "_genotyped.maf")
-        write_csv(file_name, df_o_s)
-    elif o_maf is not None and ds_maf is not None:
-        df_o_ds = camd(o_maf, None, ds_maf)
-        if tumor_name_override:
-            df_o_ds["Tumor_Sample_Barcode"] = bam_id
-        file_name = pathlib.Path.cwd().joinpath(
-            outfile + "-ORG-SIMPLEX-DUPLEX" + "_genotyped.maf"
+        with stage("write"):
+            for df, output in ((ds_maf, ds_file_name), (merged_maf, file_name)):
+                if df is not None:
+                    if tumor_name_override:
+                        df["Tumor_Sample_Barcode"] = bam_id
+                    if summary_fields:
+                        add_summary_fields(df)
+                    write_csv(output, df, output_format, compression_threads)
+    t1_stop = time.perf_counter()
+    t2_stop = time.process_time()
+    observe("genotype_variants_merge_duration_seconds", t1_stop - t1_start)
+    logger.info("--------------------------------------------------")
+    logger.info("Elapsed time: %.1f [min]" % ((t1_stop - t1_start) / 60))
+    logger.info("CPU process time: %.1f [min]" % ((t2_stop - t2_start) / 60))
+    logger.info("--------------------------------------------------")
+    return file_name or ds_file_name
+
+
+def create_empty_maf_if_missing(filename):
+    import pandas as pd
+
+    if not os.path.exists(filename):
+        empty_df = pd.DataFrame(columns=MAF_COLUMNS)
+        empty_df.to_csv(filename, index=False, sep="\t")
+
+
+def write_csv(file_name, data_frame, output_format="maf", threads=1):
+    try:
+        write_maf(data_frame, file_name, output_format, threads)
+        logger.info(
+            "genotype_variants:small_variants:create_csv:: merged genotyped data has been written to %s",
+            file_name,
+        )
+    except:
+        e = sys.exc_info()[0]
+        logger.error(
+            "genotype_variants:small_variants:create_csv:: could not write to CSV file, due to error: %s",
+            e,
+        )
+        exit(1)
+
+
+def read_metadata(input_metadata):
+    """Read the metadata file in EXCEL format, falling back to TSV format"""
+    import pandas as pd
+
+    metadata = None
+    try:
+        metadata = pd.read_excel(input_metadata)
+    except:
+        e = sys.exc_info()[0]
+        logger.warning(
+            "genotype_variants:small_variants:read_metadata:: could not read to EXCEL file, due to error: %s",
+            e,
+        )
+        logger.warning(
+            "genotype_variants:small_variants:read_metadata:: Assuming its as TSV file"
+        )
+        pass
+    if metadata is None:
+        try:
+            metadata = pd.read_csv(input_metadata, sep="\t", header="infer")
+        except:
+            e = sys.exc_info()[0]
+            logger.error(
+                "genotype_variants:small_variants:read_metadata:: could not read TSV file, due to error: %s. Please fix and rerun the script",
+                e,
+            )
+            exit(1)
+    return metadata
+
+
+def write_tensor(tensor_dir, results, variants_maf=None):
+    """Write the cohort genotype tensor of the samples merged successfully,
+    return whether it was written"""
+    from genotype_variants.cohort_tensor import write_cohort_tensor
+
+    sample_mafs = [
+        (result["sample_id"], result["output"])
+        for result in results
+        if result["status"] == "success" and result["output"]
+    ]
+    try:
+        write_cohort_tensor(sample_mafs, tensor_dir, variants_maf)
+    except (OSError, ValueError) as e:
+        logger.error(
+            "genotype_variants:small_variants:write_tensor:: could not write the cohort tensor to %s, due to error: %s",
+            tensor_dir,
+            e,
+        )
+        return False
+    return True
+
+
+def metadata_file(metadata, column, ind):
+    """Path in the given column and row of the metadata if it is an existing file"""
+    import pandas as pd
+
+    if column in metadata.columns and pd.notnull(metadata[column][ind]):
+        if pathlib.Path(metadata[column][ind]).is_file():
+            return metadata[column][ind]
+    return None
+
+
+# All
+@cli.command()
+@click.option(
+    "-i",
+    "--input-maf",
+    required=True,
+    type=click.Path(exists=True),
+    help="Full path to small variants input file in MAF format",
+)
+@click.option(
+    "-r",
+    "--reference-fasta",
+    required=True,
+    type=click.Path(exists=True),
+    help="Full path to reference file in FASTA format",
+)
+@click.option(
+    "-p",
+    "--patient-id",
+    required=False,
+    type=click.STRING,
+    help="Alphanumeric string indicating patient identifier",
+)
+@click.option(
+    "-b",
+    "--standard-bam",
+    required=False,
+    type=click.Path(exists=True),
+    help="Full path to standard bam file, Note: This option assumes that the .bai file is present at same location as the bam file",
+)
+@click.option(
+    "-d",
+    "--duplex-bam",
+    required=False,
+    type=click.Path(exists=True),
+    help="Full path to duplex bam file, Note: This option assumes that the .bai file is present at same location as the bam file",
+)
+@click.option(
+    "-s",
+    "--simplex-bam",
+    required=False,
+    type=click.Path(exists=True),
+    help="Full path to simplex bam file, Note: This option assumes that the .bai file is present at same location as the bam file",
+)
+@click.option(
+    "-g",
+    "--gbcms-path",
+    required=False,
+    type=click.Path(exists=True),
+    help="Full path to GetBaseCountMultiSample executable with fragment support, required by the gbcms counting backend",
+)
+@click.option(
+    "-fd",
+    "--filter-duplicate",
+    required=False,
+    default=0,
+    type=click.INT,
+    help="Filter duplicate parameter for GetBaseCountMultiSample",
+)
+@click.option(
+    "-fc",
+    "--fragment-count",
+    required=False,
+    default=1,
+    type=click.INT,
+    help="Fragment Count parameter for GetBaseCountMultiSample",
+)
+@click.option(
+    "-mapq",
+    "--mapping-quality",
+    required=False,
+    default=20,
+    type=click.INT,
+    help="Mapping quality for GetBaseCountMultiSample",
+)
+@click.option(
+    "-t",
+    "--threads",
+    required=False,
+    default=1,
+    type=click.INT,
+    help="Number of threads to use for GetBaseCountMultiSample",
+)
+@click.option(
+    "-si",
+    "--sample-id",
+    required=False,
+    type=click.STRING,
+    help="Override default sample name",
+)
+@click.option(
+    "-to",
+    "--tumor_name_override",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Override the MAF Tumor_Sample_Barcode name with the BAM Tumor Sample Barcode",
+)
+@click.option(
+    "-c",
+    "--concurrent",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Run GetBaseCountMultiSample for the standard, duplex and simplex BAM files at the same time, splitting --threads between them",
+)
+@click.option(
+    "-mb",
+    "--multi-bam",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Genotype the duplex and simplex BAM files in a single GetBaseCountMultiSample process, the standard BAM file is run separately as it does not use generic counting",
+)
+@click.option(
+    "--timeout",
+    required=False,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Wall clock time in minutes after which a GetBaseCountMultiSample process is stopped and reported as failed",
+)
+@click.option(
+    "--shard-by",
+    required=False,
+    type=click.Choice(SHARD_BY),
+    help="Split the input MAF by chromosome or into --shards chunks of variants and genotype the shards in parallel, the genotyped shards are put back together in the order of the input MAF",
+)
+@click.option(
+    "--shards",
+    required=False,
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of chunks the input MAF is split into with --shard-by chunks",
+)
+@click.option(
+    "--run-report",
+    required=False,
+    type=click.Path(dir_okay=False, writable=True),
+    help="Append a JSON record with the wall time, CPU time, peak memory and I/O of every GetBaseCountMultiSample run to this file",
+)
+@click.option(
+    "-cb",
+    "--counting-backend",
+    required=False,
+    type=click.Choice(COUNTING_BACKENDS),
+    default="gbcms",
+    show_default=True,
+    help="Program counting the bases supporting each variant, either the GetBaseCountMultiSample executable given with --gbcms-path or the built in pysam engine with the same output",
+)
+@click.option(
+    "--incremental-from",
+    required=False,
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory with the genotyped MAF files of a previous run on the same BAM files, only the variants of the input MAF missing from them are genotyped and the rest of the genotypes are reused",
+)
+@click.option(
+    "--cache-dir",
+    required=False,
+    type=click.Path(file_okay=False, writable=True),
+    help="Directory to cache GetBaseCountMultiSample outputs in, a run with the same MAF, BAM, reference, GetBaseCountMultiSample and counting parameters as a cached one is skipped. The directory can be shared between concurrent jobs",
+)
+@click.option(
+    "--cache-max-size",
+    required=False,
+    type=click.FloatRange(min=0, min_open=True),
+    default=50,
+    show_default=True,
+    help="Maximum size of --cache-dir in GB, the least recently used outputs are removed beyond it",
+)
+@click.option(
+    "--output-format",
+    required=False,
+    type=click.Choice(OUTPUT_FORMATS),
+    default="maf",
+    show_default=True,
+    help="Format of the merged output files, bgzip is MAF text compressed as BGZF, parquet and feather keep the column types and need pyarrow",
+)
+@click.option(
+    "--compression-threads",
+    required=False,
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of threads compressing the merged output files with --output-format bgzip",
+)
+@click.option(
+    "--low-memory",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Merge by adding the new count columns to the MAF data frames in place instead of merging copies of them, to lower the memory used",
+)
+@click.option(
+    "--pipeline",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Merge the genotyped records in batches as GetBaseCountMultiSample writes them to named pipes on local scratch, instead of after the genotyped MAF files are written. Runs the BAM files at the same time and writes MAF files only, bgzip compressed or not",
+)
+@click.option(
+    "--keep-intermediates",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Also write the genotyped MAF file of each BAM file with --pipeline",
+)
+@click_log.simple_verbosity_option(logger)
+@count_sample
+def all(
+    input_maf,
+    reference_fasta,
+    gbcms_path,
+    patient_id,
+    standard_bam,
+    duplex_bam,
+    simplex_bam,
+    filter_duplicate,
+    fragment_count,
+    mapping_quality,
+    threads,
+    sample_id,
+    tumor_name_override,
+    concurrent=False,
+    multi_bam=False,
+    timeout=None,
+    run_report=None,
+    shard_by=None,
+    shards=4,
+    cache_dir=None,
+    cache_max_size=50,
+    incremental_from=None,
+    counting_backend="gbcms",
+    output_format="maf",
+    compression_threads=4,
+    low_memory=False,
+    pipeline=False,
+    keep_intermediates=False,
+):
+    """
+    Command that helps to generate genotyped MAF and
+    merge the genotyped MAF.
+    the output file will be labelled with
+    patient, or sample identifier as prefix. Sample identifier prioritized.
+    """
+    add_log_file_handler()
+    logger.info(
+        "========================================================================================"
+    )
+    logger.info(
+        ">>> Running genotype_variants for small variants to generate genotypes and merge MAF <<<"
+    )
+    logger.info(
+        "========================================================================================="
+    )
+    t1_start = time.perf_counter()
+    t2_start = time.process_time()
+    try:
+        require_pyarrow(output_format)
+        if pipeline and output_format not in TEXT_FORMATS:
+            raise ValueError(
+                "--pipeline writes MAF files only, bgzip compressed or not"
+            )
+        if pipeline and (multi_bam or shard_by or incremental_from or cache_dir):
+            raise ValueError(
+                "--pipeline can not be used with --multi-bam, --shard-by, --incremental-from or --cache-dir"
+            )
+    except ValueError as e:
+        logger.error("genotype_variants:small_variants:all:: %s", e)
+        exit(1)
+
+    # with --pipeline the genotyped MAF files are merged while they are written
+    merged = []
+
+    def merge_pipes(genotyped_mafs):
+        if "DUPLEX" in genotyped_mafs and "SIMPLEX" in genotyped_mafs:
+            merged.append(
+                pathlib.Path.cwd().joinpath(
+                    (sample_id or patient_id)
+                    + "-SIMPLEX-DUPLEX_genotyped"
+                    + OUTPUT_SUFFIXES[output_format]
+                )
+            )
+        merged.append(
+            merge.callback(
+                patient_id,
+                input_maf,
+                genotyped_mafs.get("STANDARD"),
+                genotyped_mafs.get("DUPLEX"),
+                genotyped_mafs.get("SIMPLEX"),
+                sample_id,
+                tumor_name_override,
+                streaming=True,
+                output_format=output_format,
+                compression_threads=compression_threads,
+            )
         )
-        write_csv(file_name, df_o_ds)
-    elif i_maf is not None and ds_maf is not None:
-        df_s_ds = camd(None, i_maf, ds_maf)
-        if tumor_name_override:
-            df_s_ds["Tumor_Sample_Barcode"] = bam_id
-        file_name = pathlib.Path.cwd().joinpath(
-            outfile + "-STD-SIMPLEX-DUPLEX" + "_genotyped.maf"
+
+    try:
+        (standard_maf, simplex_maf, duplex_maf) = generate.callback(
+            input_maf,
+            reference_fasta,
+            gbcms_path,
+            patient_id,
+            standard_bam,
+            duplex_bam,
+            simplex_bam,
+            filter_duplicate,
+            fragment_count,
+            mapping_quality,
+            threads,
+            sample_id,
+            concurrent=concurrent,
+            multi_bam=multi_bam,
+            timeout=timeout,
+            run_report=run_report,
+            shard_by=shard_by,
+            shards=shards,
+            cache_dir=cache_dir,
+            cache_max_size=cache_max_size,
+            incremental_from=incremental_from,
+            counting_backend=counting_backend,
+            pipeline=merge_pipes if pipeline else None,
+            keep_intermediates=keep_intermediates,
         )
-        write_csv(file_name, df_s_ds)
-    elif i_maf is not None and d_maf is not None:
-        pass
-    elif i_maf is not None and s_maf is not None:
-        pass
-    elif o_maf is not None and d_maf is not None:
-        pass
-    elif o_maf is not None and s_maf is not None:
-        pass
+    except SystemExit:
+        # a GetBaseCountMultiSample run failed after its records were merged
+        for output in merged:
+            pathlib.Path(output).unlink(missing_ok=True)
+        raise
+    if pipeline:
+        final_file = merged[-1]
     else:
-        file_name = pathlib.Path.cwd().joinpath(
-            outfile + "-SIMPLEX-DUPLEX" + "_genotyped.maf"
+        final_file = merge.callback(
+            patient_id,
+            input_maf,
+            standard_maf,
+            duplex_maf,
+            simplex_maf,
+            sample_id,
+            tumor_name_override,
+            output_format=output_format,
+            compression_threads=compression_threads,
+            low_memory=low_memory,
         )
-        if tumor_name_override:
-            ds_maf["Tumor_Sample_Barcode"] = bam_id
-        write_csv(file_name, ds_maf)
+
     t1_stop = time.perf_counter()
     t2_stop = time.process_time()
     logger.info("--------------------------------------------------")
     logger.info("Elapsed time: %.1f [min]" % ((t1_stop - t1_start) / 60))
     logger.info("CPU process time: %.1f [min]" % ((t2_stop - t2_start) / 60))
     logger.info("--------------------------------------------------")
-    return file_name
-
-
-def create_empty_maf_if_missing(filename):
-    header = [
-        "Hugo_Symbol",
-        "Entrez_Gene_Id",
-        "Center",
-        "NCBI_Build",
-        "Chromosome",
-        "Start_Position",
-        "End_Position",
-        "Strand",
-        "Variant_Classification",
-        "Variant_Type",
-        "Reference_Allele",
-        "Tumor_Seq_Allele1",
-        "Tumor_Seq_Allele2",
-        "dbSNP_RS",
-        "dbSNP_Val_Status",
-        "Tumor_Sample_Barcode",
-        "Matched_Norm_Sample_Barcode",
-        "Match_Norm_Seq_Allele1",
-        "Match_Norm_Seq_Allele2",
-        "Tumor_Validation_Allele1",
-        "Tumor_Validation_Allele2",
-        "Match_Norm_Validation_Allele1",
-        "Match_Norm_Validation_Allele2",
-        "Verification_Status",
-        "Validation_Status",
-        "Mutation_Status",
-        "Sequencing_Phase",
-        "Sequence_Source",
-        "Validation_Method",
-        "Score",
-        "BAM_File",
-        "Sequencer",
-        "t_ref_count",
-        "t_alt_count",
-        "n_ref_count",
-        "n_alt_count",
-        "Caller",
-        "t_total_count",
-        "t_variant_frequency",
-        "t_total_count_forward",
-        "t_ref_count_forward",
-        "t_alt_count_forward",
-        "t_total_count_fragment",
-        "t_ref_count_fragment",
-        "t_alt_count_fragment",
-    ]
-
-    if not os.path.exists(filename):
-        empty_df = pd.DataFrame(columns=header)
-        empty_df.to_csv(filename, index=False, sep="\t")
-
-
-def write_csv(file_name, data_frame):
-    try:
-        data_frame.to_csv(str(file_name), sep="\t", index=False)
-        logger.info(
-            "genotype_variants:small_variants:create_csv:: merged genotyped data has been written to %s",
-            file_name,
-        )
-    except:
-        e = sys.exc_info()[0]
-        logger.error(
-            "genotype_variants:small_variants:create_csv:: could not write to CSV file, due to error: %s",
-            e,
-        )
-        exit(1)
+    return final_file
 
 
-# All
+# Multiple Sample Process
 @cli.command()
 @click.option(
     "-i",
-    "--input-maf",
+    "--input-metadata",
     required=True,
     type=click.Path(exists=True),
-    help="Full path to small variants input file in MAF format",
+    help="Full path to metadata file in TSV/EXCEL format, with following headers: sample_id, maf, standard_bam, duplex_bam, simplex_bam. Make sure to use full paths inside the metadata file",
 )
 @click.option(
     "-r",
@@ -674,34 +1720,6 @@ def write_csv(file_name, data_frame):
     type=click.Path(exists=True),
     help="Full path to reference file in FASTA format",
 )
-@click.option(
-    "-p",
-    "--patient-id",
-    required=False,
-    type=click.STRING,
-    help="Alphanumeric string indicating patient identifier",
-)
-@click.option(
-    "-b",
-    "--standard-bam",
-    required=False,
-    type=click.Path(exists=True),
-    help="Full path to standard bam file, Note: This option assumes that the .bai file is present at same location as the bam file",
-)
-@click.option(
-    "-d",
-    "--duplex-bam",
-    required=False,
-    type=click.Path(exists=True),
-    help="Full path to duplex bam file, Note: This option assumes that the .bai file is present at same location as the bam file",
-)
-@click.option(
-    "-s",
-    "--simplex-bam",
-    required=False,
-    type=click.Path(exists=True),
-    help="Full path to simplex bam file, Note: This option assumes that the .bai file is present at same location as the bam file",
-)
 @click.option(
     "-g",
     "--gbcms-path",
@@ -742,97 +1760,444 @@ def write_csv(file_name, data_frame):
     help="Number of threads to use for GetBaseCountMultiSample",
 )
 @click.option(
-    "-si",
-    "--sample-id",
+    "-j",
+    "--jobs",
     required=False,
-    type=click.STRING,
-    help="Override default sample name",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of samples to process at the same time",
 )
 @click.option(
-    "-to",
-    "--tumor_name_override",
+    "-tt",
+    "--total-threads",
+    required=False,
+    type=click.IntRange(min=1),
+    help="Total number of threads to divide between the samples processed at the same time, overrides --threads",
+)
+@click.option(
+    "--timeout",
+    required=False,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Wall clock time in minutes after which a GetBaseCountMultiSample process is stopped and reported as failed",
+)
+@click.option(
+    "--run-report",
+    required=False,
+    type=click.Path(dir_okay=False, writable=True),
+    help="Append a JSON record with the wall time, CPU time, peak memory and I/O of every GetBaseCountMultiSample run to this file",
+)
+@click.option(
+    "--cache-dir",
+    required=False,
+    type=click.Path(file_okay=False, writable=True),
+    help="Directory to cache GetBaseCountMultiSample outputs in, a run with the same MAF, BAM, reference, GetBaseCountMultiSample and counting parameters as a cached one is skipped. The directory can be shared between concurrent jobs",
+)
+@click.option(
+    "--cache-max-size",
+    required=False,
+    type=click.FloatRange(min=0, min_open=True),
+    default=50,
+    show_default=True,
+    help="Maximum size of --cache-dir in GB, the least recently used outputs are removed beyond it",
+)
+@click.option(
+    "--output-format",
+    required=False,
+    type=click.Choice(OUTPUT_FORMATS),
+    default="maf",
+    show_default=True,
+    help="Format of the merged output files, bgzip is MAF text compressed as BGZF, parquet and feather keep the column types and need pyarrow",
+)
+@click.option(
+    "--compression-threads",
+    required=False,
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of threads compressing the merged output files with --output-format bgzip",
+)
+@click.option(
+    "--low-memory",
     required=False,
     is_flag=True,
     default=False,
-    help="Override the MAF Tumor_Sample_Barcode name with the BAM Tumor Sample Barcode",
+    help="Merge by adding the new count columns to the MAF data frames in place instead of merging copies of them, to lower the memory used",
+)
+@click.option(
+    "--tensor-dir",
+    required=False,
+    type=click.Path(file_okay=False, writable=True),
+    help="Also write the fragment counts of the merged MAF files of every sample as a memory-mapped cohort genotype tensor to this directory",
 )
 @click_log.simple_verbosity_option(logger)
-def all(
-    input_maf,
+def multiple_samples(
+    input_metadata,
     reference_fasta,
     gbcms_path,
-    patient_id,
-    standard_bam,
-    duplex_bam,
-    simplex_bam,
     filter_duplicate,
     fragment_count,
     mapping_quality,
     threads,
+    jobs,
+    total_threads,
+    timeout,
+    run_report,
+    cache_dir,
+    cache_max_size,
+    output_format="maf",
+    compression_threads=4,
+    low_memory=False,
+    tensor_dir=None,
+):
+    """
+    Command that helps to generate genotyped MAF and
+    merge the genotyped MAF for multiple samples.
+    the output file will be labelled with
+    patient identifier, or sample identifier as prefix.
+    Sample prioritized.
+
+    Expected header of metadata_file in any order:
     sample_id,
+    maf,
+    standard_bam,
+    duplex_bam,
+    simplex_bam
+
+    For maf, standard_bam, duplex_bam and simplex_bam please include full path to the file.
+    """
+    import pandas as pd
+
+    add_log_file_handler()
+    logger.info(
+        "========================================================================================"
+    )
+    logger.info(
+        ">>> Running genotype_variants for small variants to generate genotypes and merge MAF <<<"
+    )
+    logger.info(
+        "========================================================================================="
+    )
+    t1_start = time.perf_counter()
+    t2_start = time.process_time()
+    try:
+        require_pyarrow(output_format)
+    except ValueError as e:
+        logger.error("genotype_variants:small_variants:multiple_samples:: %s", e)
+        exit(1)
+    metadata = read_metadata(input_metadata)
+    if total_threads:
+        threads = split_threads(total_threads, jobs)[-1]
+        logger.info(
+            "genotype_variants:small_variants:multiple_samples:: Running %s samples at a time with %s threads each",
+            jobs,
+            threads,
+        )
+    samples = []
+    for ind in metadata.index:
+        sample_id = None
+        error = None
+        if pd.notnull(metadata["sample_id"][ind]):
+            sample_id = metadata["sample_id"][ind]
+        else:
+            error = "Sample id is not a string, please check input metadata file and try again."
+            sample_id = "row_" + str(ind + 1)
+        if pd.notnull(metadata["maf"][ind]):
+            if pathlib.Path(metadata["maf"][ind]).is_file():
+                input_maf = metadata["maf"][ind]
+            else:
+                error = (
+                    error
+                    or "Maf file to genotype variants is present but the path is invalid. Please provide a valid path"
+                )
+        else:
+            error = (
+                error or "Maf file to genotype variants is not present and is required."
+            )
+        if error:
+            logger.error(
+                "genotype_variants::small_variants::multiple_samples:: %s: %s",
+                sample_id,
+                error,
+            )
+            samples.append((sample_id, None, error))
+            continue
+        if pd.notnull(metadata["standard_bam"][ind]):
+            if pathlib.Path(metadata["standard_bam"][ind]).is_file():
+                standard_bam = metadata["standard_bam"][ind]
+            else:
+                standard_bam = None
+        else:
+            standard_bam = None
+            logger.info(
+                "genotype_variants::small_variants::multiple_samples:: Standard BAM file to genotype variants is not present."
+            )
+        if pd.notnull(metadata["duplex_bam"][ind]):
+            if pathlib.Path(metadata["duplex_bam"][ind]).is_file():
+                duplex_bam = metadata["duplex_bam"][ind]
+            else:
+                duplex_bam = None
+        else:
+            duplex_bam = None
+        if pd.notnull(metadata["simplex_bam"][ind]):
+            if pathlib.Path(metadata["simplex_bam"][ind]).is_file():
+                simplex_bam = metadata["simplex_bam"][ind]
+            else:
+                simplex_bam = None
+        else:
+            simplex_bam = None
+
+        if standard_bam or duplex_bam or simplex_bam:
+            logger.info(
+                "genotype_variants::small_variants::multiple_samples:: standard_bam, duplex_bam and simplex_bam are present for genotype variants."
+            )
+        else:
+            logger.warning(
+                "genotype_variants::small_variants::multiple_samples:: one of standard_bam, duplex_bam and simplex_bam is not present for genotype variants! Either the Standard BAM or the Duplex BAM and the Simplex BAM should be present for genotype variants."
+            )
+
+        logger.info(
+            "genotype_variants:small_variants::multiple_samples:: %s is being processed",
+            sample_id,
+        )
+        samples.append(
+            (
+                sample_id,
+                dict(
+                    input_maf=input_maf,
+                    reference_fasta=reference_fasta,
+                    gbcms_path=gbcms_path,
+                    patient_id=sample_id,
+                    standard_bam=standard_bam,
+                    duplex_bam=duplex_bam,
+                    simplex_bam=simplex_bam,
+                    filter_duplicate=filter_duplicate,
+                    fragment_count=fragment_count,
+                    mapping_quality=mapping_quality,
+                    threads=threads,
+                    sample_id=sample_id,
+                    tumor_name_override=False,
+                    timeout=timeout,
+                    run_report=run_report,
+                    cache_dir=cache_dir,
+                    cache_max_size=cache_max_size,
+                    output_format=output_format,
+                    compression_threads=compression_threads,
+                    low_memory=low_memory,
+                ),
+                None,
+            )
+        )
+    results = run_samples(samples, jobs, logger.getEffectiveLevel())
+    logger.info("--------------------------------------------------")
+    log_status_table(results)
+    status_file = pathlib.Path.cwd().joinpath(
+        "genotype_variants_" + str(os.getpid()) + "_status.tsv"
+    )
+    write_status_table(status_file, results)
+    logger.info(
+        "genotype_variants:small_variants:multiple_samples:: status of each sample has been written to %s",
+        status_file,
+    )
+    tensor_written = not tensor_dir or write_tensor(tensor_dir, results)
+    failed = [
+        result["sample_id"] for result in results if result["status"] != "success"
+    ]
+    t1_stop = time.perf_counter()
+    t2_stop = time.process_time()
+    logger.info("--------------------------------------------------")
+    logger.info("Elapsed time: %.1f [min]" % ((t1_stop - t1_start) / 60))
+    logger.info("CPU process time: %.1f [min]" % ((t2_stop - t2_start) / 60))
+    logger.info("--------------------------------------------------")
+    if failed:
+        logger.error(
+            "genotype_variants:small_variants:multiple_samples:: %s of %s samples did not complete: %s",
+            len(failed),
+            len(results),
+            ", ".join(str(sample_id) for sample_id in failed),
+        )
+        exit(1)
+    if not tensor_written:
+        exit(1)
+    return
+
+
+# Merge Batch
+@cli.command()
+@click.option(
+    "-i",
+    "--input-manifest",
+    required=True,
+    type=click.Path(exists=True),
+    help="Full path to manifest file in TSV/EXCEL format, with following headers: sample_id, maf, standard_maf, duplex_maf, simplex_maf. maf is the original MAF and the other columns the genotyped MAF files, make sure to use full paths inside the manifest file",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    required=False,
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of samples to merge at the same time",
+)
+@click.option(
+    "-to",
+    "--tumor_name_override",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Override the MAF Tumor_Sample_Barcode name with the sample identifier",
+)
+@click.option(
+    "--output-format",
+    required=False,
+    type=click.Choice(OUTPUT_FORMATS),
+    default="maf",
+    show_default=True,
+    help="Format of the merged output files, bgzip is MAF text compressed as BGZF, parquet and feather keep the column types and need pyarrow",
+)
+@click.option(
+    "--compression-threads",
+    required=False,
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of threads compressing the merged output files with --output-format bgzip",
+)
+@click.option(
+    "--low-memory",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Merge by adding the new count columns to the MAF data frames in place instead of merging copies of them, to lower the memory used",
+)
+@click_log.simple_verbosity_option(logger)
+def merge_batch(
+    input_manifest,
+    jobs,
     tumor_name_override,
+    output_format="maf",
+    compression_threads=4,
+    low_memory=False,
 ):
     """
-    Command that helps to generate genotyped MAF and
-    merge the genotyped MAF.
-    the output file will be labelled with
-    patient, or sample identifier as prefix. Sample identifier prioritized.
+    Command that helps to merge the genotyped MAF of many samples
+    in one process pool, the output files are the ones
+    of the merge command, labelled with the sample identifier as prefix.
+
+    Expected header of manifest_file in any order:
+    sample_id,
+    maf,
+    standard_maf,
+    duplex_maf,
+    simplex_maf
+
+    For maf, standard_maf, duplex_maf and simplex_maf please include full path to the file.
     """
-    pid = os.getpid()
-    logger_file = "genotype_variants_" + str(pid) + ".log"
-    logger_output = pathlib.Path.cwd().joinpath(logger_file)
-    fh = logging.FileHandler(logger_output)
-    formatter = logging.Formatter(
-        fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%m/%d/%Y %I:%M:%S %p",
-    )
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
+    import pandas as pd
+
+    add_log_file_handler()
     logger.info(
         "========================================================================================"
     )
     logger.info(
-        ">>> Running genotype_variants for small variants to generate genotypes and merge MAF <<<"
+        ">>> Running genotype_variants for small variants to merge the MAF of many samples <<<"
     )
     logger.info(
-        "========================================================================================="
+        "========================================================================================"
     )
     t1_start = time.perf_counter()
     t2_start = time.process_time()
-    (standard_maf, simplex_maf, duplex_maf) = generate.callback(
-        input_maf,
-        reference_fasta,
-        gbcms_path,
-        patient_id,
-        standard_bam,
-        duplex_bam,
-        simplex_bam,
-        filter_duplicate,
-        fragment_count,
-        mapping_quality,
-        threads,
-        sample_id,
+    try:
+        require_pyarrow(output_format)
+    except ValueError as e:
+        logger.error("genotype_variants:small_variants:merge_batch:: %s", e)
+        exit(1)
+    manifest = read_metadata(input_manifest)
+    if "sample_id" not in manifest.columns:
+        logger.error(
+            "genotype_variants:small_variants:merge_batch:: sample_id column is missing, please check input manifest file."
+        )
+        exit(1)
+
+    samples = []
+    for ind in manifest.index:
+        error = None
+        if pd.notnull(manifest["sample_id"][ind]):
+            sample_id = str(manifest["sample_id"][ind])
+        else:
+            error = "Sample id is not a string, please check input manifest file."
+            sample_id = "row_" + str(ind + 1)
+            logger.error(
+                "genotype_variants:small_variants:merge_batch:: %s: %s",
+                sample_id,
+                error,
+            )
+        columns = ["maf", "standard_maf", "duplex_maf", "simplex_maf"]
+        listed = [
+            column
+            for column in columns
+            if column in manifest.columns and pd.notnull(manifest[column][ind])
+        ]
+        mafs = {column: metadata_file(manifest, column, ind) for column in columns}
+        missing = [column for column in listed if mafs[column] is None]
+        if missing and not error:
+            error = "%s not present" % ", ".join(
+                str(manifest[column][ind]) for column in missing
+            )
+        samples.append(
+            (
+                sample_id,
+                dict(
+                    patient_id=sample_id,
+                    input_maf=mafs["maf"],
+                    input_standard_maf=mafs["standard_maf"],
+                    input_duplex_maf=mafs["duplex_maf"],
+                    input_simplex_maf=mafs["simplex_maf"],
+                    sample_id=sample_id,
+                    tumor_name_override=tumor_name_override,
+                    output_format=output_format,
+                    compression_threads=compression_threads,
+                    low_memory=low_memory,
+                ),
+                error,
+            )
+        )
+    logger.info(
+        "genotype_variants:small_variants:merge_batch:: Merging %s samples %s at a time",
+        len(samples),
+        jobs,
     )
-    final_file = merge.callback(
-        patient_id,
-        input_maf,
-        standard_maf,
-        duplex_maf,
-        simplex_maf,
-        sample_id,
-        tumor_name_override,
+    results = run_samples(samples, jobs, logger.getEffectiveLevel(), command="merge")
+    logger.info("--------------------------------------------------")
+    log_status_table(results)
+    status_file = pathlib.Path.cwd().joinpath(
+        "genotype_variants_" + str(os.getpid()) + "_status.tsv"
     )
-
+    write_status_table(status_file, results)
+    logger.info(
+        "genotype_variants:small_variants:merge_batch:: status of each sample has been written to %s",
+        status_file,
+    )
+    failed = [
+        result["sample_id"] for result in results if result["status"] != "success"
+    ]
     t1_stop = time.perf_counter()
     t2_stop = time.process_time()
     logger.info("--------------------------------------------------")
     logger.info("Elapsed time: %.1f [min]" % ((t1_stop - t1_start) / 60))
     logger.info("CPU process time: %.1f [min]" % ((t2_stop - t2_start) / 60))
     logger.info("--------------------------------------------------")
-    return final_file
+    if failed:
+        logger.error(
+            "genotype_variants:small_variants:merge_batch:: %s of %s samples did not complete: %s",
+            len(failed),
+            len(results),
+            ", ".join(str(sample_id) for sample_id in failed),
+        )
+        exit(1)
+    return status_file
 
 
-# Multiple Sample Process
+# Cohort
 @cli.command()
 @click.option(
     "-i",
@@ -885,10 +2250,73 @@ def all(
     required=False,
     default=1,
     type=click.INT,
-    help="Number of threads to use for GetBaseCountMultiSample",
+    help="Number of threads to use for each GetBaseCountMultiSample process",
+)
+@click.option(
+    "-bs",
+    "--batch-size",
+    required=False,
+    default=10,
+    type=click.IntRange(min=1),
+    help="Number of BAM files to genotype in a single GetBaseCountMultiSample process",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    required=False,
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of GetBaseCountMultiSample processes to run at the same time",
+)
+@click.option(
+    "-tt",
+    "--total-threads",
+    required=False,
+    type=click.IntRange(min=1),
+    help="Total number of threads to divide between the GetBaseCountMultiSample processes running at the same time, overrides --threads",
+)
+@click.option(
+    "--timeout",
+    required=False,
+    type=click.FloatRange(min=0, min_open=True),
+    help="Wall clock time in minutes after which a GetBaseCountMultiSample process is stopped and reported as failed",
+)
+@click.option(
+    "--run-report",
+    required=False,
+    type=click.Path(dir_okay=False, writable=True),
+    help="Append a JSON record with the wall time, CPU time, peak memory and I/O of every GetBaseCountMultiSample run to this file",
+)
+@click.option(
+    "--cache-dir",
+    required=False,
+    type=click.Path(file_okay=False, writable=True),
+    help="Directory to cache GetBaseCountMultiSample outputs in, a run with the same MAF, BAM, reference, GetBaseCountMultiSample and counting parameters as a cached one is skipped. The directory can be shared between concurrent jobs",
+)
+@click.option(
+    "--cache-max-size",
+    required=False,
+    type=click.FloatRange(min=0, min_open=True),
+    default=50,
+    show_default=True,
+    help="Maximum size of --cache-dir in GB, the least recently used outputs are removed beyond it",
+)
+@click.option(
+    "-ci",
+    "--cohort-id",
+    required=False,
+    default="cohort",
+    type=click.STRING,
+    help="Alphanumeric string used as prefix for the union MAF of the cohort",
+)
+@click.option(
+    "--tensor-dir",
+    required=False,
+    type=click.Path(file_okay=False, writable=True),
+    help="Also write the fragment counts of the merged MAF files of every sample as a memory-mapped cohort genotype tensor to this directory",
 )
 @click_log.simple_verbosity_option(logger)
-def multiple_samples(
+def cohort(
     input_metadata,
     reference_fasta,
     gbcms_path,
@@ -896,13 +2324,22 @@ def multiple_samples(
     fragment_count,
     mapping_quality,
     threads,
+    batch_size,
+    jobs,
+    total_threads,
+    cohort_id,
+    timeout,
+    run_report,
+    cache_dir,
+    cache_max_size,
+    tensor_dir=None,
 ):
     """
-    Command that helps to generate genotyped MAF and
-    merge the genotyped MAF for multiple samples.
-    the output file will be labelled with
-    patient identifier, or sample identifier as prefix.
-    Sample prioritized.
+    Command that helps to genotype every sample in the metadata file
+    at the union of the variants from all the MAF files in the metadata file,
+    and merge the genotyped MAF for each sample.
+    The union MAF is labelled with the cohort identifier as prefix,
+    the output files of each sample are labelled with the sample identifier as prefix.
 
     Expected header of metadata_file in any order:
     sample_id,
@@ -913,128 +2350,370 @@ def multiple_samples(
 
     For maf, standard_bam, duplex_bam and simplex_bam please include full path to the file.
     """
-    pid = os.getpid()
-    logger_file = "genotype_variants_" + str(pid) + ".log"
-    logger_output = pathlib.Path.cwd().joinpath(logger_file)
-    fh = logging.FileHandler(logger_output)
-    formatter = logging.Formatter(
-        fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%m/%d/%Y %I:%M:%S %p",
+    import pandas as pd
+
+    from genotype_variants.create_union_maf_dataframe import (
+        create_union_maf_dataframe,
     )
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
+
+    add_log_file_handler()
     logger.info(
         "========================================================================================"
     )
     logger.info(
-        ">>> Running genotype_variants for small variants to generate genotypes and merge MAF <<<"
+        ">>> Running genotype_variants for small variants to genotype the union of a cohort <<<"
     )
     logger.info(
-        "========================================================================================="
+        "========================================================================================"
     )
     t1_start = time.perf_counter()
     t2_start = time.process_time()
-    metadata = None
-    try:
-        metadata = pd.read_excel(input_metadata)
-    except:
-        e = sys.exc_info()[0]
-        logger.warning(
-            "genotype_variants:small_variants:multiple_samples:: could not read to EXCEL file, due to error: %s",
-            e,
-        )
-        logger.warning(
-            "genotype_variants:small_variants:multiple_samples:: Assuming its as TSV file"
+    metadata = read_metadata(input_metadata)
+    if total_threads:
+        threads = split_threads(total_threads, jobs)[-1]
+        logger.info(
+            "genotype_variants:small_variants:cohort:: Running %s GetBaseCountMultiSample processes at a time with %s threads each",
+            jobs,
+            threads,
         )
-        pass
-    if metadata is None:
-        try:
-            metadata = pd.read_csv(input_metadata, sep="\t", header="infer")
-        except:
-            e = sys.exc_info()[0]
-            logger.error(
-                "genotype_variants:small_variants:multiple_samples:: could not read TSV file, due to error: %s. Please fix and rerun the script",
-                e,
-            )
-            exit(1)
-    else:
-        pass
+
+    # Collect MAF and BAM files of each sample
+    input_mafs = []
+    samples = []
+    results = []
     for ind in metadata.index:
-        if pd.notnull(metadata["maf"][ind]):
-            if pathlib.Path(metadata["maf"][ind]).is_file():
-                input_maf = metadata["maf"][ind]
-            else:
-                logger.error(
-                    "genotype_variants::small_variants::multiple_samples:: Maf file to genotype variants is present but the path is invalid. Please provide a valid path"
-                )
-                exit(1)
-        else:
+        input_maf = metadata_file(metadata, "maf", ind)
+        if input_maf is None:
+            logger.warning(
+                "genotype_variants:small_variants:cohort:: Maf file in row %s is not present or the path is invalid, it is not added to the union",
+                ind + 1,
+            )
+        elif input_maf not in input_mafs:
+            input_mafs.append(input_maf)
+        if pd.isnull(metadata["sample_id"][ind]):
+            error = "Sample id is not a string, please check input metadata file and try again."
             logger.error(
-                "genotype_variants::small_variants::multiple_samples:: Maf file to genotype variants is not present and is required."
+                "genotype_variants:small_variants:cohort:: row %s: %s",
+                ind + 1,
+                error,
             )
-            exit(1)
-        if pd.notnull(metadata["standard_bam"][ind]):
-            if pathlib.Path(metadata["standard_bam"][ind]).is_file():
-                standard_bam = metadata["standard_bam"][ind]
-            else:
-                standard_bam = None
-        else:
-            standard_bam = None
-            logger.info(
-                "genotype_variants::small_variants::multiple_samples:: Standard BAM file to genotype variants is not present."
+            results.append(
+                {
+                    "sample_id": "row_" + str(ind + 1),
+                    "status": "invalid",
+                    "elapsed_min": 0,
+                    "output": "",
+                    "message": error,
+                }
             )
-        if pd.notnull(metadata["duplex_bam"][ind]):
-            if pathlib.Path(metadata["duplex_bam"][ind]).is_file():
-                duplex_bam = metadata["duplex_bam"][ind]
-            else:
-                duplex_bam = None
-        else:
-            duplex_bam = None
-        if pd.notnull(metadata["simplex_bam"][ind]):
-            if pathlib.Path(metadata["simplex_bam"][ind]).is_file():
-                simplex_bam = metadata["simplex_bam"][ind]
-            else:
-                simplex_bam = None
-        else:
-            simplex_bam = None
-
-        if standard_bam or duplex_bam or simplex_bam:
-            logger.info(
-                "genotype_variants::small_variants::multiple_samples:: standard_bam, duplex_bam and simplex_bam are present for genotype variants."
+            inc_counter(
+                "genotype_variants_samples_processed_total", {"status": "invalid"}
+            )
+            continue
+        sample_id = metadata["sample_id"][ind]
+        bams = [
+            (btype, metadata_file(metadata, column, ind))
+            for btype, column in (
+                ("STANDARD", "standard_bam"),
+                ("DUPLEX", "duplex_bam"),
+                ("SIMPLEX", "simplex_bam"),
             )
+        ]
+        bams = [(btype, bam) for btype, bam in bams if bam]
+        if bams:
+            samples.append((sample_id, bams))
         else:
-            logger.warning(
-                "genotype_variants::small_variants::multiple_samples:: one of standard_bam, duplex_bam and simplex_bam is not present for genotype variants! Either the Standard BAM or the Duplex BAM and the Simplex BAM should be present for genotype variants."
+            results.append(
+                {
+                    "sample_id": sample_id,
+                    "status": "invalid",
+                    "elapsed_min": 0,
+                    "output": "",
+                    "message": "none of standard_bam, duplex_bam and simplex_bam is present",
+                }
             )
+            inc_counter(
+                "genotype_variants_samples_processed_total", {"status": "invalid"}
+            )
+    if not input_mafs:
+        logger.error(
+            "genotype_variants:small_variants:cohort:: None of the Maf files in the metadata file is present, please check input metadata file and try again."
+        )
+        exit(1)
 
-        if pd.notnull(metadata["sample_id"][ind]):
-            sample_id = metadata["sample_id"][ind]
-        else:
-            logger.error(
-                "genotype_variants:small_variants:multiple_samples:: Sample id is not a string, please check input metadata file and try again."
+    # Union of the variants
+    union_maf = pathlib.Path.cwd().joinpath(cohort_id + "_union.maf")
+    u_maf = create_union_maf_dataframe(
+        [read_maf(input_maf, text=True) for input_maf in input_mafs]
+    )
+    write_csv(union_maf, u_maf)
+    del u_maf
+
+    # Genotype the union in batches of BAM files sharing the counting mode
+    batches = []
+    for generic_counting, btypes in (
+        (False, ["STANDARD"]),
+        (True, ["DUPLEX", "SIMPLEX"]),
+    ):
+        typed_bams = [
+            (sample_id + "-" + btype, bam, btype)
+            for sample_id, bams in samples
+            for btype, bam in bams
+            if btype in btypes
+        ]
+        for start in range(0, len(typed_bams), batch_size):
+            chunk = typed_bams[start : start + batch_size]
+            batch = [(label, bam) for label, bam, _ in chunk]
+            bam_types = [btype for _, _, btype in chunk]
+            batch_name = "%s-%s-BATCH%s" % (
+                cohort_id,
+                "GENERIC" if generic_counting else "STANDARD",
+                start // batch_size + 1,
             )
-            exit(1)
-        logger.info(
-            "genotype_variants:small_variants::multiple_samples:: %s is being processed",
-            sample_id,
+            combined_maf = pathlib.Path.cwd().joinpath(
+                batch_name + "_combined_genotyped.maf"
+            )
+            cmd = generate_batch_gbcms_cmd(
+                union_maf,
+                batch,
+                generic_counting,
+                reference_fasta,
+                gbcms_path,
+                filter_duplicate,
+                fragment_count,
+                mapping_quality,
+                threads,
+                combined_maf,
+            )
+            batches.append(
+                (batch_name, cmd, combined_maf, batch, generic_counting, bam_types)
+            )
+    logger.info(
+        "genotype_variants:small_variants:cohort:: Genotyping %s samples in %s GetBaseCountMultiSample batches",
+        len(samples),
+        len(batches),
+    )
+    batch_jobs = [(batch_name, cmd) for batch_name, cmd, _, _, _, _ in batches]
+    if cache_dir:
+        batch_outputs = {
+            batch_name: combined_maf for batch_name, _, combined_maf, _, _, _ in batches
+        }
+        batch_keys = {
+            batch_name: gbcms_cache_key(
+                union_maf,
+                batch,
+                generic_counting,
+                reference_fasta,
+                gbcms_path,
+                filter_duplicate,
+                fragment_count,
+                mapping_quality,
+            )
+            for batch_name, _, _, batch, generic_counting, _ in batches
+        }
+        batch_jobs = fetch_cached_jobs(cache_dir, batch_jobs, batch_keys, batch_outputs)
+    gbcms_results = run_gbcms_jobs(
+        batch_jobs,
+        jobs > 1,
+        max_workers=jobs,
+        timeout=timeout * 60 if timeout else None,
+    )
+    if cache_dir:
+        store_cached_jobs(
+            cache_dir,
+            gbcms_results,
+            batch_keys,
+            batch_outputs,
+            cache_max_size * 1024**3,
         )
-        final_file = all.callback(
-            input_maf,
-            reference_fasta,
-            gbcms_path,
-            sample_id,
-            standard_bam,
-            duplex_bam,
-            simplex_bam,
-            filter_duplicate,
-            fragment_count,
-            mapping_quality,
-            threads,
+    if run_report:
+        variant_count = count_maf_variants(union_maf)
+        write_run_report(
+            run_report,
+            [
+                create_run_record(
+                    batch_name,
+                    gbcms_results[batch_name],
+                    union_maf,
+                    [bam for _, bam in batch],
+                    variant_count,
+                )
+                for batch_name, _, _, batch, _, _ in batches
+                if batch_name in gbcms_results
+            ],
+        )
+    if is_recording():
+        variant_count = count_maf_variants(union_maf)
+        record_gbcms_runs(
+            gbcms_results,
+            {batch_name: bam_types for batch_name, _, _, _, _, bam_types in batches},
+            {batch_name: variant_count for batch_name in gbcms_results},
+        )
+    failed_labels = set()
+    for batch_name, _, combined_maf, batch, _, _ in batches:
+        if batch_name in gbcms_results and gbcms_results[batch_name].returncode != 0:
+            failed_labels.update(label for label, _ in batch)
+            continue
+        split_multi_bam_maf(
+            combined_maf,
+            {
+                label: pathlib.Path.cwd().joinpath(label + "_genotyped.maf")
+                for label, _ in batch
+            },
+        )
+        os.remove(combined_maf)
+
+    # Fan the genotypes back out into merged MAF for each sample
+    for sample_id, bams in samples:
+        t_sample = time.perf_counter()
+        labels = [sample_id + "-" + btype for btype, _ in bams]
+        failed = [label for label in labels if label in failed_labels]
+        output, message = None, ""
+        if failed:
+            message = "GetBaseCountMultiSample failed for " + ", ".join(failed)
+            inc_counter(
+                "genotype_variants_samples_processed_total", {"status": "failed"}
+            )
+            write_metrics()
+        else:
+            genotyped = {
+                btype: pathlib.Path.cwd().joinpath(
+                    sample_id + "-" + btype + "_genotyped.maf"
+                )
+                for btype, _ in bams
+            }
+            try:
+                output = merge.callback(
+                    patient_id=sample_id,
+                    input_maf=union_maf,
+                    input_standard_maf=genotyped.get("STANDARD"),
+                    input_duplex_maf=genotyped.get("DUPLEX"),
+                    input_simplex_maf=genotyped.get("SIMPLEX"),
+                    sample_id=sample_id,
+                    tumor_name_override=True,
+                )
+            except SystemExit as e:
+                message = "merge exited with status %s" % e.code
+        results.append(
+            {
+                "sample_id": sample_id,
+                "status": "failed" if message else "success",
+                "elapsed_min": round((time.perf_counter() - t_sample) / 60, 2),
+                "output": str(output) if output else "",
+                "message": message,
+            }
         )
+
+    logger.info("--------------------------------------------------")
+    log_status_table(results)
+    status_file = pathlib.Path.cwd().joinpath(cohort_id + "_status.tsv")
+    write_status_table(status_file, results)
+    logger.info(
+        "genotype_variants:small_variants:cohort:: status of each sample has been written to %s",
+        status_file,
+    )
+    tensor_written = not tensor_dir or write_tensor(tensor_dir, results, union_maf)
+    failed = [
+        result["sample_id"] for result in results if result["status"] != "success"
+    ]
     t1_stop = time.perf_counter()
     t2_stop = time.process_time()
     logger.info("--------------------------------------------------")
     logger.info("Elapsed time: %.1f [min]" % ((t1_stop - t1_start) / 60))
     logger.info("CPU process time: %.1f [min]" % ((t2_stop - t2_start) / 60))
     logger.info("--------------------------------------------------")
-    return
+    if failed:
+        logger.error(
+            "genotype_variants:small_variants:cohort:: %s of %s samples did not complete: %s",
+            len(failed),
+            len(results),
+            ", ".join(str(sample_id) for sample_id in failed),
+        )
+        exit(1)
+    if not tensor_written:
+        exit(1)
+    return union_maf
+
+
+# Cohort genotype tensor
+@cli.command()
+@click.option(
+    "-i",
+    "--input-metadata",
+    required=True,
+    type=click.Path(exists=True),
+    help="Full path to metadata file in TSV/EXCEL format, with a sample_id column naming the samples to put in the tensor, in order",
+)
+@click.option(
+    "-gd",
+    "--genotyped-dir",
+    required=False,
+    type=click.Path(exists=True, file_okay=False),
+    help="Directory with the merged MAF files of the samples written by the all, multiple-samples or cohort commands, defaults to the current working directory",
+)
+@click.option(
+    "-u",
+    "--variants-maf",
+    required=False,
+    type=click.Path(exists=True),
+    help="MAF file with the variants of the tensor, in order, such as the union MAF of the cohort command, defaults to the union of the variants of the merged MAF files",
+)
+@click.option(
+    "-o",
+    "--output-dir",
+    required=True,
+    type=click.Path(file_okay=False, writable=True),
+    help="Directory to write the cohort genotype tensor to",
+)
+@click_log.simple_verbosity_option(logger)
+def cohort_tensor(input_metadata, genotyped_dir, variants_maf, output_dir):
+    """
+    Command that helps to write the fragment counts of the merged MAF
+    of every sample in the metadata file as a memory-mapped
+    variants x samples x assays x counts integer array,
+    with the variants and the samples along its axes in TSV files.
+    """
+    import pandas as pd
+
+    add_log_file_handler()
+    t1_start = time.perf_counter()
+    metadata = read_metadata(input_metadata)
+    genotyped_dir = pathlib.Path(genotyped_dir or pathlib.Path.cwd())
+    results = []
+    invalid_rows = []
+    for ind in metadata.index:
+        if pd.isnull(metadata["sample_id"][ind]):
+            logger.error(
+                "genotype_variants:small_variants:cohort_tensor:: Sample id in row %s is not a string, please check input metadata file.",
+                ind + 1,
+            )
+            invalid_rows.append(ind + 1)
+            continue
+        sample_id = str(metadata["sample_id"][ind])
+        merged_mafs = [
+            genotyped_dir / (sample_id + "-" + label + "_genotyped" + suffix)
+            for label in ("ORG-STD-SIMPLEX-DUPLEX", "ORG-SIMPLEX-DUPLEX", "ORG-STD")
+            for suffix in OUTPUT_SUFFIXES.values()
+        ]
+        merged_maf = next((maf for maf in merged_mafs if maf.is_file()), None)
+        if merged_maf is None:
+            logger.warning(
+                "genotype_variants:small_variants:cohort_tensor:: merged MAF of %s is not present in %s, it is not added to the tensor",
+                sample_id,
+                genotyped_dir,
+            )
+            continue
+        results.append(
+            {"sample_id": sample_id, "status": "success", "output": merged_maf}
+        )
+    if not write_tensor(output_dir, results, variants_maf):
+        exit(1)
+    logger.info("Elapsed time: %.1f [min]" % ((time.perf_counter() - t1_start) / 60))
+    if invalid_rows:
+        logger.error(
+            "genotype_variants:small_variants:cohort_tensor:: %s rows of the metadata file have no sample id and are not in the tensor: %s",
+            len(invalid_rows),
+            ", ".join(str(row) for row in invalid_rows),
+        )
+        exit(1)
+    return output_dir
@@ -0,0 +1,174 @@
+import collections
+import contextlib
+import gzip
+import io
+import logging
+import os
+import pathlib
+import shutil
+import stat
+import struct
+import sys
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+compressed_io
+~~~~~~~~~~~~~~~
+:Description: Code to read gzip or BGZF compressed MAF files and write BGZF compressed MAF files
+"""
+"""
+Description: Code to read gzip or BGZF compressed MAF files and write BGZF compressed MAF
+    files, compressing the blocks in threads
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Uncompressed size of a BGZF block, as written by bgzip and htslib
+BGZF_BLOCK_SIZE = 0xFF00
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def is_seekable(input_maf):
+    """Whether a MAF file can be read more than once, False for standard
+    input and named pipes, whose bytes are gone once read"""
+    return str(input_maf) != "-" and not stat.S_ISFIFO(os.stat(input_maf).st_mode)
+
+
+def is_gzip(input_maf):
+    """Whether a file is gzip compressed, BGZF files included, pipes are
+    read as plain text"""
+    if not is_seekable(input_maf):
+        return False
+    with open(input_maf, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def open_maf(input_maf):
+    """Open a MAF file for reading as text.
+
+    gzip and BGZF compressed files are decompressed on the fly, - reads
+    standard input, compressed or not.
+    """
+    if str(input_maf) == "-":
+        stdin = sys.stdin.buffer
+        if hasattr(stdin, "peek") and stdin.peek(2)[:2] == GZIP_MAGIC:
+            return io.TextIOWrapper(gzip.GzipFile(fileobj=stdin, mode="rb"))
+        return contextlib.nullcontext(sys.stdin)
+    if is_gzip(input_maf):
+        return gzip.open(input_maf, "rt")
+    return open(input_maf)
+
+
+def decompress_maf(input_maf, scratch_dir=None):
+    """Decompress a gzip or BGZF compressed MAF file for programs that read
+    plain text.
+
+    The file is written to a new directory in scratch_dir, the local
+    temporary directory by default, so the output directory, often on a
+    network file system, only sees the compressed file.
+
+    Args:
+        input_maf: Path to compressed MAF file
+        scratch_dir: Directory to decompress in, default tempfile.gettempdir()
+
+    Returns:
+        pathlib.Path: Path to the decompressed MAF file, the caller removes
+            its directory
+    """
+    name = pathlib.Path(input_maf).name
+    for suffix in (".gz", ".bgz"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    output_dir = pathlib.Path(
+        tempfile.mkdtemp(prefix="genotype_variants_", dir=scratch_dir)
+    )
+    output_maf = output_dir / name
+    with gzip.open(input_maf, "rb") as f, open(output_maf, "wb") as out:
+        shutil.copyfileobj(f, out, 1024 * 1024)
+    logger.info(
+        "genotype_variants:small_variants:decompress_maf:: %s has been decompressed to %s",
+        input_maf,
+        output_maf,
+    )
+    return output_maf
+
+
+def compress_block(data, level=6):
+    """One BGZF block, a gzip member with the BC extra field holding its size"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = struct.pack(
+        "<4BI2BH2BHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(cdata) + 25
+    )
+    return header + cdata + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+class BgzfWriter(io.RawIOBase):
+    """Binary file writing BGZF, readable by gzip, bgzip, tabix and htslib.
+
+    Blocks are compressed by a pool of threads, zlib releases the GIL while
+    compressing, and written in order. The end of file marker block is
+    written on close.
+    """
+
+    def __init__(self, output, threads=1, level=6):
+        super().__init__()
+        self._owned = isinstance(output, (str, os.PathLike))
+        self._file = open(output, "wb") if self._owned else output
+        self._level = level
+        self._threads = max(1, threads)
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        self._executor = (
+            ThreadPoolExecutor(max_workers=self._threads) if self._threads > 1 else None
+        )
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= BGZF_BLOCK_SIZE:
+            self._compress(bytes(self._buffer[:BGZF_BLOCK_SIZE]))
+            del self._buffer[:BGZF_BLOCK_SIZE]
+        return len(data)
+
+    def _compress(self, block):
+        if self._executor is None:
+            self._file.write(compress_block(block, self._level))
+            return
+        self._pending.append(self._executor.submit(compress_block, block, self._level))
+        # bound the memory held by blocks waiting to be written
+        while len(self._pending) > 2 * self._threads:
+            self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._compress(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+            self._file.write(BGZF_EOF)
+            self._file.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+            if self._owned:
+                self._file.close()
+            super().close()
+
+
+def open_bgzf(output_maf, threads=1):
+    """Open a BGZF compressed MAF file for writing text, - for standard output"""
+    output = sys.stdout.buffer if str(output_maf) == "-" else output_maf
+    return io.TextIOWrapper(
+        io.BufferedWriter(BgzfWriter(output, threads), BGZF_BLOCK_SIZE),
+        encoding="utf-8",
+        newline="",
+    )
@@ -0,0 +1,57 @@
+import importlib.util
+import logging
+import shlex
+import sys
+
+"""
+counting_backend
+~~~~~~~~~~~~~~~
+:Description: Code to select the program counting the bases supporting each variant
+"""
+"""
+Description: Code to select the program counting the bases supporting each variant
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+# gbcms: the GetBaseCountMultiSample executable given with --gbcms-path
+# pysam: genotype_variants.pysam_counts, same command line and output as gbcms
+COUNTING_BACKENDS = ["gbcms", "pysam"]
+
+
+def counting_backend_cmd(backend, gbcms_path=None):
+    """Command line prefix of a counting backend.
+
+    Every backend takes the GetBaseCountMultiSample options built by
+    ``generate_gbcms_cmd`` and writes the same output, so the jobs of any
+    backend are scheduled, cached and sharded the same way.
+
+    Args:
+        backend: one of COUNTING_BACKENDS
+        gbcms_path: Path to GetBaseCountMultiSample executable, required by
+            the gbcms backend
+
+    Returns:
+        str: command line prefix
+    """
+    if backend == "gbcms":
+        if not gbcms_path:
+            raise ValueError("--gbcms-path is required by the gbcms counting backend")
+        return str(gbcms_path)
+    if backend == "pysam":
+        if importlib.util.find_spec("pysam") is None:
+            raise ValueError(
+                "pysam is not installed, please install pysam to use the pysam counting backend"
+            )
+        return "%s -m genotype_variants.pysam_counts" % shlex.quote(sys.executable)
+    raise ValueError(
+        "Counting backend should be one of %s" % ", ".join(COUNTING_BACKENDS)
+    )
+
+
+def counting_backend_program(backend, gbcms_path=None):
+    """File holding the counting code of a backend, its content identifies the
+    version of the backend in the GetBaseCountMultiSample output cache"""
+    if backend == "pysam":
+        return importlib.util.find_spec("genotype_variants.pysam_counts").origin
+    return gbcms_path
@@ -1,7 +1,18 @@
 import logging
 import numpy as np
+import pandas as pd
 import sys
 
+from genotype_variants.maf_schema import MUTATION_KEY
+from genotype_variants.variant_key import (
+    encode_mutation_keys,
+    insert_column,
+    join_on_mutation_key,
+    mutation_key_positions,
+    replace_barcodes,
+    take_positions,
+)
+
 """
 create_all_maf_dataframe
 ~~~~~~~~~~~~~~~
@@ -18,12 +29,72 @@ logger.info(
     "genotype:variants:small_variants::create_all_maf_dataframe:: Generating duplex simplex dataframe"
 )
 
+STANDARD_COLUMNS = [
+    "t_ref_count_standard",
+    "t_alt_count_standard",
+    "t_total_count_standard",
+    "t_total_count_fragment_standard",
+    "t_alt_count_fragment_standard",
+    "t_ref_count_fragment_standard",
+    "t_variant_frequency_standard",
+    "t_ref_count_forward_standard",
+    "t_alt_count_forward_standard",
+    "t_total_count_forward_standard",
+    "t_ref_count_reverse_standard",
+    "t_alt_count_reverse_standard",
+    "t_total_count_reverse_standard",
+]
+SIMPLEX_DUPLEX_COLUMNS = [
+    "t_ref_count_fragment_simplex",
+    "t_alt_count_fragment_simplex",
+    "t_total_count_fragment_simplex",
+    "t_vaf_fragment_simplex",
+    "t_ref_count_fragment_duplex",
+    "t_alt_count_fragment_duplex",
+    "t_total_count_fragment_duplex",
+    "t_vaf_fragment_duplex",
+    "t_ref_count_fragment_simplex_duplex",
+    "t_alt_count_fragment_simplex_duplex",
+    "t_total_count_fragment_simplex_duplex",
+    "t_vaf_fragment_simplex_duplex",
+]
+
+STANDARD_RENAME = {
+    "t_alt_count": "t_alt_count_standard",
+    "t_ref_count": "t_ref_count_standard",
+    "t_total_count": "t_total_count_standard",
+    "t_alt_count_fragment": "t_alt_count_fragment_standard",
+    "t_ref_count_fragment": "t_ref_count_fragment_standard",
+    "t_total_count_fragment": "t_total_count_fragment_standard",
+    "t_variant_frequency": "t_variant_frequency_standard",
+    "t_alt_count_forward": "t_alt_count_forward_standard",
+    "t_ref_count_forward": "t_ref_count_forward_standard",
+    "t_total_count_forward": "t_total_count_forward_standard",
+}
+
 
 # Adopted from Maysun script
 def create_all_maf_dataframe(
-    original_dataframe, standard_dataframe, simplex_duplex_dataframe
+    original_dataframe,
+    standard_dataframe,
+    simplex_duplex_dataframe,
+    low_memory=False,
+    copy=True,
 ):
-    """Code to merge all the data frames generated from MAF files into one data frame"""
+    """Code to merge all the data frames generated from MAF files into one data frame
+
+    Args:
+        original_dataframe: original MAF data frame, or None
+        standard_dataframe: GBCMS data frame for standard_bam, or None
+        simplex_duplex_dataframe: simplex duplex data frame, or None
+        low_memory: Whether to compute only the new count columns and add
+            them to the original, or else the standard, data frame, instead
+            of merging copies
+        copy: Whether to leave the original and standard data frames as
+            they are, False lets the merged data frame be built from them in
+            place when the caller owns them. The simplex duplex data frame is
+            never changed.
+    """
     np.seterr(divide="ignore", invalid="ignore")
     mutation_key = [
         "Chromosome",
@@ -32,13 +103,37 @@ def create_all_maf_dataframe(
         "Reference_Allele",
         "Tumor_Seq_Allele2",
     ]
+    if low_memory:
+        try:
+            keys = encode_mutation_keys(
+                [original_dataframe, standard_dataframe, simplex_duplex_dataframe]
+            )
+            if _can_add_columns(
+                original_dataframe, standard_dataframe, simplex_duplex_dataframe, keys
+            ):
+                return _low_memory_all_maf_dataframe(
+                    original_dataframe,
+                    standard_dataframe,
+                    simplex_duplex_dataframe,
+                    keys,
+                    copy,
+                )
+        except (KeyError, ValueError) as e:
+            logger.error(
+                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not create merge data frame due to error, %s",
+                e,
+            )
+            exit(1)
+        logger.debug(
+            "genotype:variants:small_variants:create_all_maf_dataframe:: Data frames have repeated variants, merging copies"
+        )
     (df_ds, df_s, df_o) = None, None, None
     if simplex_duplex_dataframe is not None:
         df_ds = simplex_duplex_dataframe.copy()
     if standard_dataframe is not None:
-        df_s = standard_dataframe.copy()
+        df_s = standard_dataframe.copy() if copy else standard_dataframe
     if original_dataframe is not None:
-        df_o = original_dataframe.copy()
+        df_o = original_dataframe.copy() if copy else original_dataframe
 
     # Prep Simplex duplex
     if df_ds is not None:
@@ -57,37 +152,10 @@ def create_all_maf_dataframe(
             )
             exit(1)
 
-        try:
-            df_ds.set_index(mutation_key, drop=False, inplace=True)
-            logger.debug(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Successfully reset the index for simplex duplex data frame"
-            )
-        except:
-            e = sys.exc_info()[0]
-            logger.error(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not reset the index for simplex duplex data frame, due to error, %s",
-                e,
-            )
-            exit(1)
-
     # Prep Standard
     if df_s is not None:
         try:
-            df_s.rename(
-                columns={
-                    "t_alt_count": "t_alt_count_standard",
-                    "t_ref_count": "t_ref_count_standard",
-                    "t_total_count": "t_total_count_standard",
-                    "t_alt_count_fragment": "t_alt_count_fragment_standard",
-                    "t_ref_count_fragment": "t_ref_count_fragment_standard",
-                    "t_total_count_fragment": "t_total_count_fragment_standard",
-                    "t_variant_frequency": "t_variant_frequency_standard",
-                    "t_alt_count_forward": "t_alt_count_forward_standard",
-                    "t_ref_count_forward": "t_ref_count_forward_standard",
-                    "t_total_count_forward": "t_total_count_forward_standard",
-                },
-                inplace=True,
-            )
+            df_s.rename(columns=STANDARD_RENAME, inplace=True)
             logger.debug(
                 "genotype:variants:small_variants:create_all_maf_dataframe::Successfully renamed column names in standard data frame"
             )
@@ -141,58 +209,27 @@ def create_all_maf_dataframe(
             )
             exit(1)
 
-        try:
-            df_s.set_index(mutation_key, drop=False, inplace=True)
-            logger.debug(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Successfully reset the index for standard data frame"
-            )
-        except:
-            e = sys.exc_info()[0]
-            logger.error(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not reset the index for standard data frame, due to error, %s",
-                e,
-            )
-            exit(1)
-
-    # Prep Original
-    if df_o is not None:
-        try:
-            df_o.set_index(mutation_key, drop=False, inplace=True)
-            logger.debug(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Successfully reset the index for original data frame"
-            )
-        except:
-            e = sys.exc_info()[0]
-            logger.error(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not reset the index for original data frame, due to error, %s",
-                e,
-            )
-            exit(1)
+    # Encode the mutation key
+    try:
+        key_o, key_s, key_ds = encode_mutation_keys([df_o, df_s, df_ds])
+        logger.debug(
+            "genotype:variants:small_variants:create_all_maf_dataframe:: Successfully encoded the mutation key for all data frames"
+        )
+    except:
+        e = sys.exc_info()[0]
+        logger.error(
+            "genotype:variants:small_variants:create_all_maf_dataframe:: Could not encode the mutation key for all data frames, due to error, %s",
+            e,
+        )
+        exit(1)
 
-    # Merge STANDARD with DUPLEX-SIMPLEX data frame
-    df_s_ds = None
-    if df_ds is not None and df_s is not None:
+    # Only the merge returned for the given data frames is created
+    df_merged, key_merged = None, None
+    if df_s is not None and df_ds is not None:
+        # Merge STANDARD with DUPLEX-SIMPLEX data frame
         try:
-            df_ds = df_ds.reindex(df_s.index)
-            df_s_ds = df_s.merge(
-                df_ds[
-                    [
-                        "t_ref_count_fragment_simplex",
-                        "t_alt_count_fragment_simplex",
-                        "t_total_count_fragment_simplex",
-                        "t_vaf_fragment_simplex",
-                        "t_ref_count_fragment_duplex",
-                        "t_alt_count_fragment_duplex",
-                        "t_total_count_fragment_duplex",
-                        "t_vaf_fragment_duplex",
-                        "t_ref_count_fragment_simplex_duplex",
-                        "t_alt_count_fragment_simplex_duplex",
-                        "t_total_count_fragment_simplex_duplex",
-                        "t_vaf_fragment_simplex_duplex",
-                    ]
-                ],
-                left_index=True,
-                right_index=True,
+            df_merged, key_merged = join_on_mutation_key(
+                df_s, key_s, df_ds, key_ds, SIMPLEX_DUPLEX_COLUMNS
             )
             logger.info(
                 "genotype_variants:small_variants:create_all_maf_dataframe:: Successfully created merge data frame for standard, simplex and duplex data"
@@ -204,120 +241,63 @@ def create_all_maf_dataframe(
                 e,
             )
             exit(1)
-        try:
-            df_s_ds.set_index(mutation_key, drop=False, inplace=True)
-            logger.debug(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Successfully reset the index for merged data frame"
-            )
-        except:
-            e = sys.exc_info()[0]
-            logger.error(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not reset the index for merged data frame, due to error, %s",
-                e,
-            )
-            exit(1)
 
-    # Merge Original with STANDARD-DUPLEX-SIMPLEX data frame
-    df_o_s_ds = None
-    if df_s_ds is not None:
+        # Merge Original with STANDARD-DUPLEX-SIMPLEX data frame
+        if df_o is not None:
+            try:
+                df_merged, key_merged = join_on_mutation_key(
+                    df_o,
+                    key_o,
+                    df_merged,
+                    key_merged,
+                    STANDARD_COLUMNS + SIMPLEX_DUPLEX_COLUMNS,
+                )
+                logger.info(
+                    "genotype_variants:small_variants:create_all_maf_dataframe:: Successfully created merge data frame for original, standard, simplex and duplex data"
+                )
+            except:
+                e = sys.exc_info()[0]
+                logger.error(
+                    "genotype:variants:small_variants:create_all_maf_dataframe:: Could not create merge data frame for original, standard, simplex and duplex data due to error, %s",
+                    e,
+                )
+                exit(1)
+    elif df_o is not None and df_ds is not None:
+        # Merge original maf data frame with duplex and simplex and duplex data frame
         try:
-            df_s_ds = df_s_ds.reindex(df_o.index)
-            df_o_s_ds = df_o.merge(
-                df_s_ds[
-                    [
-                        "t_ref_count_standard",
-                        "t_alt_count_standard",
-                        "t_total_count_standard",
-                        "t_total_count_fragment_standard",
-                        "t_alt_count_fragment_standard",
-                        "t_ref_count_fragment_standard",
-                        "t_variant_frequency_standard",
-                        "t_ref_count_forward_standard",
-                        "t_alt_count_forward_standard",
-                        "t_total_count_forward_standard",
-                        "t_ref_count_reverse_standard",
-                        "t_alt_count_reverse_standard",
-                        "t_total_count_reverse_standard",
-                        "t_ref_count_fragment_simplex",
-                        "t_alt_count_fragment_simplex",
-                        "t_total_count_fragment_simplex",
-                        "t_vaf_fragment_simplex",
-                        "t_ref_count_fragment_duplex",
-                        "t_alt_count_fragment_duplex",
-                        "t_total_count_fragment_duplex",
-                        "t_vaf_fragment_duplex",
-                        "t_ref_count_fragment_simplex_duplex",
-                        "t_alt_count_fragment_simplex_duplex",
-                        "t_total_count_fragment_simplex_duplex",
-                        "t_vaf_fragment_simplex_duplex",
-                    ]
-                ],
-                left_index=True,
-                right_index=True,
+            df_merged, key_merged = join_on_mutation_key(
+                df_o, key_o, df_ds, key_ds, SIMPLEX_DUPLEX_COLUMNS
             )
             logger.info(
-                "genotype_variants:small_variants:create_all_maf_dataframe:: Successfully created merge data frame for original, standard, simplex and duplex data"
-            )
-        except:
-            e = sys.exc_info()[0]
-            logger.error(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not create merge data frame for original, standard, simplex and duplex data due to error, %s",
-                e,
-            )
-            exit(1)
-
-        try:
-            df_o_s_ds.set_index(mutation_key, drop=False, inplace=True)
-            logger.debug(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Successfully reset the index for merged data frame"
+                "genotype_variants:small_variants:create_all_maf_dataframe:: Successfully created merge data frame for original, simplex and duplex data"
             )
         except:
             e = sys.exc_info()[0]
             logger.error(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not reset the index for merged data frame, due to error, %s",
+                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not create merge data frame for original, simplex and duplex data due to error, %s",
                 e,
             )
             exit(1)
-
-    # Merge Original MAF data frame with STANDARD MAF data frame
-    df_o_s = None
-    if df_o is not None and df_s is not None:
+    elif df_o is not None and df_s is not None:
+        # Merge Original MAF data frame with STANDARD MAF data frame
         try:
-            df_s = df_s.reindex(df_o.index)
-            df_o_s = df_o.merge(
-                df_s[
-                    [
-                        "t_ref_count_standard",
-                        "t_alt_count_standard",
-                        "t_total_count_standard",
-                        "t_total_count_fragment_standard",
-                        "t_alt_count_fragment_standard",
-                        "t_ref_count_fragment_standard",
-                        "t_variant_frequency_standard",
-                        "t_ref_count_forward_standard",
-                        "t_alt_count_forward_standard",
-                        "t_total_count_forward_standard",
-                        "t_ref_count_reverse_standard",
-                        "t_alt_count_reverse_standard",
-                        "t_total_count_reverse_standard",
-                    ]
-                ],
-                left_index=True,
-                right_index=True,
+            df_merged, key_merged = join_on_mutation_key(
+                df_o, key_o, df_s, key_s, STANDARD_COLUMNS
             )
             logger.info(
-                "genotype_variants:small_variants:create_all_maf_dataframe:: Successfully created merge data frame for original, standard, simplex and duplex data"
+                "genotype_variants:small_variants:create_all_maf_dataframe:: Successfully created merge data frame for original and standard data"
             )
         except:
             e = sys.exc_info()[0]
             logger.error(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not create merge data frame for original, standard, simplex and duplex data due to error, %s",
+                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not create merge data frame for original and standard data due to error, %s",
                 e,
             )
             exit(1)
 
+    if df_merged is not None:
         try:
-            df_o_s.set_index(mutation_key, drop=False, inplace=True)
+            df_merged.set_index(mutation_key, drop=False, inplace=True)
             logger.debug(
                 "genotype:variants:small_variants:create_all_maf_dataframe:: Successfully reset the index for merged data frame"
             )
@@ -329,62 +309,92 @@ def create_all_maf_dataframe(
             )
             exit(1)
 
-    # Merge original maf data frame with duplex and simplex and duplex data frame
-    df_o_ds = None
-    if df_ds is not None and df_o is not None:
-        try:
-            df_ds = df_ds.reindex(df_o.index)
-            df_o_ds = df_o.merge(
-                df_ds[
-                    [
-                        "t_ref_count_fragment_simplex",
-                        "t_alt_count_fragment_simplex",
-                        "t_total_count_fragment_simplex",
-                        "t_vaf_fragment_simplex",
-                        "t_ref_count_fragment_duplex",
-                        "t_alt_count_fragment_duplex",
-                        "t_total_count_fragment_duplex",
-                        "t_vaf_fragment_duplex",
-                        "t_ref_count_fragment_simplex_duplex",
-                        "t_alt_count_fragment_simplex_duplex",
-                        "t_total_count_fragment_simplex_duplex",
-                        "t_vaf_fragment_simplex_duplex",
-                    ]
-                ],
-                left_index=True,
-                right_index=True,
-            )
-            logger.info(
-                "genotype_variants:small_variants:create_all_maf_dataframe:: Successfully created merge data frame for original, simplex and duplex data"
-            )
-        except:
-            e = sys.exc_info()[0]
-            logger.error(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not create merge data frame for original, simplex and duplex data due to error, %s",
-                e,
-            )
-            exit(1)
+    logger.info("Successfully merged data frame")
+    return df_merged
 
-        try:
-            df_o_ds.set_index(mutation_key, drop=False, inplace=True)
-            logger.debug(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Successfully reset the index for merged data frame"
-            )
-        except:
-            e = sys.exc_info()[0]
-            logger.error(
-                "genotype:variants:small_variants:create_all_maf_dataframe:: Could not reset the index for merged data frame, due to error, %s",
-                e,
-            )
-            exit(1)
 
-    logger.info("Successfully merged data frame")
-    # fill NA for selected columns for returned df
-    if df_o_s_ds is not None:
-        return df_o_s_ds
-    elif df_o_ds is not None:
-        return df_o_ds
-    elif df_o_s is not None:
-        return df_o_s
+def _can_add_columns(df_o, df_s, df_ds, keys):
+    """Whether the merge of ``create_all_maf_dataframe`` only adds columns to
+    its first data frame: the variants of the data frames joined to are not
+    repeated and the joined columns are not there already"""
+    key_o, key_s, key_ds = keys
+    if df_s is not None and df_ds is not None:
+        standard_columns = df_s.columns.map(lambda c: STANDARD_RENAME.get(c, c))
+        joins = [(standard_columns, key_s, SIMPLEX_DUPLEX_COLUMNS)]
+        if df_o is not None:
+            joins.append(
+                (df_o.columns, key_o, STANDARD_COLUMNS + SIMPLEX_DUPLEX_COLUMNS)
+            )
+    elif df_o is not None and df_ds is not None:
+        joins = [(df_o.columns, key_o, SIMPLEX_DUPLEX_COLUMNS)]
+    elif df_o is not None and df_s is not None:
+        joins = [(df_o.columns, key_o, STANDARD_COLUMNS)]
     else:
-        return df_s_ds
+        joins = []
+    return all(
+        pd.Index(key).is_unique and not columns.intersection(joined).size
+        for columns, key, joined in joins
+    )
+
+
+def _standard_counts(df_s):
+    """Count columns of the standard data frame as named in the merged MAF,
+    followed by the reverse strand counts"""
+    counts = {name: df_s[column].to_numpy() for column, name in STANDARD_RENAME.items()}
+    for count in ("t_alt_count", "t_ref_count", "t_total_count"):
+        counts[count + "_reverse_standard"] = (
+            counts[count + "_standard"] - counts[count + "_forward_standard"]
+        )
+    return counts
+
+
+def _low_memory_all_maf_dataframe(df_o, df_s, df_ds, keys, copy):
+    """``create_all_maf_dataframe`` computing only the new count columns and
+    adding them to the original, or else the standard, data frame in place,
+    for data frames without repeated variants"""
+    key_o, key_s, key_ds = keys
+    # each count column is lined up with the merged rows on its own, taking
+    # the positions in turn, so no data frame of the counts is built
+    if df_s is not None and df_ds is not None:
+        ds_positions = [mutation_key_positions(key_s, key_ds)]
+        counts = []
+        if df_o is not None:
+            # as in the merge of the original with the standard simplex duplex
+            # merge, simplex duplex counts need the variant to be in both
+            s_positions = mutation_key_positions(key_o, key_s)
+            ds_positions.append(s_positions)
+            standard = _standard_counts(df_s)
+            counts = [(c, standard[c], [s_positions]) for c in STANDARD_COLUMNS]
+        counts += [
+            (c, df_ds[c].to_numpy(), ds_positions) for c in SIMPLEX_DUPLEX_COLUMNS
+        ]
+    elif df_o is not None and df_ds is not None:
+        positions = [mutation_key_positions(key_o, key_ds)]
+        counts = [(c, df_ds[c].to_numpy(), positions) for c in SIMPLEX_DUPLEX_COLUMNS]
+    elif df_o is not None and df_s is not None:
+        positions = [mutation_key_positions(key_o, key_s)]
+        standard = _standard_counts(df_s)
+        counts = [(c, standard[c], positions) for c in STANDARD_COLUMNS]
+    else:
+        return None
+
+    if df_o is not None:
+        df_merged = df_o.copy() if copy else df_o
+    else:
+        df_merged = df_s.copy() if copy else df_s
+        standard = _standard_counts(df_merged)
+        df_merged.rename(columns=STANDARD_RENAME, inplace=True)
+        for column in list(standard)[len(STANDARD_RENAME) :]:
+            insert_column(df_merged, column, standard[column])
+        insert_column(
+            df_merged,
+            "Tumor_Sample_Barcode",
+            replace_barcodes(df_merged["Tumor_Sample_Barcode"], "-STANDARD", ""),
+        )
+    for column, values, positions in counts:
+        for column_positions in positions:
+            values = take_positions(values, column_positions)
+        insert_column(df_merged, column, values)
+    df_merged.set_index(MUTATION_KEY, drop=False, inplace=True)
+    logger.info("Successfully merged data frame")
+    return df_merged
@@ -3,6 +3,15 @@ import numpy as np
 import sys
 import pandas as pd
 
+from genotype_variants.maf_schema import MUTATION_KEY
+from genotype_variants.variant_key import (
+    align_on_mutation_key,
+    encode_mutation_keys,
+    insert_column,
+    join_on_mutation_key,
+    replace_barcodes,
+)
+
 """
 create_duplex_simplex_dataframe
 ~~~~~~~~~~~~~~~
@@ -20,9 +29,39 @@ logger.info(
 )
 
 
+DUPLEX_COLUMNS = [
+    "t_ref_count_fragment_duplex",
+    "t_alt_count_fragment_duplex",
+    "t_total_count_fragment_duplex",
+    "t_vaf_fragment_duplex",
+]
+# GBCMS read counts that are not part of the simplex duplex MAF
+READ_COUNT_COLUMNS = [
+    "t_ref_count",
+    "t_ref_count_forward",
+    "t_alt_count",
+    "t_alt_count_forward",
+    "t_total_count",
+    "t_total_count_forward",
+    "t_variant_frequency",
+]
+
+
 # Adopted from Maysun script
-def create_duplex_simplex_dataframe(simplex_dataframe, duplex_dataframe):
-    """Code to merge duplex and simplex fragment counts in MAF format"""
+def create_duplex_simplex_dataframe(
+    simplex_dataframe, duplex_dataframe, low_memory=False, copy=True
+):
+    """Code to merge duplex and simplex fragment counts in MAF format
+
+    Args:
+        simplex_dataframe: GBCMS data frame for simplex_bam
+        duplex_dataframe: GBCMS data frame for duplex_bam
+        low_memory: Whether to compute only the new count columns and add
+            them to the simplex data frame, instead of merging copies
+        copy: Whether to leave the input data frames as they are, False
+            lets the merged data frame be built from them in place when the
+            caller owns them
+    """
     np.seterr(divide="ignore", invalid="ignore")
     mutation_key = [
         "Chromosome",
@@ -31,8 +70,26 @@ def create_duplex_simplex_dataframe(simplex_dataframe, duplex_dataframe):
         "Reference_Allele",
         "Tumor_Seq_Allele2",
     ]
-    df_s = simplex_dataframe.copy()
-    df_d = duplex_dataframe.copy()
+    if low_memory:
+        try:
+            keys = encode_mutation_keys([simplex_dataframe, duplex_dataframe])
+            if pd.Index(keys[0]).is_unique and not (
+                simplex_dataframe.columns.intersection(DUPLEX_COLUMNS).size
+            ):
+                return _low_memory_duplex_simplex_dataframe(
+                    simplex_dataframe, duplex_dataframe, keys, copy
+                )
+        except (KeyError, ValueError) as e:
+            logger.error(
+                "genotype:variants:small_variants:create_duplex_simplex_dataframe:: Could not create merge data frame for simplex and duplex data due to error, %s",
+                e,
+            )
+            exit(1)
+        logger.debug(
+            "genotype:variants:small_variants:create_duplex_simplex_dataframe:: Simplex data frame has repeated variants, merging copies"
+        )
+    df_s = simplex_dataframe.copy() if copy else simplex_dataframe
+    df_d = duplex_dataframe.copy() if copy else duplex_dataframe
 
     # Prep Simplex
     try:
@@ -111,18 +168,6 @@ def create_duplex_simplex_dataframe(simplex_dataframe, duplex_dataframe):
             e,
         )
 
-    try:
-        df_s.set_index(mutation_key, drop=False, inplace=True)
-        logger.debug(
-            "genotype:variants:small_variants:create_duplex_simplex_dataframe:: Successfully reset the index for simplex data frame"
-        )
-    except:
-        e = sys.exc_info()[0]
-        logger.error(
-            "genotype:variants:small_variants:create_duplex_simplex_dataframe:: Could not reset the index for simplex data frame, due to error, %s",
-            e,
-        )
-
     # Prep Duplex
     try:
         df_d.rename(
@@ -201,32 +246,32 @@ def create_duplex_simplex_dataframe(simplex_dataframe, duplex_dataframe):
         )
 
     try:
-        df_d.set_index(mutation_key, drop=False, inplace=True)
+        key_s, key_d = encode_mutation_keys([df_s, df_d])
         logger.debug(
-            "genotype:variants:small_variants:create_duplex_simplex_dataframe:: Successfully reset the index for duplex data frame"
+            "genotype:variants:small_variants:create_duplex_simplex_dataframe:: Successfully encoded the mutation key for simplex and duplex data frame"
         )
     except:
         e = sys.exc_info()[0]
         logger.error(
-            "genotype:variants:small_variants:create_duplex_simplex_dataframe:: Could not reset the index for duplex data frame, due to error, %s",
+            "genotype:variants:small_variants:create_duplex_simplex_dataframe:: Could not encode the mutation key for simplex and duplex data frame, due to error, %s",
             e,
         )
+        exit(1)
 
     # Merge
     df_ds = None
     try:
-        df_d = df_d.reindex(df_s.index)
-        df_ds = df_s.merge(
-            df_d[
-                [
-                    "t_ref_count_fragment_duplex",
-                    "t_alt_count_fragment_duplex",
-                    "t_total_count_fragment_duplex",
-                    "t_vaf_fragment_duplex",
-                ]
+        df_ds, _ = join_on_mutation_key(
+            df_s,
+            key_s,
+            df_d,
+            key_d,
+            [
+                "t_ref_count_fragment_duplex",
+                "t_alt_count_fragment_duplex",
+                "t_total_count_fragment_duplex",
+                "t_vaf_fragment_duplex",
             ],
-            left_index=True,
-            right_index=True,
         )
         logger.info(
             "genotype_variants:small_variants:create_duplex_simplex_dataframe:: Successfully created merge data frame for simplex and duplex data"
@@ -355,3 +400,87 @@ def create_duplex_simplex_dataframe(simplex_dataframe, duplex_dataframe):
     ]
     df_ds[cols] = df_ds[cols].replace(np.nan, 0)
     return df_ds
+
+
+def _fragment_vaf(alt_count, ref_count):
+    """Fragment VAF rounded as in the merged MAF, NaN where there are no
+    fragments"""
+    return np.round(alt_count / (alt_count.astype(int) + ref_count.astype(int)), 4)
+
+
+def _fill_missing(values):
+    """Values with the missing ones set to 0"""
+    if values.dtype.kind == "f" and np.isnan(values).any():
+        return np.where(np.isnan(values), 0, values)
+    return values
+
+
+def _low_memory_duplex_simplex_dataframe(
+    simplex_dataframe, duplex_dataframe, keys, copy
+):
+    """``create_duplex_simplex_dataframe`` computing only the new count
+    columns as arrays and adding them to the simplex data frame in place,
+    for simplex data frames without repeated variants"""
+    key_s, key_d = keys
+    df_ds = simplex_dataframe.copy() if copy else simplex_dataframe
+
+    s_ref = df_ds["t_ref_count_fragment"].to_numpy()
+    s_alt = df_ds["t_alt_count_fragment"].to_numpy()
+    s_total = _fill_missing(s_ref + s_alt)
+    s_vaf = _fill_missing(_fragment_vaf(s_alt, s_ref))
+    d_ref = duplex_dataframe["t_ref_count_fragment"].to_numpy()
+    d_alt = duplex_dataframe["t_alt_count_fragment"].to_numpy()
+    duplex_counts = pd.DataFrame(
+        dict(
+            zip(
+                DUPLEX_COLUMNS,
+                (
+                    d_ref,
+                    d_alt,
+                    d_ref + d_alt,
+                    _fill_missing(_fragment_vaf(d_alt, d_ref)),
+                ),
+            )
+        )
+    )
+    # only the four duplex columns are lined up with the simplex rows
+    duplex_counts = align_on_mutation_key(key_s, duplex_counts, key_d)
+    duplex_counts = {
+        column: _fill_missing(duplex_counts[column].to_numpy())
+        for column in DUPLEX_COLUMNS
+    }
+    s_ref, s_alt = _fill_missing(s_ref), _fill_missing(s_alt)
+    sd_ref = s_ref + duplex_counts["t_ref_count_fragment_duplex"]
+    sd_alt = s_alt + duplex_counts["t_alt_count_fragment_duplex"]
+
+    df_ds.rename(
+        columns={
+            "t_alt_count_fragment": "t_alt_count_fragment_simplex",
+            "t_ref_count_fragment": "t_ref_count_fragment_simplex",
+            "t_total_count_fragment": "t_total_count_fragment_simplex",
+        },
+        inplace=True,
+    )
+    for column in READ_COUNT_COLUMNS:
+        del df_ds[column]
+    new_columns = {
+        "t_ref_count_fragment_simplex": s_ref,
+        "t_alt_count_fragment_simplex": s_alt,
+        "t_total_count_fragment_simplex": s_total,
+        "t_vaf_fragment_simplex": s_vaf,
+        **duplex_counts,
+        "t_ref_count_fragment_simplex_duplex": sd_ref,
+        "t_alt_count_fragment_simplex_duplex": sd_alt,
+        "t_total_count_fragment_simplex_duplex": sd_alt + sd_ref,
+        "t_vaf_fragment_simplex_duplex": _fill_missing(_fragment_vaf(sd_alt, sd_ref)),
+        "Tumor_Sample_Barcode": replace_barcodes(
+            df_ds["Tumor_Sample_Barcode"], "-SIMPLEX", "-SIMPLEX-DUPLEX"
+        ),
+    }
+    for column, values in new_columns.items():
+        insert_column(df_ds, column, values)
+    df_ds.set_index(MUTATION_KEY, drop=False, inplace=True)
+    logger.info(
+        "Successfully merged data frame and the counts for simplex and duplex MAF"
+    )
+    return df_ds
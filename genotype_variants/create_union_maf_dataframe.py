@@ -0,0 +1,55 @@
+import logging
+import sys
+import pandas as pd
+
+"""
+create_union_maf_dataframe
+~~~~~~~~~~~~~~~
+:Description: Code to create the union of variants from many MAF files
+"""
+"""
+Description: Code to create the union of variants from many MAF files
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+
+def create_union_maf_dataframe(dataframes):
+    """Code to create the union of variants from many MAF data frames.
+
+    Variants are de-duplicated on the mutation key, the first record seen for
+    a variant is kept so the order of the input data frames decides which
+    annotation is carried into the union.
+
+    Args:
+        dataframes: list of MAF data frames
+
+    Returns:
+        pandas.DataFrame: de-duplicated union of the variants
+    """
+    mutation_key = [
+        "Chromosome",
+        "Start_Position",
+        "End_Position",
+        "Reference_Allele",
+        "Tumor_Seq_Allele2",
+    ]
+    try:
+        df_u = pd.concat(dataframes, ignore_index=True, sort=False)
+        total = df_u.shape[0]
+        df_u = df_u.drop_duplicates(subset=mutation_key, keep="first")
+        df_u = df_u.reset_index(drop=True)
+        logger.info(
+            "genotype_variants:small_variants:create_union_maf_dataframe:: %s unique variants out of %s records from %s MAF files",
+            df_u.shape[0],
+            total,
+            len(dataframes),
+        )
+    except:
+        e = sys.exc_info()[0]
+        logger.error(
+            "genotype_variants:small_variants:create_union_maf_dataframe:: Could not create union of MAF data frames due to error, %s",
+            e,
+        )
+        exit(1)
+    return df_u
@@ -0,0 +1,254 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+
+"""
+gbcms_cache
+~~~~~~~~~~~~~~~
+:Description: Code to cache GetBaseCountMultiSample outputs on disk
+"""
+"""
+Description: Code to cache GetBaseCountMultiSample outputs on disk
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+# Bump when the layout of the key changes so old entries are never hit
+CACHE_VERSION = 1
+# Bytes read from the start of a BAM file, the BGZF blocks holding the header
+BAM_HEADER_BYTES = 1 << 16
+
+
+def _sha256_file(path, limit=None):
+    """SHA-256 of a file, or of its first limit bytes"""
+    sha = hashlib.sha256()
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            size = 1 << 20 if remaining is None else min(1 << 20, remaining)
+            chunk = f.read(size)
+            if not chunk:
+                break
+            sha.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return sha.hexdigest()
+
+
+def _file_stat(path):
+    """Resolved path, size and modification time of a file"""
+    path = pathlib.Path(path).resolve()
+    stat = path.stat()
+    return [str(path), stat.st_size, stat.st_mtime_ns]
+
+
+@functools.lru_cache(maxsize=None)
+def _sha256_file_once(path, size, mtime_ns):
+    """SHA-256 of a file, cached on its stat for the whole run"""
+    return _sha256_file(path)
+
+
+def fingerprint_gbcms(gbcms_path):
+    """Fingerprint of the GetBaseCountMultiSample executable.
+
+    The executable is hashed so that an upgrade in place invalidates the
+    cache, the version of the counting code is in the content of the
+    executable rather than in its path.
+    """
+    path = shutil.which(str(gbcms_path)) or str(gbcms_path)
+    stat = _file_stat(path)
+    return stat + [_sha256_file_once(*stat)]
+
+
+def gbcms_cache_key(
+    input_maf,
+    labelled_bams,
+    generic_counting,
+    reference_fasta,
+    gbcms_path,
+    filter_duplicate,
+    fragment_count,
+    mapping_quality,
+):
+    """Key of the output of a GetBaseCountMultiSample run.
+
+    The key covers everything the counts depend on: the content of the input
+    MAF, the path, size, modification time and header of each BAM file with
+    the label it is written under, the path, size and modification time of
+    the reference FASTA, the GetBaseCountMultiSample executable and all the
+    counting parameters. The number of threads does not change the output
+    and is left out.
+
+    Args:
+        input_maf: Path to input MAF file
+        labelled_bams: list of (label, bam) tuples
+        generic_counting: Whether generic counting is used
+        reference_fasta: Path to reference FASTA file
+        gbcms_path: Path to GetBaseCountMultiSample executable
+        filter_duplicate: Whether to filter duplicates
+        fragment_count: Fragment count threshold
+        mapping_quality: Minimum mapping quality
+
+    Returns:
+        str: hexadecimal key
+    """
+    fingerprint = {
+        "version": CACHE_VERSION,
+        "input_maf": _sha256_file_once(*_file_stat(input_maf)),
+        "bams": [
+            [str(label)] + _file_stat(bam) + [_sha256_file(bam, limit=BAM_HEADER_BYTES)]
+            for label, bam in labelled_bams
+        ],
+        "generic_counting": bool(generic_counting),
+        "reference_fasta": _file_stat(reference_fasta),
+        "gbcms": fingerprint_gbcms(gbcms_path),
+        "filter_duplicate": int(filter_duplicate),
+        "fragment_count": int(fragment_count),
+        "mapping_quality": int(mapping_quality),
+    }
+    return hashlib.sha256(
+        json.dumps(fingerprint, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _cache_entry(cache_dir, key):
+    return pathlib.Path(cache_dir) / key[:2] / (key + ".maf")
+
+
+def _atomic_copy(source, destination):
+    """Copy a file so that readers only ever see it complete"""
+    destination = pathlib.Path(destination)
+    fd, tmp = tempfile.mkstemp(
+        prefix="." + destination.name + ".", suffix=".tmp", dir=destination.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as f, open(source, "rb") as s:
+            shutil.copyfileobj(s, f, 1 << 20)
+        os.replace(tmp, destination)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def fetch_cached_maf(cache_dir, key, output_maf):
+    """Copy a cached output to output_maf.
+
+    The entry is marked as used by updating its modification time, which is
+    the order entries are evicted in.
+
+    Returns:
+        bool: whether the output was found in the cache
+    """
+    entry = _cache_entry(cache_dir, key)
+    try:
+        _atomic_copy(entry, output_maf)
+        os.utime(entry)
+    except FileNotFoundError:
+        # missing, or evicted by another job in the meantime
+        return False
+    except OSError as e:
+        logger.warning(
+            "genotype_variants:small_variants:gbcms_cache:: Could not read %s from cache due to error, %s",
+            entry,
+            e,
+        )
+        return False
+    return True
+
+
+def store_cached_maf(cache_dir, key, output_maf, max_size_bytes=None):
+    """Add an output to the cache, evicting the least recently used entries
+    when the cache grows over max_size_bytes"""
+    entry = _cache_entry(cache_dir, key)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_copy(output_maf, entry)
+    if max_size_bytes:
+        evict_cache(cache_dir, max_size_bytes)
+
+
+def evict_cache(cache_dir, max_size_bytes):
+    """Remove the least recently used entries until the cache fits.
+
+    Entries can be removed by concurrent jobs while the cache is scanned,
+    those are skipped.
+
+    Returns:
+        int: number of entries removed
+    """
+    entries = []
+    for entry in pathlib.Path(cache_dir).glob("*/*.maf"):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, entry))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, entry in sorted(entries):
+        if total <= max_size_bytes:
+            break
+        try:
+            entry.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    if removed:
+        logger.info(
+            "genotype_variants:small_variants:gbcms_cache:: evicted %s entries from %s",
+            removed,
+            cache_dir,
+        )
+    return removed
+
+
+def fetch_cached_jobs(cache_dir, jobs, job_keys, job_outputs):
+    """Fetch the outputs of GetBaseCountMultiSample jobs from the cache.
+
+    Args:
+        cache_dir: Path to cache directory
+        jobs: list of (label, command) tuples
+        job_keys: dict of label -> key from gbcms_cache_key
+        job_outputs: dict of label -> output MAF path of the job
+
+    Returns:
+        list: (label, command) tuples of the jobs that still have to run
+    """
+    pending = []
+    for label, cmd in jobs:
+        if fetch_cached_maf(cache_dir, job_keys[label], job_outputs[label]):
+            logger.info(
+                "genotype_variants:small_variants:gbcms_cache:: GetBaseCountMultiSample output for %s found in cache, written to %s",
+                label,
+                job_outputs[label],
+            )
+        else:
+            pending.append((label, cmd))
+    return pending
+
+
+def store_cached_jobs(cache_dir, results, job_keys, job_outputs, max_size_bytes=None):
+    """Add the outputs of the successful jobs in the output of
+    run_gbcms_jobs to the cache"""
+    for label, result in results.items():
+        if result.returncode != 0:
+            continue
+        try:
+            store_cached_maf(cache_dir, job_keys[label], job_outputs[label])
+        except OSError as e:
+            # the cache is an optimisation, a full or read-only disk is not fatal
+            logger.warning(
+                "genotype_variants:small_variants:gbcms_cache:: Could not cache output for %s due to error, %s",
+                label,
+                e,
+            )
+    if max_size_bytes:
+        evict_cache(cache_dir, max_size_bytes)
@@ -14,22 +14,222 @@ Description: Code to Generate Summary Field
 # Making logging possible
 logger = logging.getLogger("genotype_variants")
 
+# Decimals of the VF in the summary, as the VAF columns of the merged MAF
+VAF_PRECISION = 4
+# Summary columns of the merged MAF and the fragment counts they are built from
+SUMMARY_COLUMNS = {
+    "summary_fragment_standard": (
+        "t_ref_count_fragment_standard",
+        "t_alt_count_fragment_standard",
+    ),
+    "summary_fragment_simplex": (
+        "t_ref_count_fragment_simplex",
+        "t_alt_count_fragment_simplex",
+    ),
+    "summary_fragment_duplex": (
+        "t_ref_count_fragment_duplex",
+        "t_alt_count_fragment_duplex",
+    ),
+    "summary_fragment_simplex_duplex": (
+        "t_ref_count_fragment_simplex_duplex",
+        "t_alt_count_fragment_simplex_duplex",
+    ),
+}
+# Rows formatted at a time, so the characters of a chunk stay in the CPU cache
+CHUNK_SIZE = 16384
+
+
+def _digit_words(padded):
+    """uint32 words with the ASCII digits of 0 to 9999 from the first byte in
+    memory, zero padded to 4 digits or else followed by NUL bytes"""
+    words = np.zeros(10000, dtype=np.uint32)
+    for i in range(10000):
+        digits = (("%04d" if padded else "%d") % i).encode().ljust(4, b"\0")
+        words[i] = int.from_bytes(digits, "little")
+    return words
+
+
+_PADDED = _digit_words(True)
+_TRIMMED = _digit_words(False)
+# Number of digits of 0 to 9999
+_TRIMMED_LENGTHS = np.array([len(str(i)) for i in range(10000)], dtype=np.int64)
+
+
+def _word(text):
+    """uint32 word with up to 4 ASCII characters, NUL padded, and the number
+    of characters"""
+    return (
+        np.uint32(int.from_bytes(text.encode().ljust(4, b"\0"), "little")),
+        len(text),
+    )
+
+
+def _number_words(values):
+    """Columns of uint32 words with the decimal digits of non negative
+    integers, 4 digits a word from the most significant without the leading
+    zeros, and the number of digits in each word"""
+    top = int(values.max()) if values.size else 0
+    groups = (len(str(top)) + 3) // 4
+    if groups == 1:
+        return [(_TRIMMED[values], _TRIMMED_LENGTHS[values])]
+    words = []
+    for i in range(groups - 1, -1, -1):
+        high = values // 10 ** (4 * i)
+        group = high % 10000
+        full = high >= 10000
+        # words above the first digit are empty, but for the last one of 0
+        empty = high == 0 if i else np.zeros(values.shape, dtype=bool)
+        words.append(
+            (
+                np.where(full, _PADDED[group], np.where(empty, 0, _TRIMMED[group])),
+                np.where(full, 4, np.where(empty, 0, _TRIMMED_LENGTHS[group])),
+            )
+        )
+    return words
+
+
+def _counts(values):
+    """Counts as int64, missing counts are 0"""
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        values = np.nan_to_num(values)
+    return values.astype(np.int64, copy=False)
+
+
+def _fractions(ref, alt, vafs, scale):
+    """VF times scale, rounded, from the allele frequencies when given and
+    from the counts otherwise, 0 where there is no fragment"""
+    if vafs is None:
+        depth = ref + alt
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vaf = np.rint(alt / depth * scale)
+        vaf = np.where(depth > 0, vaf, 0)
+    else:
+        vaf = np.rint(np.clip(np.nan_to_num(vafs), 0, 1) * scale)
+    return vaf.astype(np.int64)
+
+
+def format_summary(ref_counts, alt_counts, precision=VAF_PRECISION, vafs=None):
+    """Summaries DP=<ref + alt>;RD=<ref>;AD=<alt>;VF=<alt / DP> for arrays
+    of reference and alternate allele counts.
+
+    Each summary is a row of a fixed width bytes array. The digits of the
+    counts are looked up 4 at a time as uint32 words and each column of
+    words is stored 4 bytes at a time at the end of the characters of its
+    row so far, the NUL bytes after the characters of a word are overwritten
+    by the next one, instead of converting and concatenating each column as
+    Python strings. Missing counts are 0 and VF is rounded to precision
+    decimals as the VAF columns of the merged MAF, 0 where DP is 0.
+
+    Args:
+        ref_counts: reference allele counts
+        alt_counts: alternate allele counts
+        precision: decimals of VF, 1 to 8
+        vafs: allele frequencies written as VF in place of alt / DP,
+            missing frequencies are 0
+
+    Returns:
+        numpy.ndarray: ASCII summaries of ``S`` dtype, NUL padded
+    """
+    if not 1 <= precision <= 8:
+        raise ValueError("VAF precision must be between 1 and 8, not %s" % precision)
+    ref_counts, alt_counts = _counts(ref_counts), _counts(alt_counts)
+    depth_counts = ref_counts + alt_counts
+    # DP=, ;RD=, ;AD=, ;VF=, the integer digit and point of VF and the
+    # digits of the largest counts, the last word of VF is stored whole with
+    # the NUL bytes after its digits
+    width = 17 + precision + (-precision % 4)
+    for counts in (depth_counts, ref_counts, alt_counts):
+        width += len(str(int(counts.max()) if counts.size else 0))
+    buffer = np.zeros(ref_counts.size * width + 3, dtype=np.uint8)
+    # overlapping uint32 words starting at each byte of the summaries
+    windows = np.ndarray(
+        (ref_counts.size * width,), dtype="<u4", buffer=buffer, strides=(1,)
+    )
+    scale = 10**precision
+    for start in range(0, ref_counts.size, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, ref_counts.size)
+        ref, alt = ref_counts[start:stop], alt_counts[start:stop]
+        vaf = _fractions(ref, alt, None if vafs is None else vafs[start:stop], scale)
+        fraction = vaf % scale
+        # the zero padding of the fraction over precision digits is shifted
+        # out of its first word
+        if precision > 4:
+            fraction_words = [
+                (
+                    _PADDED[fraction // 10000] >> np.uint32(8 * (8 - precision)),
+                    precision - 4,
+                ),
+                (_PADDED[fraction % 10000], 4),
+            ]
+        else:
+            fraction_words = [
+                (_PADDED[fraction] >> np.uint32(8 * (4 - precision)), precision)
+            ]
+        integer, point = _word("0.")
+        columns = (
+            [_word("DP=")]
+            + _number_words(depth_counts[start:stop])
+            + [_word(";RD=")]
+            + _number_words(ref)
+            + [_word(";AD=")]
+            + _number_words(alt)
+            + [_word(";VF="), (integer + (vaf // scale).astype(np.uint32), point)]
+            + fraction_words
+        )
+        offsets = np.arange(start, stop, dtype=np.int64) * width
+        for word, length in columns:
+            windows[offsets] = word
+            offsets += length
+    return buffer[: ref_counts.size * width].view("S%d" % width)
+
+
+def summary_fields(df, precision=VAF_PRECISION):
+    """Summaries of each assay with its fragment counts in a merged data
+    frame, as the bytes arrays of format_summary.
+
+    Args:
+        df: merged, or simplex duplex, data frame
+        precision: decimals of VF
+
+    Returns:
+        dict: summary column -> summaries, in the order of SUMMARY_COLUMNS
+    """
+    return {
+        column: format_summary(
+            df[ref_column].to_numpy(), df[alt_column].to_numpy(), precision
+        )
+        for column, (ref_column, alt_column) in SUMMARY_COLUMNS.items()
+        if ref_column in df.columns and alt_column in df.columns
+    }
+
+
+def add_summary_fields(df, precision=VAF_PRECISION):
+    """Add the summary columns of summary_fields to the end of a data frame,
+    in place, decoded to strings for writing the MAF
+
+    Returns:
+        list: summary columns added
+    """
+    fields = summary_fields(df, precision)
+    for column, summaries in fields.items():
+        df[column] = summaries.astype(str)
+    return list(fields)
+
 
 def generate_summary_field(df_fillout):
-    """Code to Generate Summary Field"""
-    np.seterr(divide="ignore", invalid="ignore")
+    """Code to Generate Summary Field
+
+    VF is the t_vaf_fragment column when there is one, rounded to
+    VAF_PRECISION decimals, and alt / DP of the fragment counts otherwise.
+    """
     df_fillout = df_fillout.copy()
-    df_fillout["summary_fragment"] = (
-        "DP="
-        + (
-            df_fillout["t_alt_count_fragment"].astype(int)
-            + df_fillout["t_ref_count_fragment"].astype(int)
-        ).astype(str)
-        + ";RD="
-        + df_fillout["t_ref_count_fragment"].astype(str)
-        + ";AD="
-        + df_fillout["t_alt_count_fragment"].astype(str)
-        + ";VF="
-        + df_fillout["t_vaf_fragment"].fillna(0).astype(str)
-    )
+    vafs = None
+    if "t_vaf_fragment" in df_fillout.columns:
+        vafs = df_fillout["t_vaf_fragment"].to_numpy(dtype=float)
+    df_fillout["summary_fragment"] = format_summary(
+        df_fillout["t_ref_count_fragment"].to_numpy(),
+        df_fillout["t_alt_count_fragment"].to_numpy(),
+        vafs=vafs,
+    ).astype(str)
     return df_fillout
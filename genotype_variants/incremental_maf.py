@@ -0,0 +1,204 @@
+import collections
+import logging
+import os
+import pathlib
+import tempfile
+
+from genotype_variants.compressed_io import open_maf
+from genotype_variants.maf_schema import MUTATION_KEY
+from genotype_variants.shard_maf import read_maf_header
+
+"""
+incremental_maf
+~~~~~~~~~~~~~~~
+:Description: Code to genotype only the variants missing from a previous genotyped MAF
+"""
+"""
+Description: Code to genotype only the variants missing from a previous genotyped MAF
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+
+def _key_columns(header, maf):
+    """Positions of the mutation key columns in a MAF column header"""
+    columns = header.rstrip("\r\n").split("\t")
+    missing = [column for column in MUTATION_KEY if column not in columns]
+    if missing:
+        raise ValueError("%s does not have column(s) %s" % (maf, ", ".join(missing)))
+    return [columns.index(column) for column in MUTATION_KEY]
+
+
+def _mutation_key(line, key_columns):
+    fields = line.rstrip("\r\n").split("\t")
+    return tuple(fields[i].strip() for i in key_columns)
+
+
+def read_genotyped_records(maf):
+    """Read the records of a genotyped MAF file by mutation key, gzip and
+    BGZF compressed files included.
+
+    Returns:
+        tuple: (comment lines, column header, dict of mutation key -> list of
+            lines), the lines of a mutation key in the order of the file
+    """
+    with open_maf(maf) as f:
+        comments, header = read_maf_header(f)
+        if header is None:
+            return comments, None, {}
+        key_columns = _key_columns(header, maf)
+        records = {}
+        for line in f:
+            records.setdefault(_mutation_key(line, key_columns), []).append(line)
+    return comments, header, records
+
+
+def count_input_keys(input_maf):
+    """Number of records of each mutation key in a MAF file"""
+    with open_maf(input_maf) as f:
+        _, header = read_maf_header(f)
+        if header is None:
+            raise ValueError("%s does not have a column header" % input_maf)
+        key_columns = _key_columns(header, input_maf)
+        counts = collections.Counter(_mutation_key(line, key_columns) for line in f)
+    return counts
+
+
+def _reusable(key, input_counts, records):
+    """A previous genotyped record can only be matched to a record of the
+    input when the mutation key is in each of them once, records repeating a
+    variant, such as one per tumor sample, are genotyped again"""
+    return input_counts[key] == 1 and len(records.get(key, ())) == 1
+
+
+def create_delta_maf(input_maf, previous_mafs, delta_maf):
+    """Write the records of input_maf missing from any previous genotyped MAF.
+
+    Records are written unchanged and in the order of input_maf, together
+    with its comment lines and column header, so the delta can be genotyped
+    like the full input. A previous MAF that does not exist has none of the
+    records. All the records of a mutation key that is repeated in input_maf
+    or in a previous MAF are written, as a previous record can not be told
+    apart from the others of its key.
+
+    Args:
+        input_maf: Path to input MAF file
+        previous_mafs: list of paths to genotyped MAF files of a previous run
+        delta_maf: Path to the output MAF file
+
+    Returns:
+        int: number of records written to delta_maf
+    """
+    input_counts = count_input_keys(input_maf)
+    previous_keys = []
+    for previous_maf in previous_mafs:
+        records = {}
+        if os.path.isfile(previous_maf):
+            records = read_genotyped_records(previous_maf)[2]
+        previous_keys.append(
+            {key for key in records if _reusable(key, input_counts, records)}
+        )
+    written = 0
+    total = 0
+    with open_maf(input_maf) as f, open(delta_maf, "w") as out:
+        comments, header = read_maf_header(f)
+        if header is None:
+            raise ValueError("%s does not have a column header" % input_maf)
+        key_columns = _key_columns(header, input_maf)
+        out.writelines(comments)
+        out.write(header)
+        for line in f:
+            total += 1
+            key = _mutation_key(line, key_columns)
+            if not all(key in keys for keys in previous_keys):
+                out.write(line)
+                written += 1
+    logger.info(
+        "genotype_variants:small_variants:create_delta_maf:: %s of %s variants in %s are not genotyped yet",
+        written,
+        total,
+        input_maf,
+    )
+    return written
+
+
+def splice_genotyped_maf(input_maf, previous_maf, delta_genotyped_maf, output_maf):
+    """Put together the genotypes of a previous run and of the delta.
+
+    For every record of input_maf, in order, the genotyped record is taken
+    from the previous genotyped MAF when the mutation key is in both files
+    once and from the genotyped delta otherwise, the records of a repeated
+    mutation key in the order they have in the delta. Variants of the
+    previous run that are no longer in input_maf are dropped, so the output
+    is the same as genotyping the whole of input_maf. output_maf is replaced
+    atomically and can be the same file as previous_maf.
+
+    Args:
+        input_maf: Path to input MAF file
+        previous_maf: Path to genotyped MAF file of a previous run, can be
+            missing
+        delta_genotyped_maf: Path to genotyped delta MAF file, None when there
+            was nothing to genotype
+        output_maf: Path to the output MAF file
+
+    Returns:
+        int: number of records taken from the previous run
+    """
+    previous = (None, None, {})
+    if previous_maf and os.path.isfile(previous_maf):
+        previous = read_genotyped_records(previous_maf)
+    delta = (None, None, {})
+    if delta_genotyped_maf:
+        delta = read_genotyped_records(delta_genotyped_maf)
+    comments, header, _ = delta if delta[1] is not None else previous
+    if header is None:
+        raise ValueError("Neither the previous nor the delta genotyped MAF is present")
+    if previous[1] is not None and previous[1] != header:
+        raise ValueError(
+            "%s does not have the same columns as the genotyped delta" % previous_maf
+        )
+
+    output_maf = pathlib.Path(output_maf)
+    fd, tmp = tempfile.mkstemp(
+        prefix="." + output_maf.name + ".", suffix=".tmp", dir=output_maf.parent
+    )
+    reused = 0
+    try:
+        input_counts = count_input_keys(input_maf)
+        delta_records = {key: iter(lines) for key, lines in delta[2].items()}
+        with open_maf(input_maf) as f, os.fdopen(fd, "w") as out:
+            _, input_header = read_maf_header(f)
+            key_columns = _key_columns(input_header, input_maf)
+            out.writelines(comments)
+            out.write(header)
+            for line in f:
+                key = _mutation_key(line, key_columns)
+                record = None
+                if _reusable(key, input_counts, previous[2]):
+                    record = previous[2][key][0]
+                    reused += 1
+                elif key in delta_records:
+                    record = next(delta_records[key], None)
+                if record is None:
+                    raise ValueError(
+                        "Variant %s is neither in the previous nor in the genotyped delta MAF"
+                        % ":".join(key)
+                    )
+                if not record.endswith("\n"):
+                    record += "\n"
+                out.write(record)
+        os.replace(tmp, output_maf)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    logger.info(
+        "genotype_variants:small_variants:splice_genotyped_maf:: %s genotypes reused from %s and the rest taken from %s, written to %s",
+        reused,
+        previous_maf,
+        delta_genotyped_maf,
+        output_maf,
+    )
+    return reused
@@ -0,0 +1,292 @@
+import importlib.util
+import logging
+import sys
+
+from genotype_variants.compressed_io import is_seekable, open_bgzf, open_maf
+from genotype_variants.shard_maf import read_maf_header
+
+"""
+maf_schema
+~~~~~~~~~~~~~~~
+:Description: Code to read MAF files with the column types used by genotype_variants
+"""
+"""
+Description: Code to read MAF files with the column types used by genotype_variants
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+# Columns of a MAF file written by GetBaseCountMultiSample
+MAF_COLUMNS = [
+    "Hugo_Symbol",
+    "Entrez_Gene_Id",
+    "Center",
+    "NCBI_Build",
+    "Chromosome",
+    "Start_Position",
+    "End_Position",
+    "Strand",
+    "Variant_Classification",
+    "Variant_Type",
+    "Reference_Allele",
+    "Tumor_Seq_Allele1",
+    "Tumor_Seq_Allele2",
+    "dbSNP_RS",
+    "dbSNP_Val_Status",
+    "Tumor_Sample_Barcode",
+    "Matched_Norm_Sample_Barcode",
+    "Match_Norm_Seq_Allele1",
+    "Match_Norm_Seq_Allele2",
+    "Tumor_Validation_Allele1",
+    "Tumor_Validation_Allele2",
+    "Match_Norm_Validation_Allele1",
+    "Match_Norm_Validation_Allele2",
+    "Verification_Status",
+    "Validation_Status",
+    "Mutation_Status",
+    "Sequencing_Phase",
+    "Sequence_Source",
+    "Validation_Method",
+    "Score",
+    "BAM_File",
+    "Sequencer",
+    "t_ref_count",
+    "t_alt_count",
+    "n_ref_count",
+    "n_alt_count",
+    "Caller",
+    "t_total_count",
+    "t_variant_frequency",
+    "t_total_count_forward",
+    "t_ref_count_forward",
+    "t_alt_count_forward",
+    "t_total_count_fragment",
+    "t_ref_count_fragment",
+    "t_alt_count_fragment",
+]
+
+# Count columns written by GetBaseCountMultiSample
+COUNT_COLUMNS = [
+    "t_ref_count",
+    "t_alt_count",
+    "t_total_count",
+    "t_variant_frequency",
+    "t_total_count_forward",
+    "t_ref_count_forward",
+    "t_alt_count_forward",
+    "t_total_count_fragment",
+    "t_ref_count_fragment",
+    "t_alt_count_fragment",
+]
+
+# Columns identifying a variant
+MUTATION_KEY = [
+    "Chromosome",
+    "Start_Position",
+    "End_Position",
+    "Reference_Allele",
+    "Tumor_Seq_Allele2",
+]
+# Columns to read from GetBaseCountMultiSample output for each bam type
+GENOTYPED_COLUMNS = MUTATION_KEY + ["Tumor_Sample_Barcode"] + COUNT_COLUMNS
+
+MAF_DTYPES = {
+    "Chromosome": "category",
+    "Start_Position": "int32",
+    "End_Position": "int32",
+    "Reference_Allele": str,
+    "Tumor_Seq_Allele1": str,
+    "Tumor_Seq_Allele2": str,
+    "Tumor_Sample_Barcode": "category",
+    "Matched_Norm_Sample_Barcode": "category",
+}
+
+COUNT_DTYPES = {
+    column: "float32" if column == "t_variant_frequency" else "int32"
+    for column in COUNT_COLUMNS
+}
+
+
+# Formats a merged MAF can be written in, parquet and feather need pyarrow,
+# bgzip is MAF text compressed as BGZF
+OUTPUT_FORMATS = ["maf", "bgzip", "parquet", "feather"]
+OUTPUT_SUFFIXES = {
+    "maf": ".maf",
+    "bgzip": ".maf.gz",
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+# Formats written as MAF text, which can be written in batches
+TEXT_FORMATS = ["maf", "bgzip"]
+
+
+def require_pyarrow(file_format):
+    """Raise ValueError if pyarrow, needed to read and write file_format, is
+    not installed"""
+    if file_format not in TEXT_FORMATS and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError(
+            "pyarrow is not installed, please install pyarrow to use %s files"
+            % file_format
+        )
+
+
+def columnar_format(input_maf):
+    """Format of a Parquet or Feather file from its magic bytes, None for
+    MAF text, compressed or not, standard input and pipes"""
+    if not is_seekable(input_maf):
+        return None
+    with open(input_maf, "rb") as f:
+        magic = f.read(6)
+    if magic[:4] == b"PAR1":
+        return "parquet"
+    if magic == b"ARROW1":
+        return "feather"
+    return None
+
+
+def _read_columnar(input_maf, file_format, columns, genotyped, text):
+    """Read a Parquet or Feather file written by ``write_maf`` as ``read_maf``
+    reads a MAF file"""
+    require_pyarrow(file_format)
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    input_maf = str(input_maf)
+    if file_format == "parquet":
+        names = pyarrow.parquet.read_schema(input_maf).names
+    else:
+        with pyarrow.memory_map(input_maf) as source:
+            names = pyarrow.ipc.open_file(source).schema.names
+    usecols = names if columns is None else [c for c in names if c in columns]
+    if file_format == "parquet":
+        table = pyarrow.parquet.read_table(input_maf, columns=usecols)
+    else:
+        table = pyarrow.feather.read_table(input_maf, columns=usecols)
+    df = table.to_pandas()
+    if text:
+        return df.astype(object).where(df.notna(), "").astype(str)
+    schema = dict(MAF_DTYPES, **COUNT_DTYPES) if genotyped else MAF_DTYPES
+    # text columns are already object columns, astype(str) would turn NaN into text
+    return df.astype(
+        {
+            column: schema[column]
+            for column in usecols
+            if column in schema and schema[column] is not str
+        }
+    )
+
+
+def _read_csv_options(f, input_maf, columns, genotyped, text, passthrough):
+    """Options of pandas.read_csv for the rest of an open MAF file, after
+    its comment lines and column header"""
+    _, header = read_maf_header(f)
+    if header is None:
+        raise ValueError("%s does not have a column header" % input_maf)
+    names = header.rstrip("\r\n").split("\t")
+    usecols = names if columns is None else [c for c in names if c in columns]
+    if text:
+        dtype = str
+    else:
+        schema = dict(MAF_DTYPES, **COUNT_DTYPES) if genotyped else MAF_DTYPES
+        dtype = {
+            column: schema.get(column, str)
+            for column in usecols
+            if column in schema or passthrough
+        }
+    return dict(
+        sep="\t",
+        header=None,
+        names=names,
+        usecols=usecols,
+        dtype=dtype,
+        keep_default_na=not (text or passthrough),
+        index_col=False,
+    )
+
+
+def read_maf(input_maf, columns=None, genotyped=False, text=False, passthrough=False):
+    """Read a MAF file with explicit column types.
+
+    The mutation key and sample columns of every MAF file get compact types,
+    the count columns only for GetBaseCountMultiSample output where they are
+    always filled in. Other columns are parsed as pandas would. Comment
+    lines before the header are skipped. gzip and BGZF compressed MAF files
+    are decompressed as they are read.
+
+    Args:
+        input_maf: Path to MAF file, - for standard input
+        columns: columns to read, in the order of the file, None for all
+        genotyped: Whether the file is GetBaseCountMultiSample output
+        text: Whether to read every value as text, for passing rows through
+        passthrough: Whether to read the columns without a type in the
+            schema as text, so they are written back as they were read
+
+    Returns:
+        pandas.DataFrame: MAF data frame
+    """
+    import pandas as pd
+
+    file_format = columnar_format(input_maf)
+    if file_format:
+        return _read_columnar(input_maf, file_format, columns, genotyped, text)
+    with open_maf(input_maf) as f:
+        return pd.read_csv(
+            f, **_read_csv_options(f, input_maf, columns, genotyped, text, passthrough)
+        )
+
+
+def read_maf_batches(
+    input_maf, batch_size, columns=None, genotyped=False, passthrough=False
+):
+    """Read a MAF file in data frames of at most batch_size records.
+
+    Same as ``read_maf`` but only one batch is held in memory at a time.
+    A MAF file without records gives one empty data frame with its columns.
+
+    Yields:
+        pandas.DataFrame: MAF data frame of the next batch_size records
+    """
+    import pandas as pd
+
+    if columnar_format(input_maf):
+        raise ValueError(
+            "%s is not a MAF file, only MAF files can be read in batches" % input_maf
+        )
+    with open_maf(input_maf) as f:
+        options = _read_csv_options(
+            f, input_maf, columns, genotyped, False, passthrough
+        )
+        with pd.read_csv(f, chunksize=batch_size, **options) as reader:
+            yield from reader
+
+
+def write_maf(data_frame, output_maf, output_format="maf", threads=1):
+    """Write a MAF data frame as MAF text, BGZF compressed MAF text, Parquet
+    or Feather.
+
+    The columnar formats keep the column types of the data frame, the index
+    is not written.
+
+    Args:
+        data_frame: MAF data frame
+        output_maf: Path to write to, - for standard output
+        output_format: one of OUTPUT_FORMATS
+        threads: Number of threads compressing BGZF blocks
+    """
+    require_pyarrow(output_format)
+    # pandas formats the index even when it is not written, the merged
+    # data frames are indexed on the five column mutation key
+    data_frame = data_frame.reset_index(drop=True)
+    if output_format == "bgzip":
+        with open_bgzf(output_maf, threads) as f:
+            data_frame.to_csv(f, sep="\t", index=False)
+        return
+    if str(output_maf) == "-":
+        output_maf = sys.stdout if output_format == "maf" else sys.stdout.buffer
+    if output_format == "parquet":
+        data_frame.to_parquet(output_maf, index=False)
+    elif output_format == "feather":
+        data_frame.to_feather(output_maf)
+    else:
+        data_frame.to_csv(output_maf, sep="\t", index=False)
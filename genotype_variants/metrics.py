@@ -0,0 +1,340 @@
+import bisect
+import functools
+import logging
+import os
+import resource
+
+"""
+metrics
+~~~~~~~~~~~~~~~
+:Description: Code to export run metrics for the node_exporter textfile collector
+"""
+"""
+Description: Code to count the samples, variants and GetBaseCountMultiSample runs of a
+    command, with histograms of their wall time and the peak RSS, and write them to a
+    file in the Prometheus text format every time they change, so the node_exporter
+    textfile collector sees a batch run progress without a live service
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+# Bucket upper bounds of the histograms in seconds
+GBCMS_BUCKETS = [1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400]
+MERGE_BUCKETS = [0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600]
+
+# name -> (type, help, histogram buckets) of the exported metrics
+METRICS = {
+    "genotype_variants_samples_processed_total": (
+        "counter",
+        "Samples processed, by status",
+        None,
+    ),
+    "genotype_variants_variants_genotyped_total": (
+        "counter",
+        "Variants genotyped by GetBaseCountMultiSample, counted once per BAM file, by BAM type",
+        None,
+    ),
+    "genotype_variants_gbcms_failures_total": (
+        "counter",
+        "GetBaseCountMultiSample runs that failed or timed out, by BAM type",
+        None,
+    ),
+    "genotype_variants_gbcms_duration_seconds": (
+        "histogram",
+        "Wall time of the GetBaseCountMultiSample runs, by BAM type",
+        GBCMS_BUCKETS,
+    ),
+    "genotype_variants_merge_duration_seconds": (
+        "histogram",
+        "Wall time of merging the genotyped MAF files of a sample",
+        MERGE_BUCKETS,
+    ),
+    "genotype_variants_peak_rss_bytes": (
+        "gauge",
+        "Peak resident set size of the genotype_variants processes and of the "
+        "GetBaseCountMultiSample runs",
+        None,
+    ),
+}
+
+
+class _Metrics:
+    """Values of the metrics recorded by this process"""
+
+    def __init__(self, metrics_file):
+        self.metrics_file = metrics_file
+        # (name, labels) -> counter or gauge value, or histogram bucket
+        # counts, +Inf last, followed by the sum and the count of the observations
+        self.values = {}
+        self.sample_depth = 0
+
+
+_metrics = None
+
+
+def is_recording():
+    return _metrics is not None
+
+
+def start_metrics(metrics_file):
+    """Start recording metrics and write them to metrics_file.
+
+    Args:
+        metrics_file: Path to the file the metrics are written to, it is
+            replaced every time the metrics change
+    """
+    global _metrics
+    if _metrics is not None:
+        return
+    _metrics = _Metrics(metrics_file)
+    write_metrics()
+
+
+def stop_metrics():
+    """Write the metrics a last time and stop recording them"""
+    global _metrics
+    if _metrics is None:
+        return
+    write_metrics()
+    logger.info(
+        "genotype_variants:metrics:stop_metrics:: metrics have been written to %s",
+        _metrics.metrics_file,
+    )
+    _metrics = None
+
+
+def _labels(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def inc_counter(name, labels=None, amount=1):
+    """Add amount to a counter, the file is not written"""
+    if _metrics is None or not amount:
+        return
+    key = (name, _labels(labels))
+    _metrics.values[key] = _metrics.values.get(key, 0) + amount
+
+
+def set_max_gauge(name, value, labels=None):
+    """Raise a gauge to value if it is higher, the file is not written"""
+    if _metrics is None:
+        return
+    key = (name, _labels(labels))
+    _metrics.values[key] = max(_metrics.values.get(key, 0), value)
+
+
+def observe(name, value, labels=None):
+    """Add an observation to a histogram, the file is not written"""
+    if _metrics is None:
+        return
+    buckets = METRICS[name][2]
+    key = (name, _labels(labels))
+    counts = _metrics.values.setdefault(key, [0] * (len(buckets) + 3))
+    counts[bisect.bisect_left(buckets, value)] += 1
+    counts[-2] += value
+    counts[-1] += 1
+
+
+def take_metrics():
+    """Values recorded since the last call, to send the metrics of a worker
+    process to the process writing the file
+
+    Returns:
+        dict: (name, labels) -> value, None if no metrics are recorded
+    """
+    if _metrics is None:
+        return None
+    _record_peak_rss()
+    values = _metrics.values
+    _metrics.values = {}
+    return values
+
+
+def add_metrics(values):
+    """Add the values returned by take_metrics in another process and write
+    the file"""
+    if _metrics is None or not values:
+        return
+    for (name, labels), value in values.items():
+        metric_type = METRICS[name][0]
+        current = _metrics.values.get((name, labels))
+        if current is None:
+            _metrics.values[(name, labels)] = value
+        elif metric_type == "histogram":
+            _metrics.values[(name, labels)] = [a + b for a, b in zip(current, value)]
+        elif metric_type == "gauge":
+            _metrics.values[(name, labels)] = max(current, value)
+        else:
+            _metrics.values[(name, labels)] = current + value
+    write_metrics()
+
+
+def record_gbcms_runs(results, bam_types, variant_counts):
+    """Record GetBaseCountMultiSample runs and write the file.
+
+    Args:
+        results: label -> run_cmd.CmdResult of the runs
+        bam_types: label -> BAM types of the BAM files of the run, the
+            failures and the wall time are labelled with the distinct ones
+            joined by "-", such as DUPLEX-SIMPLEX
+        variant_counts: label -> number of variants genotyped by the run
+    """
+    if _metrics is None:
+        return
+    for label, result in results.items():
+        bam_type = "-".join(dict.fromkeys(bam_types[label]))
+        set_max_gauge(
+            "genotype_variants_peak_rss_bytes",
+            result.resource_usage.get("max_rss_kb", 0) * 1024,
+            {"process": "gbcms"},
+        )
+        observe(
+            "genotype_variants_gbcms_duration_seconds",
+            result.duration,
+            {"bam_type": bam_type},
+        )
+        if result.returncode != 0:
+            inc_counter(
+                "genotype_variants_gbcms_failures_total", {"bam_type": bam_type}
+            )
+            continue
+        for bam_type in bam_types[label]:
+            inc_counter(
+                "genotype_variants_variants_genotyped_total",
+                {"bam_type": bam_type},
+                variant_counts[label],
+            )
+    write_metrics()
+
+
+def count_sample(function):
+    """Decorator counting a call as a processed sample, with status success
+    unless it raises or exits with a non zero status. Calls made by another
+    decorated function are part of its sample and are not counted."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _metrics is None:
+            return function(*args, **kwargs)
+        metrics = _metrics
+        metrics.sample_depth += 1
+        status = "failed"
+        try:
+            output = function(*args, **kwargs)
+            status = "success"
+            return output
+        except SystemExit as e:
+            if not e.code:
+                status = "success"
+            raise
+        finally:
+            metrics.sample_depth -= 1
+            if not metrics.sample_depth and _metrics is metrics:
+                inc_counter(
+                    "genotype_variants_samples_processed_total", {"status": status}
+                )
+                write_metrics()
+
+    return wrapper
+
+
+def _record_peak_rss():
+    # kilobytes on Linux
+    set_max_gauge(
+        "genotype_variants_peak_rss_bytes",
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        {"process": "genotype_variants"},
+    )
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '%s="%s"'
+            % (
+                name,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace("\n", "\\n")
+                .replace('"', '\\"'),
+            )
+            for name, value in labels
+        )
+        + "}"
+    )
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def format_metrics(values):
+    """Metric values in the Prometheus text format"""
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        samples = sorted(
+            (labels, value) for (key, labels), value in values.items() if key == name
+        )
+        if not samples:
+            continue
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, metric_type))
+        for labels, value in samples:
+            if metric_type != "histogram":
+                lines.append(
+                    "%s%s %s" % (name, _format_labels(labels), _format_value(value))
+                )
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ["+Inf"], value[:-2]):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(
+                    "%s_bucket%s %d"
+                    % (name, _format_labels(labels + (("le", le),)), cumulative)
+                )
+            lines.append(
+                "%s_sum%s %s" % (name, _format_labels(labels), repr(float(value[-2])))
+            )
+            lines.append("%s_count%s %d" % (name, _format_labels(labels), value[-1]))
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def write_metrics():
+    """Write the metrics to the metrics file of this process.
+
+    The file is written next to it and renamed, so the textfile collector
+    never reads a partly written file. Worker processes do not write it.
+    """
+    if _metrics is None or _metrics.metrics_file is None:
+        return
+    _record_peak_rss()
+    metrics_file = str(_metrics.metrics_file)
+    tmp_file = "%s.%s.tmp" % (metrics_file, os.getpid())
+    try:
+        with open(tmp_file, "w") as f:
+            f.write(format_metrics(_metrics.values))
+        os.replace(tmp_file, metrics_file)
+    except OSError as e:
+        logger.warning(
+            "genotype_variants:metrics:write_metrics:: could not write %s, due to error: %s",
+            metrics_file,
+            e,
+        )
+
+
+def _reset_in_child():
+    """Keep recording in a forked worker without its parent's values, the
+    worker sends them back with take_metrics instead of writing the file"""
+    if _metrics is not None:
+        _metrics.metrics_file = None
+        _metrics.values = {}
+        _metrics.sample_depth = 0
+
+
+os.register_at_fork(after_in_child=_reset_in_child)
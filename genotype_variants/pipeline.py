@@ -0,0 +1,139 @@
+import contextlib
+import logging
+import os
+import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from genotype_variants.run_gbcms import run_gbcms_jobs
+
+"""
+pipeline
+~~~~~~~~~~~~~~~
+:Description: Code to read the outputs of GetBaseCountMultiSample runs while they are written
+"""
+"""
+Description: Code to run GetBaseCountMultiSample with its output MAF files made into named
+    pipes, so they are merged as they are written instead of after being written to disk
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+# bytes copied at a time from a pipe to the kept output MAF
+COPY_SIZE = 1024 * 1024
+
+
+class PipedOutput:
+    """Output MAF file of a GetBaseCountMultiSample run made into a named pipe.
+
+    A thread copies the named pipe to an anonymous pipe, read through path,
+    and to keep_maf when given. Unlike a named pipe, an anonymous pipe
+    opened through /dev/fd does not wait for a writer, so the output can be
+    opened for reading after the run is over.
+
+    The named pipe is held open for writing until the run has finished, so
+    the run does not block opening it and the copy only gets to the end of
+    the file once the run is over, even when it failed before opening its
+    output. Opening a named pipe for reading and writing at once is Linux
+    specific.
+    """
+
+    def __init__(self, fifo, keep_maf=None):
+        self.fifo = pathlib.Path(fifo)
+        os.mkfifo(self.fifo)
+        self._hold = os.open(self.fifo, os.O_RDWR)
+        fifo_read = os.open(self.fifo, os.O_RDONLY)
+        self._relay_read, relay_write = os.pipe()
+        self.path = pathlib.Path(f"/dev/fd/{self._relay_read}")
+        self._relay = threading.Thread(
+            target=self._copy, args=(fifo_read, relay_write, keep_maf), daemon=True
+        )
+        self._relay.start()
+
+    def _copy(self, fifo_read, relay_write, keep_maf):
+        try:
+            with open(relay_write, "wb") as relay, open(fifo_read, "rb") as f, (
+                open(keep_maf, "wb") if keep_maf else contextlib.nullcontext()
+            ) as kept:
+                for chunk in iter(lambda: f.read1(COPY_SIZE), b""):
+                    if kept:
+                        kept.write(chunk)
+                    relay.write(chunk)
+        except OSError as e:
+            # the reader stopped early, the run is stopped as well
+            logger.debug(
+                "genotype_variants:small_variants:pipeline:: stopped copying %s, %s",
+                self.fifo,
+                e,
+            )
+
+    def finish(self):
+        """Let the reader get to the end of the file once the run has
+        closed its output, called when the run is over"""
+        hold, self._hold = self._hold, None
+        if hold is not None:
+            os.close(hold)
+
+    def close(self):
+        """Stop reading and remove the named pipe"""
+        self.finish()
+        if self._relay_read is not None:
+            os.close(self._relay_read)
+            self._relay_read = None
+        self._relay.join()
+        self.fifo.unlink(missing_ok=True)
+
+
+def run_pipelined_jobs(jobs, job_outputs, consume, keep_mafs=None, timeout=None):
+    """Run GetBaseCountMultiSample commands while their outputs are read.
+
+    The output MAF files of the commands are made into named pipes and the
+    commands are all run at the same time, as a command stops once its pipe
+    is full until it is read. consume has to read every output to the end,
+    the rows of all of them together. When consume fails the commands are
+    stopped.
+
+    Args:
+        jobs: list of (label, command) tuples, label is usually the BAM type
+        job_outputs: label -> output MAF path of each command, in a
+            directory of the local file system
+        consume: function called with label -> path to read the output of
+            each command from, in the calling thread
+        keep_mafs: label -> path the output of a command is also written to
+        timeout: wall clock timeout in seconds for each command
+
+    Returns:
+        tuple: (label -> run_cmd.CmdResult, return value of consume)
+    """
+    keep_mafs = keep_mafs or {}
+    outputs = {}
+    cancel_event = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        for label, output_maf in job_outputs.items():
+            outputs[label] = PipedOutput(output_maf, keep_mafs.get(label))
+        future = executor.submit(
+            run_gbcms_jobs,
+            jobs,
+            True,
+            None,
+            timeout,
+            cancel_event,
+            lambda label: outputs[label].finish(),
+        )
+        try:
+            consumed = consume(
+                {label: output.path for label, output in outputs.items()}
+            )
+        except BaseException:
+            cancel_event.set()
+            # failed commands are logged once they are all stopped
+            wait([future])
+            raise
+        results = future.result()
+    finally:
+        cancel_event.set()
+        for output in outputs.values():
+            output.close()
+        executor.shutdown()
+    return results, consumed
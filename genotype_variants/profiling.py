@@ -0,0 +1,187 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+
+"""
+profiling
+~~~~~~~~~~~~~~~
+:Description: Code to profile the CPU time and memory of a command
+"""
+"""
+Description: Code to profile a command with cProfile and tracemalloc, with the time and peak
+    traced memory of its named stages, such as reading, merging and writing the MAF files
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+# Functions listed in the text summary for each sort order
+SUMMARY_LINES = 40
+SUMMARY_SORTS = ["cumulative", "tottime"]
+
+
+class _Profile:
+    """State of the running profile"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.profiler = cProfile.Profile()
+        self.start = time.perf_counter()
+        self.peak = 0
+        # open stages, innermost last, and the totals of each stage by name
+        self.open_stages = []
+        self.stages = {}
+
+
+class _Stage:
+    """Context manager recording the time and peak memory of a stage"""
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        _fold_peak(self.profile)
+        self.start = time.perf_counter()
+        self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.peak = self.start_memory
+        self.profile.open_stages.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _fold_peak(self.profile)
+        self.profile.open_stages.remove(self)
+        totals = self.profile.stages.setdefault(
+            self.name, {"calls": 0, "seconds": 0.0, "start_memory": 0, "peak": 0}
+        )
+        totals["calls"] += 1
+        totals["seconds"] += time.perf_counter() - self.start
+        totals["start_memory"] = max(totals["start_memory"], self.start_memory)
+        totals["peak"] = max(totals["peak"], self.peak)
+        return False
+
+
+class _NoStage:
+    """Stage used when no profile is running, does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+_profile = None
+
+
+def _fold_peak(profile):
+    """Add the peak traced memory since the last call to the open stages,
+    so each stage keeps its own peak when the peak is reset"""
+    peak = tracemalloc.get_traced_memory()[1]
+    for open_stage in profile.open_stages:
+        open_stage.peak = max(open_stage.peak, peak)
+    profile.peak = max(profile.peak, peak)
+    tracemalloc.reset_peak()
+
+
+def stage(name):
+    """Context manager recording the time and peak traced memory of a stage
+    of the running profile, stages with the same name are added up.
+
+    Nothing is recorded, and nearly no time spent, when no profile runs.
+    """
+    if _profile is None:
+        return _NO_STAGE
+    return _Stage(_profile, name)
+
+
+def is_profiling():
+    return _profile is not None
+
+
+def start_profile(prefix):
+    """Start profiling the CPU time and memory of this process.
+
+    Args:
+        prefix: Path prefix of the <prefix>.prof and <prefix>_profile.txt
+            files written by stop_profile
+    """
+    global _profile
+    if _profile is not None:
+        return
+    _profile = _Profile(prefix)
+    tracemalloc.start()
+    _profile.profiler.enable()
+
+
+def stop_profile():
+    """Stop profiling and write the cProfile statistics to <prefix>.prof and
+    a ranked text summary with the time and peak memory of each stage to
+    <prefix>_profile.txt.
+
+    Returns:
+        tuple: paths of the statistics and summary files, None if no profile
+            was running
+    """
+    global _profile
+    profile = _profile
+    if profile is None:
+        return None
+    profile.profiler.disable()
+    _profile = None
+    _fold_peak(profile)
+    tracemalloc.stop()
+    seconds = time.perf_counter() - profile.start
+
+    stats_file = str(profile.prefix) + ".prof"
+    summary_file = str(profile.prefix) + "_profile.txt"
+    profile.profiler.dump_stats(stats_file)
+    with open(summary_file, "w") as f:
+        f.write(
+            "Wall time: %.3f s, peak traced memory: %.1f MB\n\n"
+            % (seconds, profile.peak / 1e6)
+        )
+        f.write(
+            "%-20s %8s %12s %16s %14s\n"
+            % ("stage", "calls", "seconds", "start MB", "peak MB")
+        )
+        for name, totals in profile.stages.items():
+            f.write(
+                "%-20s %8d %12.3f %16.1f %14.1f\n"
+                % (
+                    name,
+                    totals["calls"],
+                    totals["seconds"],
+                    totals["start_memory"] / 1e6,
+                    totals["peak"] / 1e6,
+                )
+            )
+        for sort in SUMMARY_SORTS:
+            stream = io.StringIO()
+            stats = pstats.Stats(profile.profiler, stream=stream)
+            stats.strip_dirs().sort_stats(sort).print_stats(SUMMARY_LINES)
+            f.write("\nTop %d functions by %s time\n" % (SUMMARY_LINES, sort))
+            f.write(stream.getvalue())
+    logger.info(
+        "genotype_variants:profiling:stop_profile:: profile has been written to %s and %s",
+        stats_file,
+        summary_file,
+    )
+    return stats_file, summary_file
+
+
+def _stop_in_child():
+    """Stop the profile inherited by a forked worker without writing it, only
+    the process that started it is profiled"""
+    global _profile
+    if _profile is not None:
+        _profile.profiler.disable()
+        _profile = None
+        tracemalloc.stop()
+
+
+os.register_at_fork(after_in_child=_stop_in_child)
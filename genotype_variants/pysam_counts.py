@@ -0,0 +1,301 @@
+import argparse
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from genotype_variants.shard_maf import read_maf_header
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+"""
+pysam_counts
+~~~~~~~~~~~~~~~
+:Description: Code to count bases supporting the variants of a MAF file with pysam
+"""
+"""
+Description: Code to count bases supporting the variants of a MAF file with pysam,
+    a drop in replacement for GetBaseCountMultiSample with the same command line
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+COUNT_COLUMNS = [
+    "t_ref_count",
+    "t_alt_count",
+    "t_total_count",
+    "t_total_count_forward",
+    "t_ref_count_forward",
+    "t_alt_count_forward",
+    "t_total_count_fragment",
+    "t_ref_count_fragment",
+    "t_alt_count_fragment",
+]
+FRAGMENT_COLUMNS = COUNT_COLUMNS[6:]
+
+
+def parse_variant(start_position, reference_allele, tumor_seq_allele2):
+    """Reference window of a MAF variant.
+
+    The window is given as 0-based half open reference positions with the
+    alleles expected in it. Substitutions cover their bases, insertions an
+    empty window after Start_Position and deletions or complex events the
+    bases of the reference allele.
+
+    Returns:
+        tuple: (substitution, start, end, reference_allele, alternate_allele)
+    """
+    ref = "" if reference_allele == "-" else reference_allele.upper()
+    alt = "" if tumor_seq_allele2 == "-" else tumor_seq_allele2.upper()
+    start = int(start_position) - 1
+    if not ref:
+        # MAF insertions start at the base before the inserted sequence
+        start += 1
+    return (len(ref) == len(alt), start, start + len(ref), ref, alt)
+
+
+def read_allele(read, variant, generic_counting=False):
+    """Allele of a variant supported by an aligned read.
+
+    Substitutions need every base of the window aligned, other variants need
+    the read to be aligned on both bases flanking the window. By default a
+    read aligned on the window without an insertion or deletion supports the
+    reference allele whatever its bases, and a read with the inserted or
+    deleted sequence supports the alternate allele. With generic_counting
+    the sequence between the flanks, inserted bases included, has to be one
+    of the alleles, as for complex events.
+
+    Returns:
+        str: 'ref', 'alt' or 'other', None if the read does not cover the
+            variant
+    """
+    substitution, start, end, ref, alt = variant
+    pairs = read.get_aligned_pairs()
+    query = read.query_sequence
+    if substitution:
+        bases = {r: q for q, r in pairs if r is not None and start <= r < end}
+        if len(bases) != end - start or None in bases.values():
+            return None
+        sequence = "".join(query[bases[r]] for r in range(start, end))
+    else:
+        left, right = None, None
+        for i, (_, r) in enumerate(pairs):
+            if r == start - 1:
+                left = i
+            elif r == end and left is not None:
+                right = i
+                break
+        if right is None:
+            return None
+        window = pairs[left + 1 : right]
+        sequence = "".join(query[q] for q, _ in window if q is not None)
+        if not generic_counting and all(
+            q is not None and r is not None for q, r in window
+        ):
+            return "ref"
+    sequence = sequence.upper()
+    if sequence == ref:
+        return "ref"
+    if sequence == alt:
+        return "alt"
+    return "other"
+
+
+def count_variant(
+    bam, chromosome, variant, filter_duplicate, mapping_quality, generic_counting
+):
+    """Counts of one variant in an open pysam.AlignmentFile, in the order of
+    COUNT_COLUMNS"""
+    counts = np.zeros(len(COUNT_COLUMNS), dtype=np.int64)
+    fragments = {}
+    _, start, end, _, _ = variant
+    for read in bam.fetch(chromosome, max(start - 1, 0), end + 1):
+        if read.is_unmapped or read.mapping_quality < mapping_quality:
+            continue
+        if filter_duplicate and read.is_duplicate:
+            continue
+        allele = read_allele(read, variant, generic_counting)
+        if allele is None:
+            continue
+        counts[2] += 1
+        counts[0] += allele == "ref"
+        counts[1] += allele == "alt"
+        if not read.is_reverse:
+            counts[3] += 1
+            counts[4] += allele == "ref"
+            counts[5] += allele == "alt"
+        fragments.setdefault(read.query_name, set()).add(allele)
+    for alleles in fragments.values():
+        # mates disagreeing on the allele count towards the depth only
+        counts[6] += 1
+        counts[7] += "ref" in alleles and "alt" not in alleles
+        counts[8] += "alt" in alleles and "ref" not in alleles
+    return counts
+
+
+def count_variants(bams, variants, filter_duplicate, mapping_quality, generic_counting):
+    """Counts of variants in BAM files, an array of shape
+    (BAM files, variants, COUNT_COLUMNS)"""
+    counts = np.zeros((len(bams), len(variants), len(COUNT_COLUMNS)), dtype=np.int64)
+    for b, bam_path in enumerate(bams):
+        with pysam.AlignmentFile(bam_path, "rb") as bam:
+            for v, (chromosome, variant) in enumerate(variants):
+                counts[b, v] = count_variant(
+                    bam,
+                    chromosome,
+                    variant,
+                    filter_duplicate,
+                    mapping_quality,
+                    generic_counting,
+                )
+    return counts
+
+
+def count_maf(
+    input_maf,
+    labelled_bams,
+    output_maf,
+    filter_duplicate=True,
+    fragment_count=True,
+    mapping_quality=20,
+    threads=1,
+    generic_counting=False,
+):
+    """Count the bases supporting the variants of a MAF file in BAM files.
+
+    The output has the records of input_maf for each BAM file, in the order
+    of labelled_bams, with Tumor_Sample_Barcode set to the label of the BAM
+    file and the count columns that GetBaseCountMultiSample writes with
+    --omaf. Variants are split between threads worker processes.
+
+    Args:
+        input_maf: Path to input MAF file
+        labelled_bams: list of (label, bam) tuples
+        output_maf: Path to the output MAF file
+        filter_duplicate: Whether to skip reads marked as duplicate
+        fragment_count: Whether to write fragment counts
+        mapping_quality: Minimum mapping quality of the reads counted
+        threads: Number of worker processes
+        generic_counting: Whether an indel read has to carry one of the
+            alleles across the whole window, see ``read_allele``
+    """
+    if pysam is None:
+        raise ImportError("pysam is required by the pysam counting backend")
+    with open(input_maf) as f:
+        _, header = read_maf_header(f)
+        maf = pd.read_csv(
+            f,
+            sep="\t",
+            header=None,
+            names=header.rstrip("\r\n").split("\t"),
+            dtype=str,
+            keep_default_na=False,
+        )
+    variants = [
+        (str(chromosome), parse_variant(start, ref, alt))
+        for chromosome, start, ref, alt in zip(
+            maf["Chromosome"],
+            maf["Start_Position"],
+            maf["Reference_Allele"],
+            maf["Tumor_Seq_Allele2"],
+        )
+    ]
+    bams = [bam for _, bam in labelled_bams]
+    chunks = [
+        chunk.tolist()
+        for chunk in np.array_split(np.arange(len(variants)), max(1, threads))
+        if len(chunk)
+    ]
+    if len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            counts = np.concatenate(
+                list(
+                    executor.map(
+                        count_variants,
+                        [bams] * len(chunks),
+                        [[variants[v] for v in chunk] for chunk in chunks],
+                        [filter_duplicate] * len(chunks),
+                        [mapping_quality] * len(chunks),
+                        [generic_counting] * len(chunks),
+                    )
+                ),
+                axis=1,
+            )
+    else:
+        counts = count_variants(
+            bams, variants, filter_duplicate, mapping_quality, generic_counting
+        )
+
+    output = []
+    for b, (label, _) in enumerate(labelled_bams):
+        genotyped = maf.copy()
+        genotyped["Tumor_Sample_Barcode"] = label
+        for c, column in enumerate(COUNT_COLUMNS):
+            if column in FRAGMENT_COLUMNS and not fragment_count:
+                continue
+            genotyped[column] = counts[b, :, c]
+        # single precision frequency with 10 significant digits, as GetBaseCountMultiSample
+        alt = counts[b, :, 1].astype(np.float32)
+        total = counts[b, :, 2].astype(np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frequency = np.where(total > 0, alt / total, np.float32(0))
+        genotyped["t_variant_frequency"] = ["%.10g" % f for f in frequency]
+        output.append(genotyped)
+    pd.concat(output, ignore_index=True).to_csv(output_maf, sep="\t", index=False)
+    logger.info(
+        "genotype_variants:pysam_counts:count_maf:: %s variants counted in %s BAM files, written to %s",
+        len(variants),
+        len(bams),
+        output_maf,
+    )
+
+
+def main(args=None):
+    """Command line with the GetBaseCountMultiSample options used by
+    genotype_variants"""
+    parser = argparse.ArgumentParser(
+        prog="genotype_variants.pysam_counts",
+        description="Count bases supporting the variants of a MAF file with pysam",
+    )
+    parser.add_argument("--bam", action="append", required=True, help="label:bam")
+    parser.add_argument("--maf", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--fasta", help="accepted for compatibility, not used")
+    parser.add_argument("--omaf", action="store_true")
+    parser.add_argument("--filter_duplicate", type=int, default=1)
+    parser.add_argument("--fragment_count", type=int, default=0)
+    parser.add_argument("--maq", type=int, default=20)
+    parser.add_argument("--thread", type=int, default=1)
+    parser.add_argument(
+        "--generic_counting",
+        action="store_true",
+        help="count indel reads on the sequence across the whole variant window",
+    )
+    args = parser.parse_args(args)
+    labelled_bams = []
+    for bam in args.bam:
+        label, _, path = bam.partition(":")
+        if not path:
+            parser.error("--bam should be given as label:bam")
+        labelled_bams.append((label, path))
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    count_maf(
+        args.maf,
+        labelled_bams,
+        args.output,
+        filter_duplicate=bool(args.filter_duplicate),
+        fragment_count=bool(args.fragment_count),
+        mapping_quality=args.maq,
+        threads=args.thread,
+        generic_counting=args.generic_counting,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
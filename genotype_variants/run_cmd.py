@@ -1,10 +1,15 @@
+import collections
 import logging
+import os
+import signal
 import subprocess
+import threading
+import time
 
 """
 run_cmd
 ~~~~~~~~~~~~~~~
-:Description: Code to run shell commands 
+:Description: Code to run shell commands
 """
 """
 Created on January 29, 2020
@@ -14,24 +19,206 @@ Description: Code to run shell commands
 # Making logging possible
 logger = logging.getLogger("genotype_variants")
 
+CmdResult = collections.namedtuple(
+    "CmdResult",
+    [
+        "cmd",
+        "returncode",
+        "duration",
+        "output_tail",
+        "timed_out",
+        "cancelled",
+        "resource_usage",
+    ],
+)
+CmdResult.__doc__ = """Result of a shell command run by run_cmd.
 
-def run_cmd(cmd):
-    """Code to run shell commands"""
+    cmd: the command line
+    returncode: exit code, negative if the command was killed by a signal
+    duration: wall clock time in seconds
+    output_tail: last lines of the combined stdout and stderr
+    timed_out: the command was stopped because it ran past the timeout
+    cancelled: the command was stopped because the cancel event was set
+    resource_usage: dict of CPU time, peak memory, block I/O and context
+        switches of the command and the processes it waited for
+"""
+
+
+def _drain(stream, tail):
+    """Log the output of a command line by line as it is written"""
+    for line in stream:
+        line = line.rstrip("\n")
+        tail.append(line)
+        logger.debug("run_cmd: run: Read: %s", line)
+    stream.close()
+
+
+def _signal(process, sig):
+    """Send a signal to the process group of a command"""
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _stop(process, grace_period):
+    """Stop the process group of a command, killing it if it is still
+    running after the grace period"""
+    _signal(process, signal.SIGTERM)
+    try:
+        process.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        pass
+    finally:
+        _signal(process, signal.SIGKILL)
+        process.wait()
+
+
+def _peak_rss_kb(pid):
+    """Peak resident set size of a running process and its descendants.
+
+    The peak of each process is read from /proc and summed, so 0 is returned
+    where /proc is not available.
+    """
+    peak_rss_kb = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open("/proc/%s/status" % pid) as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peak_rss_kb += int(line.split()[1])
+                        break
+            for task in os.listdir("/proc/%s/task" % pid):
+                with open("/proc/%s/task/%s/children" % (pid, task)) as f:
+                    pids.extend(f.read().split())
+        except (OSError, ValueError):
+            pass
+    return peak_rss_kb
+
+
+def _resource_usage(rusage, peak_rss_kb):
+    """Resource usage of a finished command from the rusage returned by wait4.
+
+    ru_maxrss of a child also covers the memory of this process at the time
+    the child was spawned, so the peak sampled from /proc while the command
+    and the processes it started ran is used when it is available.
+    """
+    return {
+        "user_cpu_seconds": round(rusage.ru_utime, 3),
+        "system_cpu_seconds": round(rusage.ru_stime, 3),
+        # kilobytes on Linux
+        "max_rss_kb": peak_rss_kb or rusage.ru_maxrss,
+        # 512 byte blocks read from or written to disk, page cache hits are not counted
+        "block_input_bytes": rusage.ru_inblock * 512,
+        "block_output_bytes": rusage.ru_oublock * 512,
+        "voluntary_context_switches": rusage.ru_nvcsw,
+        "involuntary_context_switches": rusage.ru_nivcsw,
+    }
+
+
+def run_cmd(
+    cmd,
+    timeout=None,
+    cancel_event=None,
+    tail_lines=50,
+    poll_interval=0.05,
+    grace_period=10,
+):
+    """Code to run shell commands.
+
+    The combined stdout and stderr of the command is drained by a background
+    thread into the debug log while the command runs, so a command writing a
+    lot of output never blocks on a full pipe and commands running in other
+    threads are not held up.
+
+    Args:
+        cmd: command line, run through the shell
+        timeout: wall clock timeout in seconds, the command is stopped when it
+            runs longer
+        cancel_event: threading.Event, the command is stopped when it is set
+        tail_lines: number of output lines kept in the result
+        poll_interval: seconds between checks for timeout and cancellation
+        grace_period: seconds to wait after stopping the command before it
+            is killed
+
+    Returns:
+        CmdResult: exit code, duration, tail of the output and resource
+            usage of the command
+    """
     logger.debug(
         "run_cmd: run: the command line is %s",
         cmd.encode("unicode_escape").decode("utf-8"),
     )
+    start = time.perf_counter()
     out = subprocess.Popen(
         (cmd),
-        stdin=subprocess.PIPE,
+        stdin=subprocess.DEVNULL,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         shell=True,
+        text=True,
+        errors="replace",
+        start_new_session=True,
+    )
+    tail = collections.deque(maxlen=tail_lines)
+    reader = threading.Thread(target=_drain, args=(out.stdout, tail), daemon=True)
+    reader.start()
+
+    # wait4 rather than Popen.wait to get the resource usage of the command
+    timed_out, cancelled = False, False
+    stop_time = None
+    peak_rss_kb = 0
+    try:
+        while True:
+            pid, status, rusage = os.wait4(out.pid, os.WNOHANG)
+            if pid:
+                out.returncode = os.waitstatus_to_exitcode(status)
+                break
+            peak_rss_kb = max(peak_rss_kb, _peak_rss_kb(out.pid))
+            time.sleep(poll_interval)
+            now = time.perf_counter()
+            if stop_time is None:
+                if timeout is not None and now - start > timeout:
+                    timed_out = True
+                elif cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                else:
+                    continue
+                stop_time = now
+                _signal(out, signal.SIGTERM)
+            elif now - stop_time > grace_period:
+                _signal(out, signal.SIGKILL)
+    except BaseException:
+        # the command runs in its own session, out of reach of a Ctrl-C in the
+        # terminal, so it is stopped here before the interrupt is passed on
+        _stop(out, grace_period)
+        raise
+    reader.join()
+    duration = time.perf_counter() - start
+
+    if timed_out:
+        logger.error(
+            "run_cmd: run: command was stopped after running for more than %s seconds: %s",
+            timeout,
+            cmd,
+        )
+    elif cancelled:
+        logger.warning("run_cmd: run: command was cancelled: %s", cmd)
+    elif out.returncode != 0:
+        logger.error(
+            "run_cmd: run: command exited with code %s: %s\n%s",
+            out.returncode,
+            cmd,
+            "\n".join(tail),
+        )
+    return CmdResult(
+        cmd,
+        out.returncode,
+        duration,
+        list(tail),
+        timed_out,
+        cancelled,
+        _resource_usage(rusage, peak_rss_kb),
     )
-    out.wait()
-    stdout, stderr = out.communicate()
-    if stderr is None:
-        logger.debug("run_cmd: run: Read: %s", stdout.decode("utf-8"))
-    else:
-        logger.error("run_cmd: run: could not run")
-    return out
@@ -0,0 +1,118 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from genotype_variants.run_cmd import run_cmd
+
+"""
+run_gbcms
+~~~~~~~~~~~~~~~
+:Description: Code to schedule GetBaseCountMultiSample runs
+"""
+"""
+Description: Code to schedule GetBaseCountMultiSample runs
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+
+def split_threads(total_threads, number_of_jobs):
+    """Split a total thread budget between jobs.
+
+    Every job gets at least one thread, the remainder of the division is
+    handed out to the first jobs so the budget is never exceeded unless there
+    are more jobs than threads.
+
+    Args:
+        total_threads: Total number of threads available
+        number_of_jobs: Number of jobs sharing the threads
+
+    Returns:
+        list: number of threads for each job
+    """
+    number_of_jobs = max(1, int(number_of_jobs))
+    total_threads = max(int(total_threads), number_of_jobs)
+    base, extra = divmod(total_threads, number_of_jobs)
+    return [base + 1 if i < extra else base for i in range(number_of_jobs)]
+
+
+def run_gbcms_jobs(
+    jobs,
+    concurrent=False,
+    max_workers=None,
+    timeout=None,
+    cancel_event=None,
+    on_finished=None,
+):
+    """Run GetBaseCountMultiSample commands.
+
+    When running concurrently and the caller is interrupted, the commands
+    that are still running are stopped and the ones waiting are not started.
+
+    Args:
+        jobs: list of (label, command) tuples, label is usually the BAM type
+        concurrent: launch all the commands together and wait on all of them
+        max_workers: maximum number of commands running at the same time
+            when concurrent, defaults to all of them
+        timeout: wall clock timeout in seconds for each command
+        cancel_event: threading.Event another thread can set to stop the
+            commands, those not started yet are not run
+        on_finished: function called with the label of each command as soon
+            as it has finished, whether it succeeded or not
+
+    Returns:
+        dict: label -> run_cmd.CmdResult, failed runs are logged per label
+    """
+    results = {}
+    if cancel_event is None:
+        cancel_event = threading.Event()
+
+    def run(label, cmd):
+        try:
+            return run_cmd(cmd, timeout, cancel_event)
+        finally:
+            if on_finished:
+                on_finished(label)
+
+    if concurrent and len(jobs) > 1:
+        executor = ThreadPoolExecutor(max_workers=max_workers or len(jobs))
+        futures = [(label, executor.submit(run, label, cmd)) for label, cmd in jobs]
+        try:
+            for label, future in futures:
+                results[label] = future.result()
+        except BaseException:
+            cancel_event.set()
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    else:
+        for label, cmd in jobs:
+            results[label] = run(label, cmd)
+
+    for label, result in results.items():
+        if result.returncode != 0:
+            logger.error(
+                "genotype_variants:small_variants:run_gbcms:: GetBaseCountMultiSample failed for %s with exit code %s after %.1f [min]%s",
+                label,
+                result.returncode,
+                result.duration / 60,
+                " (timed out)" if result.timed_out else "",
+            )
+        else:
+            logger.info(
+                "genotype_variants:small_variants:run_gbcms:: GetBaseCountMultiSample finished for %s in %.1f [min], CPU time %.1f [min], max RSS %.2f [GB]",
+                label,
+                result.duration / 60,
+                (
+                    result.resource_usage["user_cpu_seconds"]
+                    + result.resource_usage["system_cpu_seconds"]
+                )
+                / 60,
+                result.resource_usage["max_rss_kb"] / 1024**2,
+            )
+    return results
+
+
+def failed_jobs(results):
+    """Labels of the jobs in the output of run_gbcms_jobs that did not succeed"""
+    return [label for label, result in results.items() if result.returncode != 0]
@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import socket
+import time
+
+"""
+run_report
+~~~~~~~~~~~~~~~
+:Description: Code to report resource usage of GetBaseCountMultiSample runs
+"""
+"""
+Description: Code to report resource usage of GetBaseCountMultiSample runs
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+
+def count_maf_variants(maf):
+    """Number of variant records in a MAF file, without reading it in memory"""
+    count = -1
+    with open(maf) as f:
+        for line in f:
+            if not line.startswith("#"):
+                count += 1
+    return max(count, 0)
+
+
+def create_run_record(label, result, input_maf, bams, variant_count=None):
+    """Create a report record for one GetBaseCountMultiSample run.
+
+    Args:
+        label: label of the run, usually the BAM type
+        result: run_cmd.CmdResult of the run
+        input_maf: Path to the MAF file given to GetBaseCountMultiSample
+        bams: list of BAM files given to GetBaseCountMultiSample
+        variant_count: number of variants in input_maf, counted if not given
+
+    Returns:
+        dict: JSON serializable record of the run
+    """
+    if variant_count is None:
+        variant_count = count_maf_variants(input_maf)
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": socket.gethostname(),
+        "label": label,
+        "input_maf": str(input_maf),
+        "variant_count": variant_count,
+        "bams": [str(bam) for bam in bams],
+        "bam_size_bytes": sum(os.path.getsize(bam) for bam in bams),
+        "returncode": result.returncode,
+        "timed_out": result.timed_out,
+        "wall_seconds": round(result.duration, 3),
+    }
+    record.update(result.resource_usage)
+    return record
+
+
+def write_run_report(report_file, records):
+    """Append records to a JSON lines report file.
+
+    Each record is written with a single append so concurrent jobs can share
+    the same report file.
+    """
+    with open(report_file, "a") as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+            f.flush()
+    logger.debug(
+        "genotype_variants:small_variants:run_report:: %s records appended to %s",
+        len(records),
+        report_file,
+    )
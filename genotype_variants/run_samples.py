@@ -0,0 +1,203 @@
+import csv
+import logging
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from genotype_variants.metrics import add_metrics, inc_counter, take_metrics
+
+"""
+run_samples
+~~~~~~~~~~~~~~~
+:Description: Code to run genotyping for many samples in a process pool
+"""
+"""
+Description: Code to run genotyping for many samples in a process pool
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+STATUS_HEADER = ["sample_id", "status", "elapsed_min", "output", "message"]
+
+
+def sample_log_file(sample_id):
+    """Log file of a sample run by run_samples"""
+    return pathlib.Path.cwd().joinpath("genotype_variants_" + str(sample_id) + ".log")
+
+
+def run_sample(sample_id, kwargs, log_level=logging.INFO, command="all", log_file=None):
+    """Run a small_variants command, all by default, for one sample.
+
+    The sample is logged to its own log file only, the file handlers of the
+    caller, inherited by a forked worker, are taken off the logger while it
+    runs. A failure is returned as a status instead of stopping the caller.
+
+    Args:
+        sample_id: Sample identifier
+        kwargs: keyword arguments for the small_variants command
+        log_level: level of the genotype_variants logger in the worker
+        command: name of the small_variants command function, all or merge
+        log_file: Path to the log file of the sample, defaults to
+            genotype_variants_<sample_id>.log in the current working directory
+
+    Returns:
+        dict: status record with the keys in STATUS_HEADER
+    """
+    from genotype_variants.commands import small_variants
+
+    logger.setLevel(log_level)
+    log_file = pathlib.Path(log_file or sample_log_file(sample_id))
+    caller_handlers = [
+        handler
+        for handler in logger.handlers
+        if isinstance(handler, logging.FileHandler)
+    ]
+    for handler in caller_handlers:
+        logger.removeHandler(handler)
+    fh = small_variants.add_log_file_handler(log_file)
+    t1_start = time.perf_counter()
+    status, output, message = "failed", None, ""
+    try:
+        output = getattr(small_variants, command).callback(**kwargs)
+        status = "success"
+    except SystemExit as e:
+        message = "exited with status %s, see %s" % (e.code, log_file.name)
+    except Exception as e:
+        logger.exception(
+            "genotype_variants:small_variants:run_sample:: %s failed", sample_id
+        )
+        message = repr(e)
+    finally:
+        logger.removeHandler(fh)
+        fh.close()
+        for handler in caller_handlers:
+            logger.addHandler(handler)
+    return {
+        "sample_id": sample_id,
+        "status": status,
+        "elapsed_min": round((time.perf_counter() - t1_start) / 60, 2),
+        "output": str(output) if output else "",
+        "message": message,
+    }
+
+
+def run_sample_in_worker(
+    sample_id, kwargs, log_level=logging.INFO, command="all", log_file=None
+):
+    """Run a sample with run_sample in a worker process, with the metrics it
+    recorded for the caller to add to its own"""
+    return run_sample(sample_id, kwargs, log_level, command, log_file), take_metrics()
+
+
+def run_samples(samples, jobs=1, log_level=logging.INFO, command="all"):
+    """Run a small_variants command, all by default, for many samples.
+
+    Workers forked from the caller, the default on Linux, start with the
+    modules it has imported instead of importing them again. Each sample is
+    logged to genotype_variants_<sample_id>.log in the current working
+    directory of the caller. The metrics of each sample are added to those of
+    the caller as soon as it finishes. Samples of a worker that died, and
+    of the workers stopped with it, are reported as failed.
+
+    Args:
+        samples: list of (sample_id, kwargs, error) tuples, samples with an
+            error message are reported as invalid and not run
+        jobs: number of samples to run at the same time
+        log_level: level of the genotype_variants logger in the workers
+        command: name of the small_variants command function, all or merge
+
+    Returns:
+        list: status records in the same order as samples
+    """
+    results = [None] * len(samples)
+    pending = []
+    for i, (sample_id, kwargs, error) in enumerate(samples):
+        if error:
+            results[i] = {
+                "sample_id": sample_id,
+                "status": "invalid",
+                "elapsed_min": 0,
+                "output": "",
+                "message": error,
+            }
+            inc_counter(
+                "genotype_variants_samples_processed_total", {"status": "invalid"}
+            )
+        else:
+            pending.append((i, sample_id, kwargs))
+
+    if jobs > 1 and len(pending) > 1:
+        t1_start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+            futures = {
+                executor.submit(
+                    run_sample_in_worker,
+                    sample_id,
+                    kwargs,
+                    log_level,
+                    command,
+                    sample_log_file(sample_id),
+                ): (i, sample_id)
+                for i, sample_id, kwargs in pending
+            }
+            for future in as_completed(futures):
+                i, sample_id = futures[future]
+                try:
+                    results[i], metrics = future.result()
+                except Exception as e:
+                    # a worker that died, BrokenProcessPool for the samples
+                    # it and the other workers were running, fails the
+                    # samples instead of the whole run
+                    logger.error(
+                        "genotype_variants:small_variants:run_samples:: %s failed in its worker process, %s",
+                        sample_id,
+                        e,
+                    )
+                    results[i] = {
+                        "sample_id": sample_id,
+                        "status": "failed",
+                        "elapsed_min": round((time.perf_counter() - t1_start) / 60, 2),
+                        "output": "",
+                        "message": repr(e),
+                    }
+                    inc_counter(
+                        "genotype_variants_samples_processed_total",
+                        {"status": "failed"},
+                    )
+                    continue
+                add_metrics(metrics)
+                logger.info(
+                    "genotype_variants:small_variants:run_samples:: %s finished with status %s",
+                    results[i]["sample_id"],
+                    results[i]["status"],
+                )
+    else:
+        for i, sample_id, kwargs in pending:
+            results[i] = run_sample(
+                sample_id, kwargs, log_level, command, sample_log_file(sample_id)
+            )
+    return results
+
+
+def log_status_table(results):
+    """Log the status records returned by run_samples as a table"""
+    widths = [
+        max([len(column)] + [len(str(result[column])) for result in results])
+        for column in STATUS_HEADER
+    ]
+    for row in [dict(zip(STATUS_HEADER, STATUS_HEADER))] + results:
+        logger.info(
+            "%s",
+            "  ".join(
+                str(row[column]).ljust(width)
+                for column, width in zip(STATUS_HEADER, widths)
+            ),
+        )
+
+
+def write_status_table(file_name, results):
+    """Write the status records returned by run_samples as a TSV file"""
+    with open(file_name, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=STATUS_HEADER, delimiter="\t")
+        writer.writeheader()
+        writer.writerows(results)
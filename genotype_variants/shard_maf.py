@@ -0,0 +1,182 @@
+import heapq
+import logging
+import pathlib
+
+"""
+shard_maf
+~~~~~~~~~~~~~~~
+:Description: Code to split a MAF file into shards and to put the genotyped shards back together
+"""
+"""
+Description: Code to split a MAF file into shards and to put the genotyped shards back together
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+SHARD_BY = ["chromosome", "chunks"]
+
+
+def read_maf_header(f):
+    """Read the comment lines and the column header of an open MAF file"""
+    comments = []
+    for line in f:
+        if line.startswith("#"):
+            comments.append(line)
+        else:
+            return comments, line
+    return comments, None
+
+
+def shard_maf(input_maf, output_dir, shard_by="chromosome", shards=None):
+    """Split a MAF file into shards that can be genotyped independently.
+
+    The MAF file is streamed line by line, records are written to the shards
+    unchanged together with the comment lines and the column header of the
+    input. The position of each record in the input is kept so the genotyped
+    shards can be put back together in the original order by
+    ``concat_shard_mafs``.
+
+    Args:
+        input_maf: Path to input MAF file
+        output_dir: Path to directory where the shards are written
+        shard_by: Either 'chromosome', one shard per chromosome, or 'chunks',
+            ``shards`` shards of consecutive records of about the same size
+        shards: Number of shards when sharding by chunks
+
+    Returns:
+        list: (shard_label, shard_maf_path, row_indices) tuples, shards
+            without records are left out
+    """
+    if shard_by not in SHARD_BY:
+        raise ValueError("shard_by should be one of %s" % ", ".join(SHARD_BY))
+    if shard_by == "chunks" and not (shards and shards > 0):
+        raise ValueError("Number of shards is required when sharding by chunks")
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stem = pathlib.Path(input_maf).name
+    if stem.endswith(".maf"):
+        stem = stem[: -len(".maf")]
+
+    if shard_by == "chunks":
+        with open(input_maf) as f:
+            read_maf_header(f)
+            number_of_rows = sum(1 for _ in f)
+        base, extra = divmod(number_of_rows, shards)
+        chunk_ends = []
+        end = 0
+        for i in range(shards):
+            end += base + 1 if i < extra else base
+            chunk_ends.append(end)
+
+    files = {}
+    indices = {}
+    with open(input_maf) as f:
+        comments, header = read_maf_header(f)
+        if header is None:
+            raise ValueError("%s does not have a column header" % input_maf)
+        columns = header.rstrip("\r\n").split("\t")
+        if "Chromosome" not in columns:
+            raise ValueError("%s does not have a Chromosome column" % input_maf)
+        chromosome = columns.index("Chromosome")
+        chunk = 0
+        try:
+            for row, line in enumerate(f):
+                if shard_by == "chunks":
+                    while row >= chunk_ends[chunk]:
+                        chunk += 1
+                    label = "CHUNK%s" % (chunk + 1)
+                else:
+                    label = line.split("\t", chromosome + 1)[chromosome].strip()
+                if label not in files:
+                    shard_file = output_dir / f"{stem}_{label}.maf"
+                    files[label] = open(shard_file, "w")
+                    files[label].writelines(comments)
+                    files[label].write(header)
+                    indices[label] = []
+                files[label].write(line)
+                indices[label].append(row)
+        finally:
+            for shard in files.values():
+                shard.close()
+
+    sharded = [
+        (label, pathlib.Path(files[label].name), indices[label]) for label in files
+    ]
+    logger.info(
+        "genotype_variants:small_variants:shard_maf:: %s split by %s into %s shards",
+        input_maf,
+        shard_by,
+        len(sharded),
+    )
+    return sharded
+
+
+def concat_shard_mafs(shard_mafs, output_maf):
+    """Put genotyped shards back together in the order of the original MAF.
+
+    Each genotyped shard must have one record per record of the shard it was
+    generated from, in the same order, which is how GetBaseCountMultiSample
+    writes its output. The shards are merged on the original record positions
+    while streaming, so the output is identical to genotyping the original
+    MAF in a single run.
+
+    Args:
+        shard_mafs: list of (genotyped_shard_maf_path, row_indices) tuples,
+            row_indices as returned by ``shard_maf``
+        output_maf: Path to the output MAF file
+
+    Returns:
+        int: number of records written
+    """
+
+    def records(f, row_indices):
+        for row, line in zip(row_indices, f):
+            yield row, line
+
+    files = []
+    try:
+        header = None
+        comments = []
+        streams = []
+        for shard_maf_path, row_indices in shard_mafs:
+            f = open(shard_maf_path)
+            files.append(f)
+            shard_comments, shard_header = read_maf_header(f)
+            if header is None:
+                comments, header = shard_comments, shard_header
+            elif shard_header != header:
+                raise ValueError(
+                    "%s does not have the same columns as the other shards"
+                    % shard_maf_path
+                )
+            streams.append(records(f, row_indices))
+
+        written = 0
+        with open(output_maf, "w") as out:
+            out.writelines(comments)
+            if header is not None:
+                out.write(header)
+            for _, line in heapq.merge(*streams, key=lambda record: record[0]):
+                if not line.endswith("\n"):
+                    line += "\n"
+                out.write(line)
+                written += 1
+
+        # every record of a shard should have been genotyped
+        expected = sum(len(row_indices) for _, row_indices in shard_mafs)
+        leftover = sum(1 for f in files for _ in f)
+        if written != expected or leftover:
+            raise ValueError(
+                "Genotyped shards have %s records, expected %s"
+                % (written + leftover, expected)
+            )
+    finally:
+        for f in files:
+            f.close()
+    logger.debug(
+        "genotype_variants:small_variants:concat_shard_mafs:: %s records from %s shards written to %s",
+        written,
+        len(shard_mafs),
+        output_maf,
+    )
+    return written
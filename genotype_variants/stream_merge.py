@@ -0,0 +1,202 @@
+import contextlib
+import itertools
+import logging
+import pathlib
+import sys
+
+import numpy as np
+
+from genotype_variants.compressed_io import open_bgzf
+from genotype_variants.create_duplex_simplex_dataframe import (
+    create_duplex_simplex_dataframe as cdsd,
+)
+from genotype_variants.create_all_maf_dataframe import create_all_maf_dataframe as camd
+from genotype_variants.generate_summary_field import add_summary_fields
+from genotype_variants.maf_schema import GENOTYPED_COLUMNS, read_maf_batches
+from genotype_variants.profiling import stage
+from genotype_variants.variant_key import encode_mutation_keys
+
+"""
+stream_merge
+~~~~~~~~~~~~~~~
+:Description: Code to merge genotyped MAF files in batches of records
+"""
+"""
+Description: Code to merge genotyped MAF files in batches of records, so the memory used
+    does not grow with the number of variants
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+
+def merge_maf_dataframes(o_maf, i_maf, d_maf, s_maf, low_memory=False):
+    """Merge the original MAF data frame with the genotyped data frames.
+
+    The input data frames are not copied first, the merged data frames can
+    be built from them in place.
+
+    Args:
+        o_maf: original MAF data frame used as input for GBCMS, or None
+        i_maf: GBCMS data frame for standard_bam, or None
+        d_maf: GBCMS data frame for duplex_bam, or None
+        s_maf: GBCMS data frame for simplex_bam, or None
+        low_memory: Whether to compute only the new count columns instead of
+            merging copies of the data frames
+
+    Returns:
+        tuple: (simplex duplex data frame or None, merged data frame or None,
+            label of the merged data frame or None)
+    """
+    options = dict(low_memory=low_memory, copy=False)
+    ds_maf = None
+    if d_maf is not None and s_maf is not None:
+        with stage("cdsd"):
+            ds_maf = cdsd(s_maf, d_maf, **options)
+    # any two of the original, standard and simplex duplex data frames merge
+    if sum(df is not None for df in (o_maf, i_maf, ds_maf)) < 2:
+        return ds_maf, None, None
+    with stage("camd"):
+        if o_maf is not None and i_maf is not None and ds_maf is not None:
+            merged = camd(o_maf, i_maf, ds_maf, **options)
+            return ds_maf, merged, "ORG-STD-SIMPLEX-DUPLEX"
+        if o_maf is not None and i_maf is not None:
+            return ds_maf, camd(o_maf, i_maf, None, **options), "ORG-STD"
+        if o_maf is not None:
+            return ds_maf, camd(o_maf, None, ds_maf, **options), "ORG-SIMPLEX-DUPLEX"
+        return ds_maf, camd(None, i_maf, ds_maf, **options), "STD-SIMPLEX-DUPLEX"
+
+
+def merge_label(input_maf, input_standard_maf, input_duplex_maf, input_simplex_maf):
+    """Label of the merged MAF written for the given inputs, as returned by
+    ``merge_maf_dataframes``, None if only the simplex duplex MAF is written"""
+    simplex_duplex = input_duplex_maf and input_simplex_maf
+    if input_maf and input_standard_maf and simplex_duplex:
+        return "ORG-STD-SIMPLEX-DUPLEX"
+    if input_maf and input_standard_maf:
+        return "ORG-STD"
+    if input_maf and simplex_duplex:
+        return "ORG-SIMPLEX-DUPLEX"
+    if input_standard_maf and simplex_duplex:
+        return "STD-SIMPLEX-DUPLEX"
+    return None
+
+
+def _open_output(output_maf, output_format="maf", threads=1):
+    """Open a MAF file for writing, - for standard output"""
+    if output_maf is None:
+        return contextlib.nullcontext(None)
+    if output_format == "bgzip":
+        return open_bgzf(output_maf, threads)
+    if str(output_maf) == "-":
+        return contextlib.nullcontext(sys.stdout)
+    return open(output_maf, "w")
+
+
+def stream_merge(
+    input_maf=None,
+    input_standard_maf=None,
+    input_duplex_maf=None,
+    input_simplex_maf=None,
+    simplex_duplex_maf=None,
+    merged_maf=None,
+    tumor_sample_barcode=None,
+    batch_size=100000,
+    output_format="maf",
+    threads=1,
+    summary_fields=False,
+):
+    """Merge genotyped MAF files batch by batch.
+
+    GetBaseCountMultiSample writes the variants in the order of its input
+    MAF, so the n-th batch of records of every input holds the same
+    variants. Each batch is merged with the same code as a whole file merge
+    and appended to the outputs, only one batch of each input is held in
+    memory and the new count columns are added to it in place. Columns that
+    are not counted or joined on are written as they were read.
+
+    Args:
+        input_maf: Path to original MAF used as input for GBCMS, - for standard input
+        input_standard_maf: Path to GBCMS MAF for standard_bam
+        input_duplex_maf: Path to GBCMS MAF for duplex_bam
+        input_simplex_maf: Path to GBCMS MAF for simplex_bam
+        simplex_duplex_maf: Path to write the simplex duplex MAF to, - for
+            standard output
+        merged_maf: Path to write the merged MAF to, - for standard output
+        tumor_sample_barcode: Tumor_Sample_Barcode to set in the outputs
+        batch_size: Number of records merged at a time
+        output_format: maf or bgzip
+        threads: Number of threads compressing BGZF blocks
+        summary_fields: Whether to add the summary columns of
+            ``generate_summary_field.add_summary_fields``
+
+    Returns:
+        int: number of records merged
+    """
+    inputs = [
+        # only the counts of the standard MAF are merged into the original MAF
+        (input_maf, None, False),
+        (input_standard_maf, GENOTYPED_COLUMNS if input_maf else None, True),
+        (input_duplex_maf, GENOTYPED_COLUMNS, True),
+        (input_simplex_maf, None, True),
+    ]
+    readers = [
+        (
+            read_maf_batches(
+                path, batch_size, columns, genotyped=genotyped, passthrough=True
+            )
+            if path
+            else None
+        )
+        for path, columns, genotyped in inputs
+    ]
+    paths = [path for path, _, _ in inputs if path]
+    records = 0
+    try:
+        with _open_output(
+            simplex_duplex_maf, output_format, threads
+        ) as ds_out, _open_output(merged_maf, output_format, threads) as merged_out:
+            for batch in itertools.count():
+                with stage("read"):
+                    batches = [
+                        next(r, None) if r is not None else None for r in readers
+                    ]
+                present = [b for b in batches if b is not None]
+                if not present and batch > 0:
+                    break
+                if len(present) != len(paths) or any(
+                    b.shape[0] != present[0].shape[0] for b in present
+                ):
+                    raise ValueError(
+                        "MAF files %s do not have the same number of records"
+                        % ", ".join(map(str, paths))
+                    )
+                keys = encode_mutation_keys(present)
+                if any(not np.array_equal(key, keys[0]) for key in keys[1:]):
+                    raise ValueError(
+                        "Variants of MAF files %s are not in the same order, from record %s"
+                        % (", ".join(map(str, paths)), records + 1)
+                    )
+                ds_maf, merged, _ = merge_maf_dataframes(*batches, low_memory=True)
+                with stage("write"):
+                    for df, out in ((ds_maf, ds_out), (merged, merged_out)):
+                        if df is None or out is None:
+                            continue
+                        if tumor_sample_barcode:
+                            df["Tumor_Sample_Barcode"] = tumor_sample_barcode
+                        if summary_fields:
+                            add_summary_fields(df)
+                        df.reset_index(drop=True).to_csv(
+                            out, sep="\t", index=False, header=batch == 0
+                        )
+                records += present[0].shape[0]
+                logger.debug(
+                    "genotype_variants:small_variants:stream_merge:: merged %s records",
+                    records,
+                )
+    except BaseException:
+        # do not leave a partly merged MAF behind
+        for output in (simplex_duplex_maf, merged_maf):
+            if output is not None and str(output) != "-":
+                pathlib.Path(output).unlink(missing_ok=True)
+        raise
+    return records
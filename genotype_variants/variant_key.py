@@ -0,0 +1,192 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from genotype_variants.maf_schema import MUTATION_KEY
+
+"""
+variant_key
+~~~~~~~~~~~~~~~
+:Description: Code to join MAF data frames on an integer encoded mutation key
+"""
+"""
+Description: Code to join MAF data frames on an integer encoded mutation key
+"""
+# Making logging possible
+logger = logging.getLogger("genotype_variants")
+
+
+def encode_mutation_keys(dataframes):
+    """Encode the mutation key of data frames as one integer per row.
+
+    Each key column is factorized once over all the data frames, so equal
+    keys get the same integer in every data frame, and the column codes are
+    combined into a single int64. Codes are sorted like the key tuples when
+    the values of each column can be sorted, so joins on repeated keys come
+    out in the same order as on the five column MultiIndex. Missing values
+    are matched to each other.
+
+    Args:
+        dataframes: list of data frames with the mutation key columns, or None
+
+    Returns:
+        list: numpy.ndarray of int64 keys for each data frame, None for None
+    """
+    frames = [df for df in dataframes if df is not None]
+    codes = np.zeros(sum(df.shape[0] for df in frames), dtype=np.int64)
+    cardinality = 1
+    for column in MUTATION_KEY:
+        values = pd.concat([df[column] for df in frames], ignore_index=True)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # categories built by read_csv from chunks of the file are not
+            # sorted, factorize the values so codes are sorted by value
+            values = values.astype(object)
+        try:
+            column_codes, uniques = pd.factorize(values, sort=True)
+        except TypeError:
+            # values of different types can not be sorted
+            column_codes, uniques = pd.factorize(values)
+        n = len(uniques) + 1
+        column_codes = np.where(column_codes < 0, n - 1, column_codes)
+        if cardinality * n >= 2**63:
+            # renumber the keys seen so far, at most one per row
+            codes, uniques = pd.factorize(codes, sort=True)
+            cardinality = len(uniques)
+        codes = codes * n + column_codes
+        cardinality *= n
+
+    keys = []
+    start = 0
+    for df in dataframes:
+        if df is None:
+            keys.append(None)
+        else:
+            keys.append(codes[start : start + df.shape[0]])
+            start += df.shape[0]
+    return keys
+
+
+def join_on_mutation_key(left, left_key, right, right_key, columns):
+    """Add columns of right to the rows of left with the same mutation key.
+
+    Integer key version of
+    ``left.merge(right.reindex(left.index)[columns], left_index=True, right_index=True)``
+    on data frames indexed by the mutation key: rows keep the order of left
+    and get missing values where right does not have the key.
+
+    Args:
+        left: data frame
+        left_key: integer keys of left from encode_mutation_keys
+        right: data frame
+        right_key: integer keys of right from encode_mutation_keys
+        columns: columns of right to add to left
+
+    Returns:
+        tuple: (joined data frame, integer keys of its rows)
+    """
+    right_index = pd.Index(right_key)
+    left_index = pd.Index(left_key)
+    # as DataFrame.reindex, repeated keys are only allowed when right
+    # already has the keys of left in the same order
+    if not right_index.is_unique and not right_index.equals(left_index):
+        raise ValueError("cannot reindex on an axis with duplicate mutation keys")
+    if not left_index.is_unique or left.columns.intersection(columns).size:
+        # repeated keys and clashing columns are joined as pandas merge does
+        indexed = left.set_axis(left_index, axis=0)
+        aligned = right[columns].set_axis(right_index, axis=0).reindex(indexed.index)
+        joined = indexed.merge(aligned, left_index=True, right_index=True)
+        return joined, joined.index.to_numpy()
+    positions = right_index.get_indexer(left_index)
+    aligned = right[columns].reset_index(drop=True).reindex(positions)
+    aligned.index = left.index
+    joined = pd.concat([left, aligned], axis=1)
+    return joined, left_key
+
+
+def align_on_mutation_key(left_key, right, right_key):
+    """Rows of right with the mutation key of each row of left.
+
+    Same rows as ``join_on_mutation_key`` adds to left, for right data frames
+    holding only the columns to add.
+
+    Args:
+        left_key: integer keys from encode_mutation_keys, without repeats
+        right: data frame
+        right_key: integer keys of right from encode_mutation_keys
+
+    Returns:
+        pandas.DataFrame: rows of right in the order of left_key with a
+            RangeIndex, missing values where right does not have the key
+    """
+    positions = mutation_key_positions(left_key, right_key)
+    return right.reset_index(drop=True).reindex(positions).reset_index(drop=True)
+
+
+def mutation_key_positions(left_key, right_key):
+    """Positions of the rows of right with the mutation key of each row of
+    left, -1 where right does not have the key.
+
+    Args:
+        left_key: integer keys from encode_mutation_keys, without repeats
+        right_key: integer keys of right from encode_mutation_keys
+
+    Returns:
+        numpy.ndarray: one position in right for each key of left
+    """
+    right_index = pd.Index(right_key)
+    if not right_index.is_unique:
+        raise ValueError("cannot reindex on an axis with duplicate mutation keys")
+    return right_index.get_indexer(left_key)
+
+
+def take_positions(values, positions):
+    """Values at positions from mutation_key_positions, missing values at -1
+    with the dtype reindex gives, so a column can be lined up with the rows
+    of another data frame without lining up the other columns.
+
+    Args:
+        values: numpy.ndarray with one value per row of right
+        positions: positions from mutation_key_positions
+
+    Returns:
+        numpy.ndarray: one value per key of left
+    """
+    return pd.api.extensions.take(values, positions, allow_fill=True)
+
+
+def insert_column(data_frame, column, values):
+    """Set a column of a data frame in place without copying the other
+    columns, at the position of the column of the same name if there is
+    one, at the end otherwise.
+
+    Args:
+        data_frame: data frame
+        column: column name
+        values: numpy.ndarray with one value per row
+    """
+    loc = data_frame.shape[1]
+    if column in data_frame.columns:
+        loc = data_frame.columns.get_loc(column)
+        # deleting slices the blocks of the other columns, setting a column
+        # of a multi column block would copy them
+        del data_frame[column]
+    data_frame.insert(loc, column, values)
+
+
+def replace_barcodes(barcodes, old, new):
+    """Sample barcodes with old removed and new appended, computed once for
+    each distinct barcode so no new string is made per row.
+
+    Args:
+        barcodes: Tumor_Sample_Barcode series
+        old: text to remove from the barcodes
+        new: text to append to the barcodes
+
+    Returns:
+        numpy.ndarray: object array of the new barcodes, missing values stay
+            missing
+    """
+    categories = barcodes.astype("category")
+    return np.asarray(
+        categories.map(lambda barcode: barcode.replace(old, "") + new), dtype=object
+    )
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+"""Tests for the startup of the `genotype_variants` console script."""
+
+import subprocess
+import sys
+import unittest
+
+from genotype_variants import __version__
+
+
+def run_cli(*args):
+    """Run genotype_variants in a new Python process"""
+    return subprocess.run(
+        [sys.executable, "-m", "genotype_variants.cli"] + list(args),
+        capture_output=True,
+        text=True,
+    )
+
+
+class TestCliStartup(unittest.TestCase):
+    """Tests that starting the console script does not load the heavy
+    modules, the time it takes is measured by benchmarks/cli_startup.py"""
+
+    def test_version(self):
+        process = run_cli("--version")
+        assert process.returncode == 0
+        assert process.stdout.strip() == __version__
+
+    def test_help_does_not_import_pandas(self):
+        code = (
+            "import sys\n"
+            "from genotype_variants.cli import main\n"
+            "try:\n"
+            "    main(['small_variants', 'merge', '--help'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print(sorted({'numpy', 'pandas'} & set(sys.modules)))\n"
+        )
+        process = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True
+        )
+        assert process.returncode == 0, process.stderr
+        assert process.stdout.splitlines()[-1] == "[]"
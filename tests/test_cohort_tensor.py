@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.cohort_tensor` module."""
+
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+
+from genotype_variants.cohort_tensor import (
+    MISSING_COUNT,
+    load_cohort_tensor,
+    write_cohort_tensor,
+)
+from genotype_variants.maf_schema import read_maf
+
+TEST_DATA = pathlib.Path(__file__).parent / "test_data"
+SIMPLEX_DUPLEX_MAF = TEST_DATA / "C-100000-L002-d02-SIMPLEX-DUPLEX_genotyped.maf"
+
+
+class TestCohortTensor(unittest.TestCase):
+    """Tests for the memory-mapped cohort genotype tensor"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write_and_load(self):
+        """Counts of each sample are stored at the union of the variants,
+        missing variants and assays are MISSING_COUNT"""
+        maf = read_maf(SIMPLEX_DUPLEX_MAF, text=True)
+        partial_maf = self.dir / "partial.maf"
+        maf.iloc[::-1].iloc[:3].to_csv(partial_maf, sep="\t", index=False)
+        shape = write_cohort_tensor(
+            [("S1", partial_maf), ("S2", SIMPLEX_DUPLEX_MAF)], self.dir / "tensor"
+        )
+        assert shape == (maf.shape[0], 2, 4, 3)
+
+        tensor = load_cohort_tensor(self.dir / "tensor")
+        assert isinstance(tensor.counts, np.memmap)
+        assert list(tensor.samples) == ["S1", "S2"]
+        duplex = tensor.assays.index("DUPLEX")
+        alt = tensor.count_names.index("alt")
+        last = tuple(maf.iloc[-1][list(tensor.variants.names)])
+        # the variants of the first sample come first
+        assert tensor.variants.get_loc(last) == 0
+        expected = int(maf.iloc[-1]["t_alt_count_fragment_duplex"])
+        assert (tensor.counts[0, :, duplex, alt] == expected).all()
+        assert (
+            tensor.counts[:, :, tensor.assays.index("STANDARD")] == MISSING_COUNT
+        ).all()
+        assert (tensor.counts[3:, 0] == MISSING_COUNT).all()
+        assert (tensor.counts[:, 1] != MISSING_COUNT).any()
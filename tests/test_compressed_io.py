@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.compressed_io` module."""
+
+import gzip
+import pathlib
+import shutil
+import struct
+import tempfile
+import unittest
+
+from genotype_variants.compressed_io import (
+    BGZF_BLOCK_SIZE,
+    BGZF_EOF,
+    decompress_maf,
+    is_gzip,
+    open_bgzf,
+    open_maf,
+)
+from genotype_variants.maf_schema import read_maf
+
+TEST_DATA = pathlib.Path(__file__).parent / "test_data"
+DUPLEX_MAF = TEST_DATA / "C-100000-L002-d02-DUPLEX_genotyped.maf"
+
+
+class TestCompressedIo(unittest.TestCase):
+    """Tests for reading and writing compressed MAF files"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bgzf(self):
+        """BGZF output is made of blocks gzip can read, ending in the EOF block"""
+        text = "".join("17\t%s\tC\tT\n" % i for i in range(20000))
+        for threads in (1, 3):
+            output = self.dir / ("output_%s.maf.gz" % threads)
+            with open_bgzf(output, threads) as f:
+                f.write(text)
+            data = output.read_bytes()
+            assert data.endswith(BGZF_EOF)
+            offset = 0
+            while offset < len(data):
+                assert data[offset + 12 : offset + 14] == b"BC"
+                block_size = struct.unpack_from("<H", data, offset + 16)[0] + 1
+                isize = struct.unpack_from("<I", data, offset + block_size - 4)[0]
+                assert isize <= BGZF_BLOCK_SIZE
+                offset += block_size
+            assert offset == len(data)
+            assert gzip.decompress(data).decode() == text
+
+    def test_read(self):
+        """Compressed MAF files are read as the plain text files"""
+        compressed = self.dir / "input.maf.gz"
+        with open(DUPLEX_MAF, "rb") as f, gzip.open(compressed, "wb") as out:
+            shutil.copyfileobj(f, out)
+        assert is_gzip(compressed)
+        assert not is_gzip(DUPLEX_MAF)
+        with open_maf(compressed) as f:
+            assert f.read() == DUPLEX_MAF.read_text()
+        assert read_maf(compressed).equals(read_maf(DUPLEX_MAF))
+        decompressed = decompress_maf(compressed, self.dir)
+        assert decompressed.name == "input.maf"
+        assert decompressed.read_text() == DUPLEX_MAF.read_text()
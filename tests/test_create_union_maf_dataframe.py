@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.create_union_maf_dataframe` module."""
+
+import unittest
+
+import pandas as pd
+
+from genotype_variants.create_union_maf_dataframe import create_union_maf_dataframe
+
+
+def maf(sample, *variants):
+    return pd.DataFrame(
+        [
+            {
+                "Hugo_Symbol": gene,
+                "Chromosome": chromosome,
+                "Start_Position": position,
+                "End_Position": position,
+                "Reference_Allele": "A",
+                "Tumor_Seq_Allele2": alt,
+                "Tumor_Sample_Barcode": sample,
+            }
+            for gene, chromosome, position, alt in variants
+        ]
+    )
+
+
+class TestCreateUnionMafDataframe(unittest.TestCase):
+    """Tests for the union of the variants of a cohort"""
+
+    def test_union(self):
+        """Variants are de-duplicated on the mutation key, the first record is kept"""
+        df_u = create_union_maf_dataframe(
+            [
+                maf("S1", ("GENE1", "1", 100, "T"), ("GENE2", "2", 200, "T")),
+                maf("S2", ("OTHER", "1", 100, "T"), ("GENE1", "1", 100, "C")),
+                maf("S3", ("GENE2", "2", 200, "T"), ("GENE3", "X", 300, "G")),
+            ]
+        )
+        assert list(df_u.index) == [0, 1, 2, 3]
+        assert list(df_u["Hugo_Symbol"]) == ["GENE1", "GENE2", "GENE1", "GENE3"]
+        assert list(df_u["Tumor_Sample_Barcode"]) == ["S1", "S1", "S2", "S3"]
+        assert list(df_u["Tumor_Seq_Allele2"]) == ["T", "T", "C", "G"]
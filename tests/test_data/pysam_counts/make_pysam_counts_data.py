@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+import csv
+import pathlib
+import random
+
+import pysam
+
+"""
+make_pysam_counts_data
+~~~~~~~~~~~~~~~
+:Description: Code to write the synthetic BAM, FASTA and MAF files of the counting tests
+"""
+"""
+Description: Writes a 300 base reference, a BAM file with reads built to cover
+    a substitution, a deletion and an insertion with reference, alternate and
+    other alleles, duplicate and low mapping quality reads and mates that
+    disagree, the MAF file of the variants, and the counts expected from
+    GetBaseCountMultiSample with --filter_duplicate 1 --fragment_count 1
+    --maq 20, with and without --generic_counting. The expected counts are
+    worked out from the reads listed below, not computed by genotype_variants.
+
+    python tests/test_data/pysam_counts/make_pysam_counts_data.py
+"""
+DATA = pathlib.Path(__file__).resolve().parent
+_rng = random.Random(0)
+REFERENCE = "".join(_rng.choice("ACGT") for _ in range(300))
+CHROMOSOME = "1"
+SAMPLE = "S1"
+
+
+def substitute(base):
+    return "A" if base != "A" else "C"
+
+
+def other(base, alt):
+    return next(b for b in "ACGT" if b not in (base, alt))
+
+
+SNV_ALT = substitute(REFERENCE[99])
+SNV_OTHER = other(REFERENCE[99], SNV_ALT)
+DEL_MISMATCH = substitute(REFERENCE[151])
+SNV_REF_READ = REFERENCE[70:130]
+SNV_ALT_READ = REFERENCE[70:99] + SNV_ALT + REFERENCE[100:130]
+SNV_OTHER_READ = REFERENCE[70:99] + SNV_OTHER + REFERENCE[100:130]
+DEL_REF_READ = REFERENCE[120:180]
+DEL_ALT_READ = REFERENCE[120:150] + REFERENCE[153:183]
+DEL_MISMATCH_READ = REFERENCE[120:151] + DEL_MISMATCH + REFERENCE[152:180]
+DEL_SHORT_READ = REFERENCE[120:150] + REFERENCE[152:182]
+INS_REF_READ = REFERENCE[170:230]
+INS_ALT_READ = REFERENCE[170:200] + "CC" + REFERENCE[200:228]
+INS_OTHER_READ = REFERENCE[170:200] + "CG" + REFERENCE[200:228]
+# name, first of pair, reverse, start, cigar, sequence, mapping quality, duplicate
+READS = [
+    # substitution at 100
+    ("snv_ref", True, False, 70, "60M", SNV_REF_READ, 60, False),
+    ("snv_ref", False, True, 70, "60M", SNV_REF_READ, 60, False),
+    ("snv_alt", True, False, 70, "60M", SNV_ALT_READ, 60, False),
+    ("snv_alt", False, True, 70, "60M", SNV_ALT_READ, 60, False),
+    ("snv_dup", True, False, 70, "60M", SNV_ALT_READ, 60, True),
+    ("snv_lowq", True, False, 70, "60M", SNV_ALT_READ, 5, False),
+    ("snv_discordant", True, False, 70, "60M", SNV_REF_READ, 60, False),
+    ("snv_discordant", False, True, 70, "60M", SNV_ALT_READ, 60, False),
+    ("snv_other", True, False, 70, "60M", SNV_OTHER_READ, 60, False),
+    ("snv_short", True, False, 30, "60M", REFERENCE[30:90], 60, False),
+    # deletion of 151 to 153
+    ("del_ref", True, False, 120, "60M", DEL_REF_READ, 60, False),
+    ("del_ref", False, True, 120, "60M", DEL_REF_READ, 60, False),
+    ("del_alt", True, False, 120, "30M3D30M", DEL_ALT_READ, 60, False),
+    ("del_alt", False, True, 120, "30M3D30M", DEL_ALT_READ, 60, False),
+    ("del_dup", True, False, 120, "30M3D30M", DEL_ALT_READ, 60, True),
+    ("del_mismatch", True, False, 120, "60M", DEL_MISMATCH_READ, 60, False),
+    ("del_short", True, False, 120, "30M2D30M", DEL_SHORT_READ, 60, False),
+    # insertion of CC after 200
+    ("ins_ref", True, False, 170, "60M", INS_REF_READ, 60, False),
+    ("ins_ref", False, True, 170, "60M", INS_REF_READ, 60, False),
+    ("ins_alt", True, False, 170, "30M2I28M", INS_ALT_READ, 60, False),
+    ("ins_alt", False, True, 170, "30M2I28M", INS_ALT_READ, 60, False),
+    ("ins_lowq", True, False, 170, "30M2I28M", INS_ALT_READ, 10, False),
+    ("ins_other", True, False, 170, "30M2I28M", INS_OTHER_READ, 60, False),
+    ("ins_end", True, False, 160, "40M", REFERENCE[160:200], 60, False),
+]
+VARIANTS = [
+    ("100", "100", REFERENCE[99], SNV_ALT),
+    ("151", "153", REFERENCE[150:153], "-"),
+    ("200", "201", "-", "CC"),
+]
+COUNT_COLUMNS = [
+    "t_ref_count",
+    "t_alt_count",
+    "t_total_count",
+    "t_total_count_forward",
+    "t_ref_count_forward",
+    "t_alt_count_forward",
+    "t_total_count_fragment",
+    "t_ref_count_fragment",
+    "t_alt_count_fragment",
+]
+# Counts of each variant in the order of COUNT_COLUMNS
+EXPECTED_COUNTS = [
+    # snv_ref x2 and snv_discordant ref, snv_alt x2 and snv_discordant alt,
+    # snv_other, duplicate, low mapping quality and snv_short left out
+    [3, 3, 7, 4, 2, 1, 4, 1, 1],
+    # del_ref x2 and del_mismatch ref, del_alt x2, del_short other
+    [3, 2, 6, 4, 2, 1, 4, 2, 1],
+    # ins_ref x2, ins_alt x2, ins_other other, ins_end does not cover 201
+    [2, 2, 5, 3, 1, 1, 3, 1, 1],
+]
+# With generic counting del_mismatch does not have the reference allele
+EXPECTED_GENERIC_COUNTS = [
+    EXPECTED_COUNTS[0],
+    [2, 2, 6, 4, 1, 1, 4, 1, 1],
+    EXPECTED_COUNTS[2],
+]
+MAF_COLUMNS = [
+    "Hugo_Symbol",
+    "Chromosome",
+    "Start_Position",
+    "End_Position",
+    "Reference_Allele",
+    "Tumor_Seq_Allele2",
+    "Tumor_Sample_Barcode",
+]
+
+
+def cigar_tuples(cigar):
+    ops = {"M": 0, "I": 1, "D": 2}
+    tuples, length = [], ""
+    for c in cigar:
+        if c.isdigit():
+            length += c
+        else:
+            tuples.append((ops[c], int(length)))
+            length = ""
+    return tuples
+
+
+def write_bam(bam):
+    unsorted = bam.with_name("unsorted.bam")
+    header = {
+        "HD": {"VN": "1.6"},
+        "SQ": [{"SN": CHROMOSOME, "LN": len(REFERENCE)}],
+        "RG": [{"ID": SAMPLE, "SM": SAMPLE}],
+    }
+    paired = {name for name, first, *_ in READS if not first}
+    with pysam.AlignmentFile(str(unsorted), "wb", header=header) as out:
+        for name, first, reverse, start, cigar, sequence, mapq, duplicate in READS:
+            read = pysam.AlignedSegment()
+            read.query_name = name
+            read.query_sequence = sequence
+            read.reference_id = 0
+            read.reference_start = start
+            read.cigartuples = cigar_tuples(cigar)
+            read.mapping_quality = mapq
+            read.query_qualities = pysam.qualitystring_to_array("I" * len(sequence))
+            read.flag = (16 if reverse else 0) | (1024 if duplicate else 0)
+            if name in paired:
+                read.flag |= 1 | 2 | (64 if first else 128) | (32 if first else 16)
+                read.next_reference_id = 0
+                read.next_reference_start = start
+            read.set_tag("RG", SAMPLE)
+            out.write(read)
+    pysam.sort("--no-PG", "-o", str(bam), str(unsorted))
+    unsorted.unlink()
+    pysam.index(str(bam))
+
+
+def write_maf(maf, counts=None):
+    with open(maf, "w", newline="") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(MAF_COLUMNS + (COUNT_COLUMNS if counts else []))
+        for i, (start, end, ref, alt) in enumerate(VARIANTS):
+            row = ["GENE", CHROMOSOME, start, end, ref, alt, SAMPLE]
+            if counts:
+                row += counts[i]
+            writer.writerow(row)
+
+
+def main():
+    fasta = DATA / "reference.fa"
+    fasta.write_text(
+        ">%s\n" % CHROMOSOME
+        + "\n".join(REFERENCE[i : i + 60] for i in range(0, len(REFERENCE), 60))
+        + "\n"
+    )
+    pysam.faidx(str(fasta))
+    write_bam(DATA / "sample.bam")
+    write_maf(DATA / "variants.maf")
+    write_maf(DATA / "expected_counts.maf", EXPECTED_COUNTS)
+    write_maf(DATA / "expected_generic_counts.maf", EXPECTED_GENERIC_COUNTS)
+
+
+if __name__ == "__main__":
+    main()
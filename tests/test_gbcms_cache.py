@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.gbcms_cache` module."""
+
+import os
+import pathlib
+import tempfile
+import unittest
+
+from genotype_variants.gbcms_cache import (
+    evict_cache,
+    fetch_cached_maf,
+    gbcms_cache_key,
+    store_cached_maf,
+)
+
+
+class TestGBCMSCache(unittest.TestCase):
+    """Tests for caching GetBaseCountMultiSample outputs"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp.name)
+        self.cache_dir = self.dir / "cache"
+        for name in ["input.maf", "sample.bam", "ref.fa", "gbcms"]:
+            (self.dir / name).write_text(name + "\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def key(self, **kwargs):
+        args = dict(
+            input_maf=self.dir / "input.maf",
+            labelled_bams=[("S1", self.dir / "sample.bam")],
+            generic_counting=False,
+            reference_fasta=self.dir / "ref.fa",
+            gbcms_path=self.dir / "gbcms",
+            filter_duplicate=0,
+            fragment_count=1,
+            mapping_quality=20,
+        )
+        args.update(kwargs)
+        return gbcms_cache_key(**args)
+
+    def test_key(self):
+        """The key changes with the inputs and the counting parameters"""
+        key = self.key()
+        assert key == self.key()
+        assert key != self.key(mapping_quality=30)
+        assert key != self.key(generic_counting=True)
+        assert key != self.key(labelled_bams=[("S2", self.dir / "sample.bam")])
+        (self.dir / "input.maf").write_text("changed\n")
+        assert key != self.key()
+
+    def test_store_and_fetch(self):
+        """A stored output is fetched and a missing one is not"""
+        output = self.dir / "output.maf"
+        output.write_text("counts\n")
+        store_cached_maf(self.cache_dir, "ab" * 32, output)
+        fetched = self.dir / "fetched.maf"
+        assert fetch_cached_maf(self.cache_dir, "ab" * 32, fetched)
+        assert fetched.read_text() == "counts\n"
+        assert not fetch_cached_maf(self.cache_dir, "cd" * 32, fetched)
+
+    def test_evict_least_recently_used(self):
+        """Entries used least recently are evicted first"""
+        output = self.dir / "output.maf"
+        output.write_text("x" * 100)
+        for i, key in enumerate(["aa" * 32, "bb" * 32, "cc" * 32]):
+            store_cached_maf(self.cache_dir, key, output)
+            entry = self.cache_dir / key[:2] / (key + ".maf")
+            os.utime(entry, (i, i))
+        # using the oldest entry makes it the most recent one
+        assert fetch_cached_maf(self.cache_dir, "aa" * 32, self.dir / "fetched.maf")
+        assert evict_cache(self.cache_dir, 200) == 1
+        assert not fetch_cached_maf(self.cache_dir, "bb" * 32, output)
+        assert fetch_cached_maf(self.cache_dir, "aa" * 32, output)
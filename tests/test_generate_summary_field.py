@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.generate_summary_field` module."""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from genotype_variants.generate_summary_field import (
+    add_summary_fields,
+    format_summary,
+    generate_summary_field,
+)
+
+
+def expected_summary(ref, alt, precision=4):
+    depth = ref + alt
+    vaf = np.round(alt / depth, precision) if depth else 0
+    return "DP=%d;RD=%d;AD=%d;VF=%.*f" % (depth, ref, alt, precision, vaf)
+
+
+class TestGenerateSummaryField(unittest.TestCase):
+    """Tests for formatting the summary fields of the fragment counts"""
+
+    def test_format_summary(self):
+        """Summaries match Python formatting of the counts and rounded VAF"""
+        rng = np.random.default_rng(0)
+        ref = rng.integers(0, 10**9, 50000)
+        alt = rng.integers(0, 10**5, 50000)
+        ref[:100], alt[:50] = rng.integers(0, 3, 100), 0
+        for precision in (1, 2, 4, 6, 8):
+            summaries = format_summary(ref, alt, precision)
+            assert summaries.dtype.kind == "S"
+            assert list(summaries.astype(str)) == [
+                expected_summary(r, a, precision)
+                for r, a in zip(ref.tolist(), alt.tolist())
+            ]
+
+    def test_missing_counts(self):
+        """Missing counts are 0, and so is VF without fragments"""
+        summaries = format_summary(np.array([1.0, np.nan, 0.0]), [2, 0, np.nan])
+        assert list(summaries.astype(str)) == [
+            "DP=3;RD=1;AD=2;VF=0.6667",
+            "DP=0;RD=0;AD=0;VF=0.0000",
+            "DP=0;RD=0;AD=0;VF=0.0000",
+        ]
+        assert format_summary([], []).size == 0
+        with self.assertRaises(ValueError):
+            format_summary([1], [1], precision=9)
+
+    def test_add_summary_fields(self):
+        """A summary column is added for each assay with fragment counts"""
+        df = pd.DataFrame(
+            {
+                "t_ref_count_fragment_simplex": [10, 0],
+                "t_alt_count_fragment_simplex": [5, 0],
+                "t_ref_count_fragment_duplex": [3, 1],
+                "t_alt_count_fragment_duplex": [1, 1],
+            }
+        )
+        columns = add_summary_fields(df)
+        assert columns == ["summary_fragment_simplex", "summary_fragment_duplex"]
+        assert list(df["summary_fragment_simplex"]) == [
+            "DP=15;RD=10;AD=5;VF=0.3333",
+            "DP=0;RD=0;AD=0;VF=0.0000",
+        ]
+        assert list(df["summary_fragment_duplex"]) == [
+            "DP=4;RD=3;AD=1;VF=0.2500",
+            "DP=2;RD=1;AD=1;VF=0.5000",
+        ]
+
+    def test_generate_summary_field(self):
+        df = pd.DataFrame({"t_ref_count_fragment": [7], "t_alt_count_fragment": [2]})
+        summary = generate_summary_field(df)
+        assert "summary_fragment" not in df.columns
+        assert summary["summary_fragment"][0] == "DP=9;RD=7;AD=2;VF=0.2222"
+
+    def test_vaf_column(self):
+        """VF is the t_vaf_fragment column when there is one"""
+        df = pd.DataFrame(
+            {
+                "t_ref_count_fragment": [7, 7, 0],
+                "t_alt_count_fragment": [2, 2, 0],
+                "t_vaf_fragment": [0.123456, np.nan, 1.0],
+            }
+        )
+        summary = generate_summary_field(df)
+        assert list(summary["summary_fragment"]) == [
+            "DP=9;RD=7;AD=2;VF=0.1235",
+            "DP=9;RD=7;AD=2;VF=0.0000",
+            "DP=0;RD=0;AD=0;VF=1.0000",
+        ]
@@ -3,13 +3,33 @@
 """Tests for `genotype_variants` package."""
 
 
+import os
+import pathlib
+import stat
+import sys
+import tempfile
 import unittest
 import pandas as pd
 
+from genotype_variants import metrics
 from genotype_variants.commands import small_variants
+from genotype_variants.create_all_maf_dataframe import create_all_maf_dataframe as camd
 from genotype_variants.create_duplex_simplex_dataframe import (
     create_duplex_simplex_dataframe as cdsd,
 )
+from genotype_variants.maf_schema import read_maf
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+
+def write_fake_gbcms(path):
+    """Executable running the GetBaseCountMultiSample stand-in of the benchmarks"""
+    path.write_text(
+        '#!/bin/sh\nPYTHONPATH="%s${PYTHONPATH:+:$PYTHONPATH}" exec "%s" "%s" "$@"\n'
+        % (ROOT, sys.executable, ROOT / "benchmarks" / "fake_gbcms.py")
+    )
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return path
 
 
 class TestGenotype_variants(unittest.TestCase):
@@ -52,6 +72,66 @@ class TestGenotype_variants(unittest.TestCase):
         # assert help_result.exit_code == 0
         # assert '--help  Show this message and exit.' in help_result.output
 
+    def test_multi_bam_gbcms_cmd(self):
+        """Test a single GBCMS command is generated for duplex and simplex BAM"""
+        cmd, combined_maf, output_mafs = small_variants.generate_multi_bam_gbcms_cmd(
+            "input.maf",
+            [("DUPLEX", "duplex.bam"), ("SIMPLEX", "simplex.bam")],
+            "ref.fasta",
+            "GetBaseCountsMultiSample",
+            "P-0000001",
+            1,
+            1,
+            20,
+            2,
+            "C-100000",
+        )
+        assert "--bam C-100000-DUPLEX:duplex.bam" in cmd
+        assert "--bam C-100000-SIMPLEX:simplex.bam" in cmd
+        assert cmd.endswith("--generic_counting")
+        assert list(output_mafs) == ["C-100000-DUPLEX", "C-100000-SIMPLEX"]
+        assert output_mafs["C-100000-SIMPLEX"].name == "C-100000-SIMPLEX_genotyped.maf"
+        with self.assertRaises(ValueError):
+            small_variants.generate_multi_bam_gbcms_cmd(
+                "input.maf",
+                [("STANDARD", "standard.bam"), ("SIMPLEX", "simplex.bam")],
+                "ref.fasta",
+                "GetBaseCountsMultiSample",
+                "P-0000001",
+                1,
+                1,
+                20,
+                2,
+            )
+
+    def test_split_multi_bam_maf(self):
+        """The records of a multi BAM run are split by Tumor_Sample_Barcode
+        and written back unchanged"""
+        data = pathlib.Path("tests/test_data")
+        duplex = (data / "C-100000-L002-d02-DUPLEX_genotyped.maf").read_text()
+        simplex = (data / "C-100000-L002-d02-SIMPLEX_genotyped.maf").read_text()
+        header, *duplex_records = duplex.splitlines(True)
+        simplex_records = simplex.splitlines(True)[1:]
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            combined_maf = tmp / "combined_genotyped.maf"
+            combined_maf.write_text(
+                header
+                + "".join(
+                    duplex_record + simplex_record
+                    for duplex_record, simplex_record in zip(
+                        duplex_records, simplex_records
+                    )
+                )
+            )
+            output_mafs = {
+                "C-100000-L002-d02-DUPLEX": tmp / "duplex.maf",
+                "C-100000-L002-d02-SIMPLEX": tmp / "simplex.maf",
+            }
+            small_variants.split_multi_bam_maf(combined_maf, output_mafs)
+            assert output_mafs["C-100000-L002-d02-DUPLEX"].read_text() == duplex
+            assert output_mafs["C-100000-L002-d02-SIMPLEX"].read_text() == simplex
+
     def test_merge_simplex_duplex(self):
         """
         Test simplex-duplex MAF generation
@@ -86,3 +166,261 @@ class TestGenotype_variants(unittest.TestCase):
         assert (
             df_merge.loc[deletion_index]["t_total_count_fragment_simplex_duplex"] == 537
         )
+
+    def test_merge_repeated_variants(self):
+        """Variants repeated in the MAF files are merged in the same order as
+        the merge on the mutation key MultiIndex that wrote the expected MAF"""
+        data = pathlib.Path("tests/test_data/repeated_variants").resolve()
+        duplex = data / "C-100000-DUPLEX_genotyped.maf"
+        simplex = data / "C-100000-SIMPLEX_genotyped.maf"
+        expected_maf = data / "expected_SIMPLEX-DUPLEX_genotyped.maf"
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                for low_memory in (False, True):
+                    small_variants.merge.callback(
+                        "S1",
+                        None,
+                        None,
+                        str(duplex),
+                        str(simplex),
+                        "S1",
+                        False,
+                        low_memory=low_memory,
+                    )
+                    output = pathlib.Path("S1-SIMPLEX-DUPLEX_genotyped.maf")
+                    assert output.read_text() == expected_maf.read_text()
+            finally:
+                os.chdir(cwd)
+        # Chromosome categories out of order, as read_csv makes them from
+        # the chunks of a large MAF file
+        s_maf = read_maf(simplex, genotyped=True)
+        d_maf = read_maf(duplex, genotyped=True)
+        for df in (s_maf, d_maf):
+            categories = df["Chromosome"].cat.categories
+            df["Chromosome"] = df["Chromosome"].cat.reorder_categories(
+                sorted(categories, reverse=True)
+            )
+        expected = pd.read_csv(expected_maf, sep="\t", dtype=str)
+        df_merge = cdsd(s_maf, d_maf)
+        assert df_merge["Chromosome"].astype(str).tolist() == list(
+            expected["Chromosome"]
+        )
+        assert df_merge["Start_Position"].astype(str).tolist() == list(
+            expected["Start_Position"]
+        )
+
+    def test_merge_low_memory(self):
+        """The low memory merge gives the same data frames without changing
+        its inputs unless asked to"""
+        s_maf, d_maf = self.s_maf.copy(), self.d_maf.iloc[2:].copy()
+        df_merge = cdsd(self.s_maf, self.d_maf.iloc[2:])
+        pd.testing.assert_frame_equal(
+            cdsd(self.s_maf, self.d_maf.iloc[2:], low_memory=True), df_merge
+        )
+        pd.testing.assert_frame_equal(self.s_maf, s_maf)
+        pd.testing.assert_frame_equal(self.d_maf.iloc[2:], d_maf)
+        pd.testing.assert_frame_equal(
+            cdsd(s_maf, d_maf, low_memory=True, copy=False), df_merge
+        )
+        for o_maf, i_maf, ds_maf in (
+            (self.d_maf, self.d_maf.iloc[1:], df_merge.iloc[:-3]),
+            (None, self.d_maf, df_merge.iloc[:-3]),
+            (self.d_maf, None, df_merge.iloc[:-3]),
+            (self.d_maf, self.d_maf.iloc[1:], None),
+        ):
+            df_all = camd(o_maf, i_maf, ds_maf)
+            pd.testing.assert_frame_equal(
+                camd(o_maf, i_maf, ds_maf, low_memory=True), df_all
+            )
+
+    def test_merge_batch(self):
+        """Samples merged in a batch get the outputs of the merge command"""
+        data = pathlib.Path("tests/test_data").resolve()
+        duplex, simplex = (
+            data / "C-100000-L002-d02-DUPLEX_genotyped.maf",
+            data / "C-100000-L002-d02-SIMPLEX_genotyped.maf",
+        )
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                pd.DataFrame(
+                    {
+                        "sample_id": ["S1", "S2", "S3", None],
+                        "duplex_maf": [duplex, duplex, duplex, duplex],
+                        "simplex_maf": [simplex, simplex, "missing.maf", simplex],
+                    }
+                ).to_csv("manifest.tsv", sep="\t", index=False)
+                metrics.start_metrics(pathlib.Path(tmp) / "metrics.prom")
+                self.addCleanup(metrics.stop_metrics)
+                with self.assertRaises(SystemExit):
+                    small_variants.merge_batch.callback("manifest.tsv", 2, False)
+                metrics.stop_metrics()
+                status = pd.read_csv(
+                    next(pathlib.Path(tmp).glob("*_status.tsv")), sep="\t"
+                )
+                assert status.set_index("sample_id")["status"].to_dict() == {
+                    "S1": "success",
+                    "S2": "success",
+                    "S3": "invalid",
+                    "row_4": "invalid",
+                }
+                prom = (pathlib.Path(tmp) / "metrics.prom").read_text()
+                assert (
+                    'genotype_variants_samples_processed_total{status="invalid"} 2'
+                    in prom
+                )
+                small_variants.merge.callback(
+                    "S0", None, None, str(duplex), str(simplex), None, False
+                )
+                expected = pathlib.Path("S0-SIMPLEX-DUPLEX_genotyped.maf").read_text()
+                for sample_id in ("S1", "S2"):
+                    output = pathlib.Path(sample_id + "-SIMPLEX-DUPLEX_genotyped.maf")
+                    assert output.read_text() == expected
+            finally:
+                os.chdir(cwd)
+
+    def test_incremental_run_report(self):
+        """The run report counts the variants of the delta that was genotyped"""
+        data = pathlib.Path("tests/test_data").resolve()
+        lines = (
+            (data / "C-100000-L002-d02-DUPLEX_genotyped.maf").read_text().splitlines()
+        )
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                tmp = pathlib.Path(tmp)
+                pathlib.Path("input.maf").write_text("\n".join(lines) + "\n")
+                previous = tmp / "previous"
+                previous.mkdir()
+                (previous / "S1-DUPLEX_genotyped.maf").write_text(
+                    "\n".join(lines[:5]) + "\n"
+                )
+                for name in ("reference.fa", "duplex.bam"):
+                    pathlib.Path(name).touch()
+                gbcms = write_fake_gbcms(tmp / "GetBaseCountsMultiSample")
+                small_variants.generate.callback(
+                    input_maf="input.maf",
+                    reference_fasta=str(tmp / "reference.fa"),
+                    gbcms_path=str(gbcms),
+                    patient_id="P1",
+                    standard_bam=None,
+                    duplex_bam=str(tmp / "duplex.bam"),
+                    simplex_bam=None,
+                    filter_duplicate=0,
+                    fragment_count=1,
+                    mapping_quality=20,
+                    threads=1,
+                    sample_id="S1",
+                    run_report="report.jsonl",
+                    incremental_from=str(previous),
+                )
+                records = pd.read_json("report.jsonl", lines=True)
+                assert records["variant_count"].tolist() == [len(lines) - 5]
+            finally:
+                os.chdir(cwd)
+
+    def test_cohort(self):
+        """Samples are genotyped at the union of the variants in batches and
+        the genotypes fanned back out into the merged MAF of each sample"""
+        data = pathlib.Path("tests/test_data").resolve()
+        lines = (
+            (data / "C-100000-L002-d02-DUPLEX_genotyped.maf").read_text().splitlines()
+        )
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                tmp = pathlib.Path(tmp)
+                pathlib.Path("S1.maf").write_text("\n".join(lines[:7]) + "\n")
+                pathlib.Path("S2.maf").write_text(
+                    "\n".join(lines[:1] + lines[4:]) + "\n"
+                )
+                for name in (
+                    "reference.fa",
+                    "standard.bam",
+                    "duplex.bam",
+                    "simplex.bam",
+                ):
+                    pathlib.Path(name).touch()
+                gbcms = write_fake_gbcms(tmp / "GetBaseCountsMultiSample")
+                pd.DataFrame(
+                    {
+                        "sample_id": ["S1", "S2", None],
+                        "maf": [tmp / "S1.maf", tmp / "S2.maf", tmp / "S2.maf"],
+                        "standard_bam": [None, tmp / "standard.bam", None],
+                        "duplex_bam": [tmp / "duplex.bam", None, tmp / "duplex.bam"],
+                        "simplex_bam": [tmp / "simplex.bam", None, None],
+                    }
+                ).to_csv("metadata.tsv", sep="\t", index=False)
+                metrics.start_metrics(tmp / "metrics.prom")
+                self.addCleanup(metrics.stop_metrics)
+                with self.assertRaises(SystemExit):
+                    small_variants.cohort.callback(
+                        input_metadata="metadata.tsv",
+                        reference_fasta=str(tmp / "reference.fa"),
+                        gbcms_path=str(gbcms),
+                        filter_duplicate=0,
+                        fragment_count=1,
+                        mapping_quality=20,
+                        threads=1,
+                        batch_size=1,
+                        jobs=1,
+                        total_threads=None,
+                        cohort_id="C1",
+                        timeout=None,
+                        run_report=None,
+                        cache_dir=str(tmp / "cache"),
+                        cache_max_size=50,
+                    )
+                status = pd.read_csv("C1_status.tsv", sep="\t").set_index("sample_id")
+                assert status["status"].to_dict() == {
+                    "row_3": "invalid",
+                    "S1": "success",
+                    "S2": "success",
+                }
+                union = pd.read_csv("C1_union.maf", sep="\t")
+                assert union.shape[0] == len(lines) - 1
+                for label in ("S1-DUPLEX", "S1-SIMPLEX", "S2-STANDARD"):
+                    genotyped = pd.read_csv(label + "_genotyped.maf", sep="\t")
+                    assert list(genotyped["Tumor_Sample_Barcode"].unique()) == [label]
+                    pd.testing.assert_frame_equal(
+                        genotyped[self.mutation_key], union[self.mutation_key]
+                    )
+                for output in status.loc[["S1", "S2"], "output"]:
+                    merged = pd.read_csv(output, sep="\t")
+                    assert merged.shape[0] == len(lines) - 1
+                assert not list(tmp.glob("*_combined_genotyped.maf"))
+                # a cache entry and variant counts by BAM type for each batch
+                assert len(list((tmp / "cache").iterdir())) == 3
+                prom = (tmp / "metrics.prom").read_text()
+                for btype in ("STANDARD", "DUPLEX", "SIMPLEX"):
+                    assert (
+                        'genotype_variants_variants_genotyped_total{bam_type="%s"} %s'
+                        % (btype, len(lines) - 1)
+                        in prom
+                    )
+            finally:
+                os.chdir(cwd)
+
+    def test_cohort_tensor(self):
+        """Rows without a sample id are left out of the tensor and fail the
+        command once the tensor is written"""
+        data = pathlib.Path("tests/test_data").resolve()
+        merged = data / "C-100000-L002-d02-SIMPLEX-DUPLEX_genotyped.maf"
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = pathlib.Path(tmp)
+            (tmp / "S1-ORG-SIMPLEX-DUPLEX_genotyped.maf").write_text(merged.read_text())
+            pd.DataFrame({"sample_id": ["S1", None]}).to_csv(
+                tmp / "metadata.tsv", sep="\t", index=False
+            )
+            with self.assertRaises(SystemExit) as e:
+                small_variants.cohort_tensor.callback(
+                    str(tmp / "metadata.tsv"), str(tmp), None, str(tmp / "tensor")
+                )
+            assert e.exception.code == 1
+            samples = pd.read_csv(tmp / "tensor" / "samples.tsv", sep="\t")
+            assert list(samples["sample_id"]) == ["S1"]
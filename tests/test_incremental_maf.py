@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.incremental_maf` module."""
+
+import pathlib
+import tempfile
+import unittest
+
+from genotype_variants.incremental_maf import create_delta_maf, splice_genotyped_maf
+
+HEADER = "Chromosome\tStart_Position\tEnd_Position\tReference_Allele\tTumor_Seq_Allele2"
+GENOTYPED_HEADER = HEADER + "\tt_alt_count\n"
+
+
+def rows(*variants):
+    return "".join("%s\t%s\t%s\tA\tT\n" % (c, p, p) for c, p in variants)
+
+
+def genotyped(*variants):
+    return "".join(
+        "%s\t%s\t%s\tA\tT\t%s\n" % (c, p, p, count) for c, p, count in variants
+    )
+
+
+class TestIncrementalMaf(unittest.TestCase):
+    """Tests for genotyping only the new variants of a MAF"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp.name)
+        self.input_maf = self.dir / "input.maf"
+        self.input_maf.write_text(HEADER + "\n" + rows((1, 100), (2, 200), (3, 300)))
+        self.previous_maf = self.dir / "previous.maf"
+        self.previous_maf.write_text(
+            GENOTYPED_HEADER + genotyped((3, 300, 7), (1, 100, 5), (9, 900, 1))
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_delta(self):
+        """Only the variants missing from the previous run are in the delta"""
+        delta_maf = self.dir / "delta.maf"
+        assert create_delta_maf(self.input_maf, [self.previous_maf], delta_maf) == 1
+        assert delta_maf.read_text() == HEADER + "\n" + rows((2, 200))
+        missing = self.dir / "missing.maf"
+        assert create_delta_maf(self.input_maf, [missing], delta_maf) == 3
+
+    def test_splice(self):
+        """Genotypes are spliced in input order and dropped variants are left out"""
+        delta_genotyped = self.dir / "delta_genotyped.maf"
+        delta_genotyped.write_text(GENOTYPED_HEADER + genotyped((2, 200, 3)))
+        assert (
+            splice_genotyped_maf(
+                self.input_maf, self.previous_maf, delta_genotyped, self.previous_maf
+            )
+            == 2
+        )
+        assert self.previous_maf.read_text() == GENOTYPED_HEADER + genotyped(
+            (1, 100, 5), (2, 200, 3), (3, 300, 7)
+        )
+
+    def test_splice_missing_variant(self):
+        """A variant that was not genotyped is an error"""
+        with self.assertRaises(ValueError):
+            splice_genotyped_maf(
+                self.input_maf, self.previous_maf, None, self.dir / "output.maf"
+            )
+        assert not (self.dir / "output.maf").exists()
+
+    def test_repeated_variants(self):
+        """Records repeating a variant are genotyped again, in input order"""
+        header = HEADER + "\tHugo_Symbol\n"
+        self.input_maf.write_text(
+            header
+            + "1\t100\t100\tA\tT\tGENE1\n"
+            + "2\t200\t200\tA\tT\tGENE2\n"
+            + "1\t100\t100\tA\tT\tGENE3\n"
+        )
+        genotyped_header = header.rstrip("\n") + "\tt_alt_count\n"
+        self.previous_maf.write_text(
+            genotyped_header
+            + "1\t100\t100\tA\tT\tGENE1\t5\n"
+            + "2\t200\t200\tA\tT\tGENE2\t3\n"
+            + "1\t100\t100\tA\tT\tGENE1\t5\n"
+        )
+        delta_maf = self.dir / "delta.maf"
+        assert create_delta_maf(self.input_maf, [self.previous_maf], delta_maf) == 2
+        assert delta_maf.read_text() == (
+            header + "1\t100\t100\tA\tT\tGENE1\n" + "1\t100\t100\tA\tT\tGENE3\n"
+        )
+        delta_genotyped = self.dir / "delta_genotyped.maf"
+        delta_genotyped.write_text(
+            genotyped_header
+            + "1\t100\t100\tA\tT\tGENE1\t5\n"
+            + "1\t100\t100\tA\tT\tGENE3\t5\n"
+        )
+        output_maf = self.dir / "output.maf"
+        assert (
+            splice_genotyped_maf(
+                self.input_maf, self.previous_maf, delta_genotyped, output_maf
+            )
+            == 1
+        )
+        assert output_maf.read_text() == (
+            genotyped_header
+            + "1\t100\t100\tA\tT\tGENE1\t5\n"
+            + "2\t200\t200\tA\tT\tGENE2\t3\n"
+            + "1\t100\t100\tA\tT\tGENE3\t5\n"
+        )
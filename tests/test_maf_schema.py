@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.maf_schema` module."""
+
+import pathlib
+import tempfile
+import unittest
+
+import pandas as pd
+
+from genotype_variants.maf_schema import (
+    GENOTYPED_COLUMNS,
+    columnar_format,
+    read_maf,
+    write_maf,
+)
+
+HEADER = [
+    "Hugo_Symbol",
+    "Chromosome",
+    "Start_Position",
+    "End_Position",
+    "Reference_Allele",
+    "Tumor_Seq_Allele2",
+    "Tumor_Sample_Barcode",
+    "t_ref_count",
+    "t_alt_count",
+    "t_variant_frequency",
+]
+
+
+class TestReadMaf(unittest.TestCase):
+    """Tests for reading MAF files with explicit column types"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.maf = pathlib.Path(self.tmp.name) / "input.maf"
+        self.maf.write_text(
+            "#version 2.4\n"
+            + "\t".join(HEADER)
+            + "\n"
+            + "\t".join(["TP53", "17", "100", "100", "C", "T", "S1", "3", "1", "0.25"])
+            + "\n"
+            + "\t".join(["NA", "X", "200", "201", "-", "AG", "S1", "4", "0", "0"])
+            + "\n"
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_genotyped(self):
+        """GetBaseCountMultiSample output is read for the key and count columns"""
+        maf = read_maf(self.maf, GENOTYPED_COLUMNS, genotyped=True)
+        assert list(maf.columns) == HEADER[1:]
+        assert maf["Chromosome"].dtype == "category"
+        assert maf["Chromosome"].tolist() == ["17", "X"]
+        assert maf["Start_Position"].dtype == "int32"
+        assert maf["t_alt_count"].dtype == "int32"
+        assert maf["t_variant_frequency"].dtype == "float32"
+
+    def test_original(self):
+        """Count columns of other MAF files are parsed as pandas would"""
+        maf = read_maf(self.maf)
+        assert list(maf.columns) == HEADER
+        assert maf["t_alt_count"].dtype == "int64"
+        assert maf["Hugo_Symbol"].isna().tolist() == [False, True]
+        maf = read_maf(self.maf, text=True)
+        assert maf["Hugo_Symbol"].tolist() == ["TP53", "NA"]
+        assert maf["Start_Position"].tolist() == ["100", "200"]
+
+    def test_columnar_format(self):
+        """MAF text is not mistaken for a columnar file"""
+        assert columnar_format(self.maf) is None
+        assert columnar_format("-") is None
+
+    def test_columnar(self):
+        """Parquet and Feather files are read back with the schema types"""
+        maf = read_maf(self.maf, genotyped=True)
+        for output_format in ("parquet", "feather"):
+            output = pathlib.Path(self.tmp.name) / ("output." + output_format)
+            write_maf(maf, output, output_format)
+            assert columnar_format(output) == output_format
+            pd.testing.assert_frame_equal(read_maf(output, genotyped=True), maf)
+            columns = read_maf(output, GENOTYPED_COLUMNS, genotyped=True)
+            assert list(columns.columns) == HEADER[1:]
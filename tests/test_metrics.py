@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.metrics` module."""
+
+import pathlib
+import tempfile
+import unittest
+
+from genotype_variants import metrics
+
+
+class CmdResult:
+    def __init__(self, returncode, duration):
+        self.returncode = returncode
+        self.duration = duration
+        self.resource_usage = {"max_rss_kb": 1024}
+
+
+@metrics.count_sample
+def sample(code=0, nested=False):
+    if nested:
+        sample()
+    if code:
+        exit(code)
+    return "done"
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests for writing run metrics in the Prometheus text format"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.metrics_file = pathlib.Path(self.tmp.name) / "genotype_variants.prom"
+
+    def tearDown(self):
+        metrics.stop_metrics()
+        self.tmp.cleanup()
+
+    def read_samples(self):
+        samples = {}
+        for line in self.metrics_file.read_text().splitlines():
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_not_recording(self):
+        """Nothing is recorded or written without a metrics file"""
+        assert not metrics.is_recording()
+        assert sample() == "done"
+        metrics.inc_counter("genotype_variants_samples_processed_total")
+        assert metrics.take_metrics() is None
+        assert not self.metrics_file.exists()
+
+    def test_samples(self):
+        """Samples are counted once by status and the file is updated"""
+        metrics.start_metrics(self.metrics_file)
+        assert self.metrics_file.exists()
+        assert sample(nested=True) == "done"
+        samples = self.read_samples()
+        assert (
+            samples['genotype_variants_samples_processed_total{status="success"}'] == 1
+        )
+        with self.assertRaises(SystemExit):
+            sample(code=1)
+        samples = self.read_samples()
+        assert (
+            samples['genotype_variants_samples_processed_total{status="failed"}'] == 1
+        )
+        assert (
+            samples['genotype_variants_peak_rss_bytes{process="genotype_variants"}'] > 0
+        )
+
+    def test_gbcms_runs(self):
+        """GetBaseCountMultiSample runs fill the counters and histograms"""
+        metrics.start_metrics(self.metrics_file)
+        metrics.record_gbcms_runs(
+            {
+                "STANDARD": CmdResult(0, 2.5),
+                "DUPLEX-SIMPLEX": CmdResult(0, 20000),
+                "SIMPLEX-chr2": CmdResult(1, 0.5),
+            },
+            {
+                "STANDARD": ["STANDARD"],
+                "DUPLEX-SIMPLEX": ["DUPLEX", "SIMPLEX"],
+                "SIMPLEX-chr2": ["SIMPLEX"],
+            },
+            {"STANDARD": 10, "DUPLEX-SIMPLEX": 10, "SIMPLEX-chr2": 4},
+        )
+        samples = self.read_samples()
+        name = "genotype_variants_variants_genotyped_total"
+        assert samples[name + '{bam_type="STANDARD"}'] == 10
+        assert samples[name + '{bam_type="DUPLEX"}'] == 10
+        assert samples[name + '{bam_type="SIMPLEX"}'] == 10
+        assert (
+            samples['genotype_variants_gbcms_failures_total{bam_type="SIMPLEX"}'] == 1
+        )
+        name = "genotype_variants_gbcms_duration_seconds"
+        assert samples[name + '_bucket{bam_type="STANDARD",le="1.0"}'] == 0
+        assert samples[name + '_bucket{bam_type="STANDARD",le="5.0"}'] == 1
+        assert samples[name + '_bucket{bam_type="STANDARD",le="+Inf"}'] == 1
+        assert samples[name + '_bucket{bam_type="DUPLEX-SIMPLEX",le="14400.0"}'] == 0
+        assert samples[name + '_bucket{bam_type="DUPLEX-SIMPLEX",le="+Inf"}'] == 1
+        assert samples[name + '_sum{bam_type="DUPLEX-SIMPLEX"}'] == 20000
+        assert samples[name + '_count{bam_type="DUPLEX-SIMPLEX"}'] == 1
+        assert samples['genotype_variants_peak_rss_bytes{process="gbcms"}'] == 1024**2
+
+    def test_worker_metrics(self):
+        """Metrics taken in a worker are added to those of the caller"""
+        metrics.start_metrics(self.metrics_file)
+        metrics.observe("genotype_variants_merge_duration_seconds", 0.2)
+        worker = metrics.take_metrics()
+        metrics.observe("genotype_variants_merge_duration_seconds", 3)
+        metrics.add_metrics(worker)
+        samples = self.read_samples()
+        name = "genotype_variants_merge_duration_seconds"
+        assert samples[name + '_bucket{le="0.5"}'] == 1
+        assert samples[name + '_bucket{le="5.0"}'] == 2
+        assert samples[name + "_count"] == 2
+        assert samples[name + "_sum"] == 3.2
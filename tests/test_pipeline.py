@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.pipeline` module."""
+
+import pathlib
+import tempfile
+import unittest
+
+from genotype_variants.pipeline import run_pipelined_jobs
+from genotype_variants.run_gbcms import failed_jobs
+
+
+class TestPipeline(unittest.TestCase):
+    """Tests for reading GetBaseCountMultiSample outputs while they are written"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_run_pipelined_jobs(self):
+        """Outputs larger than a pipe are read while the jobs run, jobs that
+        fail before writing read as empty and kept outputs are written"""
+        outputs = {
+            label: self.dir / label for label in ("STANDARD", "DUPLEX", "SIMPLEX")
+        }
+        jobs = [
+            ("STANDARD", "seq 1 100000 > %s" % outputs["STANDARD"]),
+            ("DUPLEX", "sleep 0.2; seq 1 10 > %s" % outputs["DUPLEX"]),
+            ("SIMPLEX", "exit 3"),
+        ]
+        kept = {"STANDARD": self.dir / "STANDARD.maf"}
+
+        def consume(paths):
+            assert not paths["STANDARD"].is_relative_to(self.dir)
+            files = {label: open(path) for label, path in paths.items()}
+            lines = {label: 0 for label in files}
+            # read the outputs together, a line of each at a time
+            while files:
+                for label, f in list(files.items()):
+                    if f.readline():
+                        lines[label] += 1
+                    else:
+                        f.close()
+                        del files[label]
+            return lines
+
+        results, lines = run_pipelined_jobs(jobs, outputs, consume, kept)
+        assert lines == {"STANDARD": 100000, "DUPLEX": 10, "SIMPLEX": 0}
+        assert failed_jobs(results) == ["SIMPLEX"]
+        assert kept["STANDARD"].read_text().splitlines()[-1] == "100000"
+        assert not any(output.exists() for output in outputs.values())
+
+    def test_consume_fails(self):
+        """Jobs are stopped when the outputs are not read"""
+
+        def consume(paths):
+            raise ValueError("not read")
+
+        output = self.dir / "STANDARD"
+        with self.assertRaises(ValueError):
+            run_pipelined_jobs(
+                [("STANDARD", "seq 1 1000000 > %s; sleep 30" % output)],
+                {"STANDARD": output},
+                consume,
+                timeout=10,
+            )
+        assert not output.exists()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.profiling` module."""
+
+import pathlib
+import pstats
+import tempfile
+import unittest
+
+from genotype_variants import profiling
+
+
+class TestProfiling(unittest.TestCase):
+    """Tests for profiling a command and its stages"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.prefix = pathlib.Path(self.tmp.name) / "genotype_variants_1"
+
+    def tearDown(self):
+        profiling.stop_profile()
+        self.tmp.cleanup()
+
+    def test_no_profile(self):
+        """Stages record nothing when no profile runs"""
+        assert not profiling.is_profiling()
+        with profiling.stage("read") as read_stage:
+            pass
+        assert read_stage is profiling._NO_STAGE
+        assert profiling.stop_profile() is None
+
+    def test_stages(self):
+        """The summary has the time and peak memory of each stage"""
+        profiling.start_profile(self.prefix)
+        assert profiling.is_profiling()
+        for _ in range(2):
+            with profiling.stage("read"):
+                blocks = [bytearray(10**6) for _ in range(4)]
+                del blocks
+        with profiling.stage("write"):
+            with profiling.stage("format"):
+                block = bytearray(2 * 10**6)
+                del block
+        stats_file, summary_file = profiling.stop_profile()
+        assert not profiling.is_profiling()
+
+        pstats.Stats(stats_file)
+        with open(summary_file) as f:
+            rows = {
+                line.split()[0]: line.split()[1:]
+                for line in f
+                if line.split() and line.split()[0] in ("read", "write", "format")
+            }
+        assert rows["read"][0] == "2"
+        assert float(rows["read"][3]) >= 4.0
+        # the peak of a nested stage counts for the stage around it too
+        assert float(rows["format"][3]) >= 2.0
+        assert float(rows["write"][3]) >= float(rows["format"][3])
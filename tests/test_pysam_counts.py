@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.pysam_counts` module."""
+
+import os
+import pathlib
+import subprocess
+import tempfile
+import unittest
+
+import pandas as pd
+
+from genotype_variants.pysam_counts import count_maf, parse_variant, read_allele
+
+DATA = pathlib.Path(__file__).resolve().parent / "test_data" / "pysam_counts"
+BAM = DATA / "sample.bam"
+MAF = DATA / "variants.maf"
+COLUMNS = [
+    "t_ref_count",
+    "t_alt_count",
+    "t_total_count",
+    "t_total_count_forward",
+    "t_ref_count_forward",
+    "t_alt_count_forward",
+    "t_total_count_fragment",
+    "t_ref_count_fragment",
+    "t_alt_count_fragment",
+]
+
+REFERENCE = "ACGTTGCA" * 25
+
+
+class Read:
+    """Aligned read with the attributes of pysam.AlignedSegment used to
+    find the allele it supports"""
+
+    def __init__(self, reference_start, cigar, query_sequence):
+        self.query_sequence = query_sequence
+        self.pairs = []
+        q, r = 0, reference_start
+        for op, length in cigar:
+            for _ in range(length):
+                if op == "M":
+                    self.pairs.append((q, r))
+                    q, r = q + 1, r + 1
+                elif op in "IS":
+                    self.pairs.append((q, None))
+                    q += 1
+                elif op == "D":
+                    self.pairs.append((None, r))
+                    r += 1
+
+    def get_aligned_pairs(self):
+        return self.pairs
+
+
+class TestReadAllele(unittest.TestCase):
+    """Tests for finding the allele supported by a read"""
+
+    def test_substitution(self):
+        """Bases aligned on a substitution are compared to the alleles"""
+        variant = parse_variant("11", REFERENCE[10], "T")
+        read = Read(0, [("M", 20)], REFERENCE[:20])
+        assert read_allele(read, variant) == "ref"
+        read = Read(0, [("M", 20)], REFERENCE[:10] + "T" + REFERENCE[11:20])
+        assert read_allele(read, variant) == "alt"
+        read = Read(0, [("M", 10)], REFERENCE[:10])
+        assert read_allele(read, variant) is None
+
+    def test_deletion(self):
+        """A deletion needs the read aligned on both flanks"""
+        variant = parse_variant("11", REFERENCE[10:13], "-")
+        read = Read(
+            0, [("M", 10), ("D", 3), ("M", 10)], REFERENCE[:10] + REFERENCE[13:23]
+        )
+        assert read_allele(read, variant) == "alt"
+        read = Read(0, [("M", 30)], REFERENCE[:30])
+        assert read_allele(read, variant) == "ref"
+        read = Read(0, [("M", 12)], REFERENCE[:12])
+        assert read_allele(read, variant) is None
+
+    def test_generic_counting(self):
+        """Only generic counting compares the bases of a deletion window"""
+        variant = parse_variant("11", REFERENCE[10:13], "-")
+        read = Read(0, [("M", 30)], REFERENCE[:11] + "A" + REFERENCE[12:30])
+        assert read_allele(read, variant) == "ref"
+        assert read_allele(read, variant, generic_counting=True) == "other"
+
+    def test_insertion(self):
+        """The inserted sequence after Start_Position is compared to the alleles"""
+        variant = parse_variant("10", "-", "GG")
+        read = Read(
+            0,
+            [("M", 10), ("I", 2), ("M", 10)],
+            REFERENCE[:10] + "GG" + REFERENCE[10:20],
+        )
+        assert read_allele(read, variant) == "alt"
+        read = Read(0, [("M", 20)], REFERENCE[:20])
+        assert read_allele(read, variant) == "ref"
+        read = Read(
+            0, [("M", 10), ("I", 1), ("M", 10)], REFERENCE[:10] + "G" + REFERENCE[10:20]
+        )
+        assert read_allele(read, variant) == "other"
+
+
+class TestCountMaf(unittest.TestCase):
+    """Tests for counting a MAF file in the synthetic BAM file of test_data,
+    written by make_pysam_counts_data.py with the reads of each variant"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp.name)
+        self.output = self.dir / "output.maf"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_counts(self, output, expected):
+        pd.testing.assert_frame_equal(
+            pd.read_csv(output, sep="\t", dtype=str)[COLUMNS],
+            pd.read_csv(DATA / expected, sep="\t", dtype=str)[COLUMNS],
+        )
+
+    def test_counts(self):
+        """Duplicate, mapping quality and fragment settings are honoured"""
+        count_maf(MAF, [("S1", BAM)], self.output, True, True, 20, threads=2)
+        self.assert_counts(self.output, "expected_counts.maf")
+        counts = pd.read_csv(self.output, sep="\t", dtype=str).iloc[0]
+        assert counts["Tumor_Sample_Barcode"] == "S1"
+        count_maf(MAF, [("S1", BAM)], self.output, False, False, 0)
+        counts = pd.read_csv(self.output, sep="\t", dtype=str)
+        assert list(counts["t_alt_count"]) == ["5", "3", "3"]
+        assert "t_alt_count_fragment" not in counts.columns
+
+    def test_generic_counting(self):
+        """Indel reads have to carry an allele across the whole window"""
+        count_maf(
+            MAF, [("S1", BAM)], self.output, True, True, 20, generic_counting=True
+        )
+        self.assert_counts(self.output, "expected_generic_counts.maf")
+
+    @unittest.skipUnless(
+        os.environ.get("GBCMS_PATH"), "set GBCMS_PATH to compare with GBCMS"
+    )
+    def test_parity_with_gbcms(self):
+        """GetBaseCountMultiSample gives the expected counts of test_data"""
+        for generic_counting, expected in (
+            ("", "expected_counts.maf"),
+            ("--generic_counting", "expected_generic_counts.maf"),
+        ):
+            subprocess.run(
+                "%s --bam S1:%s --filter_duplicate 1 --fragment_count 1 --maf %s --maq 20 --omaf --output %s --fasta %s --thread 1 %s"
+                % (
+                    os.environ["GBCMS_PATH"],
+                    BAM,
+                    MAF,
+                    self.output,
+                    DATA / "reference.fa",
+                    generic_counting,
+                ),
+                shell=True,
+                check=True,
+            )
+            self.assert_counts(self.output, expected)
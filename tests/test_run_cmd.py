@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.run_cmd` module."""
+
+import _thread
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from genotype_variants.run_cmd import run_cmd
+
+
+class TestRunCmd(unittest.TestCase):
+    """Tests for running shell commands"""
+
+    def test_large_output(self):
+        """Output larger than a pipe buffer is drained while the command runs"""
+        result = run_cmd("seq 1 200000", tail_lines=2)
+        assert result.returncode == 0
+        assert result.output_tail == ["199999", "200000"]
+        assert not result.timed_out
+
+    def test_timeout(self):
+        """A command running past the timeout is stopped"""
+        start = time.perf_counter()
+        result = run_cmd("echo started; sleep 30", timeout=0.5)
+        assert time.perf_counter() - start < 10
+        assert result.timed_out
+        assert result.returncode != 0
+        assert result.output_tail == ["started"]
+
+    def test_cancel(self):
+        """A command is stopped when the cancel event is set"""
+        cancel_event = threading.Event()
+        threading.Timer(0.3, cancel_event.set).start()
+        result = run_cmd("sleep 30", cancel_event=cancel_event)
+        assert result.cancelled
+        assert result.returncode != 0
+
+    def test_resource_usage(self):
+        """Resource usage of the command is reported"""
+        result = run_cmd("seq 1 100000 > /dev/null")
+        assert result.returncode == 0
+        assert result.resource_usage["max_rss_kb"] > 0
+        assert result.resource_usage["user_cpu_seconds"] >= 0
+
+    def test_interrupt(self):
+        """The command is stopped when waiting for it is interrupted"""
+        with tempfile.TemporaryDirectory() as tmp:
+            pid_file = os.path.join(tmp, "pid")
+            threading.Timer(0.5, _thread.interrupt_main).start()
+            with self.assertRaises(KeyboardInterrupt):
+                run_cmd("sleep 30 & echo $! > %s; wait" % pid_file)
+            with open(pid_file) as f:
+                pid = int(f.read())
+        # the background sleep is killed with the process group of the command
+        time.sleep(0.2)
+        try:
+            with open("/proc/%s/stat" % pid) as f:
+                assert f.read().rsplit(")", 1)[1].split()[0] == "Z"
+        except FileNotFoundError:
+            pass
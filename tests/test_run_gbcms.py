@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.run_gbcms` module."""
+
+
+import time
+import unittest
+
+from genotype_variants.run_gbcms import failed_jobs, run_gbcms_jobs, split_threads
+
+
+class TestRunGBCMS(unittest.TestCase):
+    """Tests for scheduling GetBaseCountMultiSample runs"""
+
+    def test_split_threads(self):
+        """Thread budget is split without exceeding the total"""
+        assert split_threads(8, 3) == [3, 3, 2]
+        assert split_threads(3, 3) == [1, 1, 1]
+        assert split_threads(1, 3) == [1, 1, 1]
+        assert split_threads(4, 1) == [4]
+
+    def test_run_concurrently(self):
+        """Jobs run at the same time and failures are reported per label"""
+        jobs = [("STANDARD", "sleep 1"), ("DUPLEX", "sleep 1"), ("SIMPLEX", "false")]
+        start = time.perf_counter()
+        results = run_gbcms_jobs(jobs, concurrent=True)
+        assert time.perf_counter() - start < 1.9
+        assert list(results) == ["STANDARD", "DUPLEX", "SIMPLEX"]
+        assert failed_jobs(results) == ["SIMPLEX"]
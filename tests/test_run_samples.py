@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.run_samples` module."""
+
+import logging
+import os
+import pathlib
+import signal
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from genotype_variants.commands import small_variants
+from genotype_variants.commands.small_variants import add_log_file_handler
+from genotype_variants.run_samples import (
+    log_status_table,
+    logger,
+    run_samples,
+    write_status_table,
+)
+
+DATA = pathlib.Path(__file__).resolve().parent / "test_data"
+MERGE_BANNER = (
+    ">>> Running genotype_variants for small variants to merge MAF output <<<"
+)
+
+
+def merge_kwargs(sample_id, simplex_maf="C-100000-L002-d02-SIMPLEX_genotyped.maf"):
+    return dict(
+        patient_id=sample_id,
+        input_maf=None,
+        input_standard_maf=None,
+        input_duplex_maf=str(DATA / "C-100000-L002-d02-DUPLEX_genotyped.maf"),
+        input_simplex_maf=str(DATA / simplex_maf),
+        sample_id=sample_id,
+        tumor_name_override=False,
+    )
+
+
+class TestRunSamples(unittest.TestCase):
+    """Tests for running many samples and reporting their status"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp.name)
+        os.chdir(self.tmp.name)
+        self.handlers = list(logger.handlers)
+        self.level = logger.level
+        for handler in self.handlers:
+            logger.removeHandler(handler)
+
+    def tearDown(self):
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        for handler in self.handlers:
+            logger.addHandler(handler)
+        logger.setLevel(self.level)
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_run_samples(self):
+        """Each sample is logged to its own file only, in a worker or not"""
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                caller_log = self.dir / ("caller_%s.log" % jobs)
+                bad_maf = self.dir / "bad.maf"
+                bad_maf.write_text("Chromosome\n1\n")
+                fh = add_log_file_handler(caller_log)
+                results = run_samples(
+                    [
+                        ("S1", merge_kwargs("S1"), None),
+                        ("S2", merge_kwargs("S2", bad_maf), None),
+                        ("S3", None, "Maf file is not present"),
+                        ("S4", merge_kwargs("S4"), None),
+                    ],
+                    jobs,
+                    command="merge",
+                )
+                logger.removeHandler(fh)
+                fh.close()
+                assert [result["sample_id"] for result in results] == [
+                    "S1",
+                    "S2",
+                    "S3",
+                    "S4",
+                ]
+                assert [result["status"] for result in results] == [
+                    "success",
+                    "failed",
+                    "invalid",
+                    "success",
+                ]
+                assert results[1]["message"].endswith("genotype_variants_S2.log")
+                assert MERGE_BANNER not in caller_log.read_text()
+                for sample_id in ("S1", "S2", "S4"):
+                    log = self.dir / ("genotype_variants_%s.log" % sample_id)
+                    assert log.read_text().count(MERGE_BANNER) == jobs
+                assert sorted(path.name for path in self.dir.glob("*.log")) == sorted(
+                    ["caller_1.log", "caller_2.log"][:jobs]
+                    + ["genotype_variants_S1.log", "genotype_variants_S2.log"]
+                    + ["genotype_variants_S4.log"]
+                )
+                assert logger.handlers == []
+
+    def test_killed_worker(self):
+        """Samples of a worker that was killed fail without stopping the run"""
+
+        def merge(**kwargs):
+            if kwargs["sample_id"] == "S1":
+                os.kill(os.getpid(), signal.SIGKILL)
+            return kwargs["sample_id"] + ".maf"
+
+        with mock.patch.object(
+            small_variants, "merge", types.SimpleNamespace(callback=merge)
+        ):
+            results = run_samples(
+                [("S1", merge_kwargs("S1"), None), ("S2", merge_kwargs("S2"), None)],
+                2,
+                command="merge",
+            )
+        assert [result["sample_id"] for result in results] == ["S1", "S2"]
+        assert results[0]["status"] == "failed"
+        assert "BrokenProcessPool" in results[0]["message"]
+        assert results[1]["status"] in ("success", "failed")
+
+    def test_status_table(self):
+        """Status records are logged as a table and written as TSV"""
+        results = [
+            {
+                "sample_id": "S1",
+                "status": "success",
+                "elapsed_min": 0.5,
+                "output": "S1.maf",
+                "message": "",
+            },
+            {
+                "sample_id": "S22",
+                "status": "invalid",
+                "elapsed_min": 0,
+                "output": "",
+                "message": "Maf file is not present",
+            },
+        ]
+        with self.assertLogs(logger, logging.INFO) as logs:
+            log_status_table(results)
+        assert [record.getMessage().rstrip() for record in logs.records] == [
+            "sample_id  status   elapsed_min  output  message",
+            "S1         success  0.5          S1.maf",
+            "S22        invalid  0                    Maf file is not present",
+        ]
+        write_status_table(self.dir / "status.tsv", results)
+        assert (self.dir / "status.tsv").read_text().splitlines() == [
+            "sample_id\tstatus\telapsed_min\toutput\tmessage",
+            "S1\tsuccess\t0.5\tS1.maf\t",
+            "S22\tinvalid\t0\t\tMaf file is not present",
+        ]
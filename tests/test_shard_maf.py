@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.shard_maf` module."""
+
+import pathlib
+import tempfile
+import unittest
+
+from genotype_variants.shard_maf import concat_shard_mafs, shard_maf
+
+MAF = (
+    "#version 2.4\n"
+    "Hugo_Symbol\tChromosome\tStart_Position\n"
+    "A\t1\t100\n"
+    "B\t2\t200\n"
+    "C\t1\t300\n"
+    "D\tX\t400\n"
+    "E\t2\t500\n"
+)
+
+
+class TestShardMaf(unittest.TestCase):
+    """Tests for sharding a MAF file and putting the shards back together"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp.name)
+        self.maf = self.dir / "input.maf"
+        self.maf.write_text(MAF)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_shard_by_chromosome(self):
+        """Each chromosome gets a shard and the original order is restored"""
+        shards = shard_maf(self.maf, self.dir / "shards", "chromosome")
+        assert [label for label, _, _ in shards] == ["1", "2", "X"]
+        assert [rows for _, _, rows in shards] == [[0, 2], [1, 4], [3]]
+        assert shards[0][1].read_text().splitlines()[2:] == ["A\t1\t100", "C\t1\t300"]
+        output = self.dir / "output.maf"
+        assert concat_shard_mafs([(maf, rows) for _, maf, rows in shards], output) == 5
+        assert output.read_text() == MAF
+
+    def test_shard_by_chunks(self):
+        """Chunks are consecutive records of about the same size"""
+        shards = shard_maf(self.maf, self.dir / "shards", "chunks", 2)
+        assert [rows for _, _, rows in shards] == [[0, 1, 2], [3, 4]]
+        shards = shard_maf(self.maf, self.dir / "more_shards", "chunks", 10)
+        assert len(shards) == 5
+
+    def test_missing_records(self):
+        """A genotyped shard missing records is an error"""
+        shards = shard_maf(self.maf, self.dir / "shards", "chromosome")
+        shards[0][1].write_text(MAF.splitlines(True)[1] + "A\t1\t100\n")
+        with self.assertRaises(ValueError):
+            concat_shard_mafs(
+                [(maf, rows) for _, maf, rows in shards], self.dir / "output.maf"
+            )
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.stream_merge` module."""
+
+import pathlib
+import tempfile
+import unittest
+
+from genotype_variants.maf_schema import GENOTYPED_COLUMNS, read_maf
+from genotype_variants.stream_merge import merge_maf_dataframes, stream_merge
+
+TEST_DATA = pathlib.Path(__file__).parent / "test_data"
+DUPLEX_MAF = TEST_DATA / "C-100000-L002-d02-DUPLEX_genotyped.maf"
+SIMPLEX_MAF = TEST_DATA / "C-100000-L002-d02-SIMPLEX_genotyped.maf"
+
+
+class TestStreamMerge(unittest.TestCase):
+    """Tests for merging genotyped MAF files in batches"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_batches(self):
+        """Merging in batches gives the same records as merging whole files"""
+        ds_maf = self.dir / "simplex_duplex.maf"
+        merged_maf = self.dir / "merged.maf"
+        records = stream_merge(
+            None,
+            DUPLEX_MAF,
+            DUPLEX_MAF,
+            SIMPLEX_MAF,
+            simplex_duplex_maf=ds_maf,
+            merged_maf=merged_maf,
+            batch_size=3,
+        )
+        assert records == 10
+        expected_ds, expected_merged, label = merge_maf_dataframes(
+            None,
+            read_maf(DUPLEX_MAF, genotyped=True),
+            read_maf(DUPLEX_MAF, GENOTYPED_COLUMNS, genotyped=True),
+            read_maf(SIMPLEX_MAF, genotyped=True),
+        )
+        assert label == "STD-SIMPLEX-DUPLEX"
+        expected_ds.to_csv(self.dir / "expected_ds.maf", sep="\t", index=False)
+        assert ds_maf.read_text() == (self.dir / "expected_ds.maf").read_text()
+        expected_merged.to_csv(self.dir / "expected.maf", sep="\t", index=False)
+        assert merged_maf.read_text() == (self.dir / "expected.maf").read_text()
+
+    def test_order(self):
+        """Genotyped MAF files with the variants in another order are an error"""
+        lines = DUPLEX_MAF.read_text().splitlines(keepends=True)
+        reversed_maf = self.dir / "reversed.maf"
+        reversed_maf.write_text("".join(lines[:1] + lines[:0:-1]))
+        merged_maf = self.dir / "merged.maf"
+        with self.assertRaises(ValueError):
+            stream_merge(reversed_maf, DUPLEX_MAF, merged_maf=merged_maf)
+        assert not merged_maf.exists()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""Tests for `genotype_variants.variant_key` module."""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from genotype_variants.variant_key import (
+    align_on_mutation_key,
+    encode_mutation_keys,
+    insert_column,
+    join_on_mutation_key,
+    mutation_key_positions,
+    replace_barcodes,
+    take_positions,
+)
+
+
+def maf(*variants, **columns):
+    df = pd.DataFrame(
+        [(c, p, p, "A", t) for c, p, t in variants],
+        columns=[
+            "Chromosome",
+            "Start_Position",
+            "End_Position",
+            "Reference_Allele",
+            "Tumor_Seq_Allele2",
+        ],
+    )
+    for name, values in columns.items():
+        df[name] = values
+    return df
+
+
+class TestVariantKey(unittest.TestCase):
+    """Tests for joining data frames on the integer encoded mutation key"""
+
+    def test_encode(self):
+        """Equal keys get the same integer, in the order of the key tuples"""
+        left = maf(("2", 5, "T"), ("1", 9, "C"), ("1", 9, None))
+        right = maf(("1", 9, None), ("2", 5, "T"), ("10", 1, "G"))
+        key_left, none, key_right = encode_mutation_keys([left, None, right])
+        assert none is None
+        assert key_left[0] == key_right[1]
+        assert key_left[2] == key_right[0]
+        assert len(set(key_left) | set(key_right)) == 4
+        assert key_right[2] < key_left[0]
+        assert key_left.dtype == np.int64
+
+    def test_join(self):
+        """Rows keep the order and index of left, missing keys get NaN"""
+        left = maf(("2", 5, "T"), ("1", 9, "C"), ("3", 1, "G"))
+        left.index = [7, 8, 9]
+        right = maf(("1", 9, "C"), ("2", 5, "T"), count=[4, 2])
+        key_left, key_right = encode_mutation_keys([left, right])
+        joined, key = join_on_mutation_key(left, key_left, right, key_right, ["count"])
+        assert list(joined.index) == [7, 8, 9]
+        assert joined["count"].tolist()[:2] == [2.0, 4.0]
+        assert np.isnan(joined["count"].iloc[2])
+        assert (key == key_left).all()
+
+    def test_join_duplicate_right(self):
+        """Repeated keys on the right can not be joined"""
+        left = maf(("1", 9, "C"))
+        right = maf(("1", 9, "C"), ("1", 9, "C"), count=[1, 2])
+        key_left, key_right = encode_mutation_keys([left, right])
+        with self.assertRaises(ValueError):
+            join_on_mutation_key(left, key_left, right, key_right, ["count"])
+
+    def test_align(self):
+        """Rows of right are lined up with the keys of left"""
+        left = maf(("2", 5, "T"), ("1", 9, "C"), ("3", 1, "G"))
+        right = maf(("1", 9, "C"), ("2", 5, "T"), count=[4, 2])
+        key_left, key_right = encode_mutation_keys([left, right])
+        aligned = align_on_mutation_key(key_left, right[["count"]], key_right)
+        assert list(aligned.index) == [0, 1, 2]
+        assert aligned["count"].tolist()[:2] == [2.0, 4.0]
+        assert np.isnan(aligned["count"].iloc[2])
+
+    def test_take_positions(self):
+        """Columns are lined up one at a time as align_on_mutation_key does"""
+        left = maf(("2", 5, "T"), ("1", 9, "C"), ("3", 1, "G"))
+        right = maf(("1", 9, "C"), ("2", 5, "T"), count=[4, 2], flag=[True, False])
+        key_left, key_right = encode_mutation_keys([left, right])
+        positions = mutation_key_positions(key_left, key_right)
+        aligned = align_on_mutation_key(key_left, right[["count", "flag"]], key_right)
+        for column in ("count", "flag"):
+            values = take_positions(right[column].to_numpy(), positions)
+            pd.testing.assert_series_equal(
+                pd.Series(values, name=column), aligned[column]
+            )
+        positions = mutation_key_positions(key_left[:2], key_right)
+        assert take_positions(right["count"].to_numpy(), positions).dtype == np.int64
+
+    def test_insert_column(self):
+        """Columns are replaced where they are and added at the end"""
+        df = maf(("1", 9, "C"), ("2", 5, "T"), Tumor_Sample_Barcode=["S-A", "S-B"])
+        barcodes = replace_barcodes(df["Tumor_Sample_Barcode"], "S-", "-X")
+        insert_column(df, "Chromosome", np.array(["chr1", "chr2"], dtype=object))
+        insert_column(df, "Tumor_Sample_Barcode", barcodes)
+        assert df.columns[0] == "Chromosome"
+        assert df.columns[-1] == "Tumor_Sample_Barcode"
+        assert df["Chromosome"].tolist() == ["chr1", "chr2"]
+        assert df["Tumor_Sample_Barcode"].tolist() == ["A-X", "B-X"]